@@ -12,10 +12,6 @@ Based on django-chronograph.
 __author__      = "Raul Garreta (raul@tryolabs.com)"
 
 
-import sys
-import inspect
-import pkgutil
-import os.path
 from datetime import datetime
 
 from django import forms
@@ -25,7 +21,9 @@ from django.core.management import get_commands
 from django.core.urlresolvers import reverse, NoReverseMatch
 from django.db import models
 from django.forms.util import flatatt
-from django.http import HttpResponseRedirect, Http404
+from django.http import HttpResponse, HttpResponseRedirect, Http404
+from django.shortcuts import render_to_response
+from django.template import RequestContext
 from django.template.defaultfilters import linebreaks
 from django.utils import dateformat
 from django.utils.datastructures import MultiValueDict
@@ -34,12 +32,13 @@ from django.utils.safestring import mark_safe
 from django.utils.formats import get_format
 from django.utils.text import capfirst
 from django.utils.translation import ungettext, ugettext_lazy as _
-from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User, Group
 
-from kitsune.models import Job, Log, Host, NotificationUser, NotificationGroup
+from kitsune.models import Job, Log, Host, Pool, Node, Lease, NotificationUser, NotificationGroup, PROFILE_RUNS
 from kitsune.renderers import STATUS_OK, STATUS_WARNING, STATUS_CRITICAL, STATUS_UNKNOWN
-from kitsune.base import BaseKitsuneCheck
+from kitsune.utils import get_kitsune_checks
+from kitsune.planner import plan
+from kitsune.profiling import SORT_CHOICES, get_top_functions
 
 
 def get_class(kls):
@@ -116,23 +115,31 @@ class NotificationGroupInline(admin.TabularInline):
 
 class JobAdmin(admin.ModelAdmin):
     inlines = (NotificationUserInline, NotificationGroupInline)
-    actions = ['run_selected_jobs']
-    list_display = ('name', 'host', 'last_run_with_link', 'get_timeuntil',
+    actions = ['run_selected_jobs', 'profile_selected_jobs']
+    list_display = ('name', 'host', 'pool', 'last_run_with_link', 'get_timeuntil',
                     'get_frequency',  'is_running', 'run_button', 'view_logs_button', 'status_code', 'status_message')
     list_display_links = ('name', )
-    list_filter = ('host',)
+    list_filter = ('host', 'pool')
     fieldsets = (
         ('Job Details', {
             'classes': ('wide',),
-            'fields': ('name', 'host', 'command', 'args', 'disabled', 'renderer')
+            'fields': ('name', 'host', 'pool', 'command', 'args', 'disabled', 'renderer', 'depends_on')
         }),
         ('Scheduling options', {
             'classes': ('wide',),
-            'fields': ('frequency', 'next_run', 'params',)
+            'fields': ('frequency', 'next_run', 'params', 'stagger', 'timeout', 'missed_runs', 'result_cache_ttl',)
+        }),
+        ('Adaptive frequency', {
+            'classes': ('wide', 'collapse'),
+            'fields': ('adaptive', 'adaptive_min_interval', 'adaptive_max_interval', 'adaptive_threshold',)
         }),
         ('Log options', {
             'classes': ('wide',),
-            'fields': ('last_logs_to_keep',)
+            'fields': ('last_logs_to_keep', 'output_limit',)
+        }),
+        ('Profiling', {
+            'classes': ('wide', 'collapse'),
+            'fields': ('profile_runs',)
         }),
     )
     search_fields = ('name', )
@@ -227,10 +234,47 @@ class JobAdmin(admin.ModelAdmin):
             redirect = request.REQUEST.get('next', request.path + "../")
         return HttpResponseRedirect(redirect)
 
+    def plan_view(self, request):
+        """
+        Shows the projected runs per minute of every host over the next day.
+        """
+        stagger = 'stagger' in request.GET
+        hosts = []
+        plans = plan(Job.objects.select_related('host', 'pool'), stagger=stagger)
+        for name in sorted(plans):
+            host_plan = plans[name]
+            peak_second, peak_second_runs = host_plan.get_peak_second()
+            peak_minute, peak_minute_runs = host_plan.get_peak_minute()
+            rows = []
+            for hour, counts in host_plan.get_heatmap():
+                cells = []
+                for minute, count in enumerate(counts):
+                    heat = float(count) / peak_minute_runs if count else 0
+                    cells.append((minute, count, '%.2f' % heat))
+                rows.append((hour, cells))
+            hosts.append({
+                'name': name,
+                'peak_second': peak_second,
+                'peak_second_runs': peak_second_runs,
+                'peak_minute': peak_minute,
+                'peak_minute_runs': peak_minute_runs,
+                'rows': rows,
+            })
+        return render_to_response('admin/kitsune/job/plan.html', {
+            'title': _('Load plan'),
+            'hosts': hosts,
+            'stagger': stagger,
+        }, context_instance=RequestContext(request))
+
     def get_urls(self):
         urls = super(JobAdmin, self).get_urls()
         my_urls = patterns(
             '',
+            url(
+                r'^plan/$',
+                self.admin_site.admin_view(self.plan_view),
+                name="kitsune_job_plan"
+            ),
             url(
                 r'^(.+)/run/$',
                 self.admin_site.admin_view(self.run_job_view),
@@ -240,7 +284,8 @@ class JobAdmin(admin.ModelAdmin):
         return my_urls + urls
 
     def run_selected_jobs(self, request, queryset):
-        rows_updated = queryset.update(next_run=datetime.now())
+        now = datetime.now()
+        rows_updated = queryset.update(next_run=now, modified=now)
         if rows_updated == 1:
             message_bit = "1 job was"
         else:
@@ -248,6 +293,15 @@ class JobAdmin(admin.ModelAdmin):
         self.message_user(request, "%s successfully set to run." % message_bit)
     run_selected_jobs.short_description = "Run selected jobs"
 
+    def profile_selected_jobs(self, request, queryset):
+        rows_updated = queryset.update(profile_runs=PROFILE_RUNS)
+        if rows_updated == 1:
+            message_bit = "1 job"
+        else:
+            message_bit = "%s jobs" % rows_updated
+        self.message_user(request, "The next %d runs of %s will be profiled." % (PROFILE_RUNS, message_bit))
+    profile_selected_jobs.short_description = "Profile the next runs of selected jobs"
+
     def formfield_for_dbfield(self, db_field, **kwargs):
         request = kwargs.pop("request", None)
 
@@ -274,41 +328,8 @@ class JobAdmin(admin.ModelAdmin):
         return super(JobAdmin, self).formfield_for_dbfield(db_field, **kwargs)
 
 
-def get_kitsune_checks():
-
-    # Find the installed apps
-    try:
-        from django.conf import settings
-        apps = settings.INSTALLED_APPS
-    except (AttributeError, EnvironmentError, ImportError):
-        apps = []
-
-    paths = []
-    choices = []
-
-    for app in apps:
-        paths.append((app, app + '.management.commands'))
-
-    for app, package in paths:
-        try:
-            __import__(package)
-            m = sys.modules[package]
-            path = os.path.dirname(m.__file__)
-            for _, name, _ in pkgutil.iter_modules([path]):
-                pair = (name, app)
-                __import__(package + '.' + name)
-                m2 = sys.modules[package + '.' + name]
-                for _, obj in inspect.getmembers(m2):
-                    if inspect.isclass(obj) and issubclass(obj, BaseKitsuneCheck) and issubclass(obj, BaseCommand):
-                        if pair not in choices:
-                            choices.append(pair)
-        except:
-            pass
-    return choices
-
-
 class LogAdmin(admin.ModelAdmin):
-    list_display = ('job_name', 'run_date', 'job_success', 'output', 'errors',)
+    list_display = ('job_name', 'run_date', 'job_success', 'output', 'errors', 'duration',)
     search_fields = ('stdout', 'stderr', 'job__name', 'job__command')
     date_hierarchy = 'run_date'
     fieldsets = (
@@ -316,9 +337,14 @@ class LogAdmin(admin.ModelAdmin):
             'fields': ('job',)
         }),
         ('Output', {
-            'fields': ('stdout', 'stderr',)
+            'fields': ('status_line', 'stdout', 'stderr', 'perfdata', 'truncated',)
+        }),
+        ('Resources', {
+            'classes': ('collapse',),
+            'fields': ('duration', 'user_time', 'system_time', 'max_rss', 'queue_wait',)
         }),
     )
+    readonly_fields = ('truncated', 'duration', 'user_time', 'system_time', 'max_rss', 'queue_wait',)
 
     def job_name(self, obj):
         return obj.job.name
@@ -348,6 +374,61 @@ class LogAdmin(admin.ModelAdmin):
     def has_add_permission(self, request):
         return False
 
+    def get_profile(self, pk):
+        try:
+            log = Log.objects.select_related('job').get(pk=pk)
+        except (Log.DoesNotExist, ValueError):
+            raise Http404
+        profile = log.get_profile()
+        if profile is None:
+            raise Http404
+        return log, profile
+
+    def profile_view(self, request, pk):
+        """
+        Shows the functions the profiled run of a log spent the most time in.
+        """
+        log, profile = self.get_profile(pk)
+        sort = request.GET.get('sort', 'cumulative')
+        if sort not in dict(SORT_CHOICES):
+            sort = 'cumulative'
+        total_time, functions = get_top_functions(profile.get_data(), sort)
+        return render_to_response('admin/kitsune/log/profile.html', {
+            'title': _('Profile of %s') % log,
+            'log': log,
+            'total_time': total_time,
+            'functions': functions,
+            'sort': sort,
+            'sort_choices': SORT_CHOICES,
+        }, context_instance=RequestContext(request))
+
+    def download_profile_view(self, request, pk):
+        """
+        Returns the stats of the profiled run of a log, readable with
+        ``python -m pstats``.
+        """
+        log, profile = self.get_profile(pk)
+        response = HttpResponse(profile.get_data(), content_type='application/octet-stream')
+        response['Content-Disposition'] = 'attachment; filename=kitsune-log-%d.prof' % log.pk
+        return response
+
+    def get_urls(self):
+        urls = super(LogAdmin, self).get_urls()
+        my_urls = patterns(
+            '',
+            url(
+                r'^(.+)/profile/$',
+                self.admin_site.admin_view(self.profile_view),
+                name="kitsune_log_profile"
+            ),
+            url(
+                r'^(.+)/profile/download/$',
+                self.admin_site.admin_view(self.download_profile_view),
+                name="kitsune_log_profile_download"
+            )
+        )
+        return my_urls + urls
+
     def formfield_for_dbfield(self, db_field, **kwargs):
         request = kwargs.pop("request", None)
 
@@ -366,6 +447,27 @@ try:
 except admin.sites.AlreadyRegistered:
     pass
 
+class NodeInline(admin.TabularInline):
+    model = Node
+    fields = ('name', 'last_heartbeat', 'is_alive')
+    readonly_fields = ('name', 'last_heartbeat', 'is_alive')
+    extra = 0
+
+    def has_add_permission(self, request):
+        return False
+
+
+class PoolAdmin(admin.ModelAdmin):
+    inlines = (NodeInline,)
+    list_display = ('name', 'description')
+
+
+class LeaseAdmin(admin.ModelAdmin):
+    list_display = ('name', 'owner', 'expires', 'is_expired')
+
+
 admin.site.register(Log, LogAdmin)
 #admin.site.register(Log)
 admin.site.register(Host)
+admin.site.register(Pool, PoolAdmin)
+admin.site.register(Lease, LeaseAdmin)
@@ -15,6 +15,7 @@ import sys
 import traceback
 
 from django.core.management.base import BaseCommand
+from optparse import NO_DEFAULT
 
 
 # Exit status codes (also recognized by Nagios)
@@ -24,20 +25,120 @@ STATUS_CRITICAL = 2
 STATUS_UNKNOWN = 3
 
 
+class CheckResult(object):
+    """
+    The result of a run of a check: its status code, a message, performance
+    data in the Nagios format (eg: ``'load1=0.5;1;2'``) and the seconds it
+    took. A check whose message was already bounded to the output limit of
+    its run, eg: the output of a plugin, sets ``truncated`` to the number of
+    bytes it dropped so that it isn't truncated again.
+    """
+
+    def __init__(self, status_code=STATUS_OK, message='', perfdata='', duration=None,
+                 truncated=None):
+        self.status_code = status_code
+        self.message = message
+        self.perfdata = perfdata
+        self.duration = duration
+        self.truncated = truncated
+
+    def __repr__(self):
+        return '<CheckResult %s: %r>' % (self.status_code, self.message)
+
+
 class BaseKitsuneCheck(BaseCommand):
+    status_message = ''
+    perfdata = ''
     
     def check(self):
         self.status_code = STATUS_OK
+
+    def get_options(self, options):
+        """
+        Returns ``options`` along with the default value of the options
+        missing from it, as ``call_command`` passes them.
+        """
+        defaults = {}
+        for opt in self.option_list:
+            if opt.default is NO_DEFAULT:
+                defaults[opt.dest] = None
+            else:
+                defaults[opt.dest] = opt.default
+        defaults.update(options)
+        return defaults
+
+    def run_check(self, *args, **options):
+        """
+        Runs the check and returns its ``CheckResult``, without printing
+        anything. ``check`` can either return a ``CheckResult`` or set
+        ``status_code``, ``status_message`` and ``perfdata``.
+        """
+        # kitsune.utils imports this module.
+        from kitsune.utils import monotonic
+
+        defaults = self.get_options(options)
+        start = monotonic()
+        try:
+            result = self.check(*args, **defaults)
+            if not isinstance(result, CheckResult):
+                result = CheckResult(self.status_code, self.status_message, self.perfdata)
+        except Exception as e:
+            trace = 'Trace: ' + traceback.format_exc()
+            result = CheckResult(STATUS_UNKNOWN, '%s %s args: %s options: %s' % (
+                e, trace, args, defaults
+            ))
+        if result.duration is None:
+            result.duration = monotonic() - start
+        return result
             
     def handle(self, *args, **options):
+        # Kept for checks run as a command: the message goes to stdout and
+        # the status code to stderr.
+        result = self.run_check(*args, **options)
+        print result.message,
+        #note comma at the end to avoid printing a \n
+        print >> sys.stderr, result.status_code,
+
+
+class BaseKitsuneBatchCheck(BaseKitsuneCheck):
+    """
+    A check that evaluates many targets in a single invocation, eg: to
+    share a connection among them. The due jobs of a batch check with the
+    same schedule are run together, each one still gets its own log and
+    notifications.
+
+    Subclasses implement ``check_batch(self, targets)``, ``targets`` being
+    a list of ``(args, options)`` tuples, one per job, and return a list of
+    ``CheckResult``s in the same order.
+    """
+
+    def check_batch(self, targets):
+        raise NotImplementedError
+
+    def check(self, *args, **options):
+        return self.check_batch([(args, options)])[0]
+
+    def run_batch(self, targets):
+        """
+        Runs the check for every target in ``targets`` and returns their
+        ``CheckResult``s. Every target gets an unknown status if the check
+        fails.
+        """
+        from kitsune.utils import monotonic
+
+        targets = [(args, self.get_options(options)) for args, options in targets]
+        start = monotonic()
         try:
-            self.check(*args, **options)
-            #standard output to print status message
-            print self.status_message,
-            #standard error to print status code
-            #note comma at the end to avoid printing a \n
-            print >> sys.stderr, self.status_code,
+            results = list(self.check_batch(targets))
+            if len(results) != len(targets):
+                raise ValueError('%d results for %d targets' % (len(results), len(targets)))
         except Exception as e:
             trace = 'Trace: ' + traceback.format_exc()
-            print str(e), trace, 'args:', args, 'options:', options
-            print >> sys.stderr, STATUS_UNKNOWN,
\ No newline at end of file
+            results = [
+                CheckResult(STATUS_UNKNOWN, '%s %s' % (e, trace)) for target in targets
+            ]
+        duration = monotonic() - start
+        for result in results:
+            if result.duration is None:
+                result.duration = duration
+        return results
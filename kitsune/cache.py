@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -
+'''
+Created on Oct 18, 2026
+
+Shared cache of check results.
+Jobs running the same check with the same arguments on the same target
+can reuse a recent result instead of running the check again, or wait for
+the run of another job that is in flight. The cache must be shared by
+every process that runs jobs, eg: memcached or the database cache, not the
+local memory cache.
+
+'''
+
+import time
+import uuid
+import warnings
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.core.cache.backends.locmem import LocMemCache
+
+from kitsune.base import CheckResult
+from kitsune.utils import get_run_time_left
+
+
+# Alias of the Django cache holding the results.
+RESULT_CACHE = getattr(settings, 'KITSUNE_RESULT_CACHE', 'default')
+
+# Maximum seconds a run waits for an identical check in flight for another
+# job before running the check itself.
+RESULT_CACHE_WAIT = getattr(settings, 'KITSUNE_RESULT_CACHE_WAIT', 60)
+
+# Seconds between two looks for the result of a check in flight.
+POLL_INTERVAL = 0.5
+
+# Seconds the lock of a check in flight lasts for jobs without a timeout.
+# It is deleted as soon as the check ends, this only frees the lock of a
+# process that died.
+LOCK_TTL = 86400
+
+_cache = None
+
+
+def get_result_cache():
+    """
+    Returns the ``RESULT_CACHE``, warning once if it is a local memory
+    cache, which isn't shared by the processes that run jobs.
+    """
+    global _cache
+    if _cache is None:
+        _cache = get_cache(RESULT_CACHE)
+        if isinstance(_cache, LocMemCache):
+            warnings.warn(
+                "KITSUNE_RESULT_CACHE '%s' is a local memory cache, results "
+                "are only shared by the jobs run by the same process." % RESULT_CACHE,
+                RuntimeWarning
+            )
+    return _cache
+
+
+def get_result_key(command, args, options, target):
+    """
+    Returns the cache key of the result of ``command`` run with ``args``
+    and ``options`` on ``target``.
+    """
+    key = repr((command, tuple(args), sorted(options.items()), target))
+    return 'kitsune:result:%s' % md5(key).hexdigest()
+
+
+def get_or_run(key, ttl, run, wait=RESULT_CACHE_WAIT):
+    """
+    Returns the ``CheckResult`` stored under ``key`` if it is at most
+    ``ttl`` seconds old. Otherwise waits up to ``wait`` seconds for the
+    result of a run in flight, or calls ``run`` and stores its result.
+    """
+    cache = get_result_cache()
+    start = time.time()
+    lock_key = key + ':running'
+    token = uuid.uuid4().hex
+    left = get_run_time_left()
+    if left is not None:
+        wait = min(wait, left)
+
+    while True:
+        entry = cache.get(key)
+        if entry is not None and entry[0] >= time.time() - ttl:
+            stored, result = entry
+            return CheckResult(
+                result.status_code, result.message, result.perfdata,
+                time.time() - start, truncated=result.truncated
+            )
+        # The lock lasts as long as the run may, so that no other job runs
+        # the check again while it is in flight.
+        left = get_run_time_left()
+        locked = cache.add(lock_key, token, left is None and LOCK_TTL or int(left) + 1)
+        if locked or time.time() - start >= wait:
+            # Run the check, unless another run is in flight and there is
+            # time left to wait for it.
+            break
+        time.sleep(POLL_INTERVAL)
+
+    try:
+        result = run()
+        cache.set(key, (time.time(), result), ttl)
+    finally:
+        # Another run took the lock if this one outlived it.
+        if locked and cache.get(lock_key) == token:
+            cache.delete(lock_key)
+    return result
@@ -0,0 +1,660 @@
+# -*- coding: utf-8 -
+'''
+Created on Oct 18, 2026
+
+Job executors.
+An executor takes a due job and runs it, returning an object with the
+``poll()`` and ``wait()`` methods of ``subprocess.Popen``.
+
+'''
+
+import os
+import errno
+import logging
+import signal
+import select
+import subprocess
+import threading
+import multiprocessing
+from collections import deque
+from socket import gethostname
+from time import sleep
+from Queue import Queue
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where workers are only recycled by jobs run.
+    resource = None
+
+from django.conf import settings
+from django.core.management import get_commands, load_command_class
+from django.db import connection, transaction
+
+from kitsune.base import BaseKitsuneCheck, BaseKitsuneBatchCheck
+from kitsune.utils import (
+    get_manage_py, get_kitsune_checks, monotonic, wait_usage, set_run_in_thread
+)
+
+
+logger = logging.getLogger('kitsune')
+
+EXECUTOR_SUBPROCESS = 'subprocess'
+EXECUTOR_THREAD = 'thread'
+EXECUTOR_WORKER = 'worker'
+
+# How the dispatcher runs jobs, one of the executors above.
+EXECUTOR = getattr(settings, 'KITSUNE_EXECUTOR', EXECUTOR_SUBPROCESS)
+
+# Maximum number of checks run at once by the thread executor.
+THREAD_POOL_SIZE = getattr(settings, 'KITSUNE_THREAD_POOL_SIZE', 10)
+
+# Default number of processes of the worker executor, see
+# ``Host.worker_pool_size``.
+WORKER_POOL_SIZE = getattr(settings, 'KITSUNE_WORKER_POOL_SIZE', 4)
+
+# Workers are replaced after running this many jobs...
+WORKER_MAX_JOBS = getattr(settings, 'KITSUNE_WORKER_MAX_JOBS', 100)
+
+# ... or once their maximum resident set size exceeds this many kilobytes.
+WORKER_MAX_RSS = getattr(settings, 'KITSUNE_WORKER_MAX_RSS', 200 * 1024)
+
+# Default maximum number of checks run at the same time on a host, see
+# ``Host.max_concurrent_checks``. None means no limit.
+MAX_CONCURRENT_CHECKS = getattr(settings, 'KITSUNE_MAX_CONCURRENT_CHECKS', None)
+
+# Seconds between two polls of running jobs while waiting for a free slot.
+POLL_INTERVAL = 0.1
+
+# Seconds given to a job past its timeout to record the result of the
+# plugins it killed before the executor kills the job itself.
+KILL_GRACE = 5
+
+
+_command_classes = {}
+
+
+def is_kitsune_check(command):
+    """
+    Returns True if ``command`` is a ``BaseKitsuneCheck`` management command.
+    """
+    if command not in _command_classes:
+        try:
+            app_name = get_commands()[command]
+            if isinstance(app_name, BaseKitsuneCheck):
+                klass = app_name.__class__
+            else:
+                klass = load_command_class(app_name, command).__class__
+        except Exception:
+            klass = None
+        _command_classes[command] = klass
+    klass = _command_classes[command]
+    return klass is not None and issubclass(klass, BaseKitsuneCheck)
+
+
+def is_kitsune_batch_check(command):
+    """
+    Returns True if ``command`` is a ``BaseKitsuneBatchCheck`` management
+    command.
+    """
+    return is_kitsune_check(command) and \
+        issubclass(_command_classes[command], BaseKitsuneBatchCheck)
+
+
+def get_job_pks(job):
+    """
+    Returns the pks of the jobs run by ``job``, a ``Job`` or a ``JobBatch``.
+    """
+    return getattr(job, 'pks', None) or [job.pk]
+
+
+def get_kitsune_check(command):
+    """
+    Returns a new instance of the ``BaseKitsuneCheck`` management command
+    ``command``, or None if it is any other command.
+    """
+    if not is_kitsune_check(command):
+        return None
+    return _command_classes[command]()
+
+
+def release_failed_runs(pks):
+    """
+    Clears the running flag of the jobs ``pks`` whose run failed in this
+    process. Threads and workers outlive the run, so the jobs wouldn't be
+    released as stale.
+    """
+    from kitsune.models import Job
+
+    try:
+        transaction.rollback_unless_managed()
+        Job.objects.release(list(
+            Job.objects.filter(pk__in=pks, is_running=True).values_list('pk', 'pid')
+        ))
+    except Exception:
+        logger.exception('Could not release jobs %s', pks)
+
+
+def release_claims(job):
+    """
+    Clears the running flag of the jobs run by ``job``, a ``Job`` or a
+    ``JobBatch``, that are still claimed once their run ended. The process
+    meant to run them died before storing a result, e.g. on start up, and
+    they would otherwise stay running under the pid of the live dispatcher.
+    """
+    from kitsune.models import Job
+
+    try:
+        Job.objects.release_claims(getattr(job, 'jobs', None) or [job])
+    except Exception:
+        logger.exception('Could not release jobs %s', get_job_pks(job))
+
+
+def get_deadline(job, started):
+    """
+    Returns the time, on the ``monotonic`` clock, at which ``job`` started
+    at ``started`` is killed, or None if it has no timeout.
+    """
+    timeout = job.get_timeout()
+    if timeout is None:
+        return None
+    return started + timeout + KILL_GRACE
+
+
+class SubprocessTask(object):
+    """
+    A job run by a ``SubprocessExecutor``. The ``kitsune_run_job`` process
+    runs in its own process group, which is killed when the job times out.
+    """
+
+    def __init__(self, job, process, queue_wait=None):
+        self.job = job
+        self.process = process
+        self.queue_wait = queue_wait
+        self.started = monotonic()
+        self.deadline = get_deadline(job, self.started)
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None:
+            returncode = self.process.poll()
+            if returncode is not None:
+                self.finish(returncode)
+            elif self.deadline is not None and monotonic() >= self.deadline:
+                self.kill()
+        return self.returncode
+
+    def wait(self):
+        if self.deadline is None and self.returncode is None:
+            self.finish(self.process.wait())
+        while self.poll() is None:
+            sleep(POLL_INTERVAL)
+        return self.returncode
+
+    def finish(self, returncode):
+        self.returncode = returncode
+        release_claims(self.job)
+
+    def kill(self):
+        usage = None
+        try:
+            if os.name == 'posix':
+                os.killpg(self.process.pid, signal.SIGKILL)
+            else:
+                self.process.kill()
+        except OSError, e:
+            if e.errno != errno.ESRCH:
+                raise
+        if os.name == 'posix':
+            # The killed run can't record what it used, its parent can.
+            usage = wait_usage(self.process)
+            self.returncode = self.process.returncode
+        else:
+            self.returncode = self.process.wait()
+        self.job.handle_timeout(monotonic() - self.started, self.queue_wait, usage)
+
+
+class SubprocessExecutor(object):
+    """
+    Runs every job in a new ``kitsune_run_job`` process.
+    """
+
+    def submit(self, job, queue_wait=None):
+        cmd = ['python', get_manage_py(), 'kitsune_run_job']
+        cmd.extend([str(pk) for pk in get_job_pks(job)])
+        if queue_wait is not None:
+            cmd.append('--queue-wait=%f' % queue_wait)
+        if os.name == 'posix':
+            process = subprocess.Popen(cmd, preexec_fn=os.setsid)
+        else:
+            process = subprocess.Popen(cmd)
+        return SubprocessTask(job, process, queue_wait)
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class ThreadTask(object):
+    """
+    A job queued in a ``ThreadPoolExecutor``.
+    """
+
+    def __init__(self, job, queue_wait=None):
+        self.job = job
+        self.queue_wait = queue_wait
+        self.returncode = None
+        self._finished = threading.Event()
+
+    def run(self):
+        from kitsune.models import run_jobs
+
+        # Other threads run jobs too, the children they reap aren't ours.
+        set_run_in_thread(True)
+        try:
+            # Dispatchers only load a few columns, get the whole rows as
+            # ``kitsune_run_job`` does.
+            run_jobs(get_job_pks(self.job), self.queue_wait)
+            self.returncode = 0
+        except BaseException:
+            # call_command exits on CommandError, keep the thread alive.
+            pks = get_job_pks(self.job)
+            logger.exception('Run of jobs %s failed', pks)
+            release_failed_runs(pks)
+            self.returncode = 1
+        finally:
+            release_claims(self.job)
+            self._finished.set()
+
+    def poll(self):
+        return self.returncode if self._finished.isSet() else None
+
+    def wait(self):
+        self._finished.wait()
+        return self.returncode
+
+
+class ThreadPoolExecutor(object):
+    """
+    Runs ``BaseKitsuneCheck`` commands in a bounded pool of threads of the
+    current process, saving the start up of a new interpreter per check.
+    Any other command is run in a subprocess.
+
+    Threads can't be killed, checks that time out here are only stopped
+    if they bound what they run with ``kitsune.utils.get_run_time_left``,
+    as ``kitsune_nagios_check`` does.
+    """
+
+    def __init__(self, max_workers=THREAD_POOL_SIZE):
+        self.max_workers = max_workers
+        self._queue = Queue()
+        self._threads = []
+        self._fallback = SubprocessExecutor()
+
+    def submit(self, job, queue_wait=None):
+        if not is_kitsune_check(job.command):
+            return self._fallback.submit(job, queue_wait)
+        task = ThreadTask(job, queue_wait)
+        self._queue.put(task)
+        if len(self._threads) < self.max_workers:
+            t = threading.Thread(target=self._work)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+        return task
+
+    def _work(self):
+        try:
+            while True:
+                task = self._queue.get()
+                if task is None:
+                    break
+                task.run()
+        finally:
+            # Every thread has its own database connection.
+            connection.close()
+
+    def shutdown(self, wait=True):
+        for t in self._threads:
+            self._queue.put(None)
+        if wait:
+            for t in self._threads:
+                t.join()
+        self._threads = []
+
+
+def _worker_main(conn, max_jobs, max_rss):
+    """
+    Main loop of a worker process. Receives ``(pks, queue_wait)`` tuples and
+    answers every one with ``(returncode, recycle)``, exiting when it has to
+    be recycled.
+    """
+    from kitsune.models import run_jobs
+
+    if os.name == 'posix':
+        # Lead a process group, killed as a whole when a job times out.
+        os.setsid()
+    done = 0
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        pks, queue_wait = message
+        returncode = 0
+        try:
+            run_jobs(pks, queue_wait)
+        except BaseException:
+            logger.exception('Run of jobs %s failed', pks)
+            release_failed_runs(pks)
+            returncode = 1
+        done += 1
+        recycle = done >= max_jobs
+        if resource is not None:
+            recycle = recycle or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss > max_rss
+        conn.send((returncode, recycle))
+        if recycle:
+            break
+    connection.close()
+
+
+class Worker(object):
+    """
+    A worker process of a ``WorkerPoolExecutor``, connected through a pipe.
+    """
+
+    def __init__(self, max_jobs, max_rss):
+        # A forked process must not share the database connection.
+        connection.close()
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker_main, args=(child_conn, max_jobs, max_rss)
+        )
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.task = None
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (IOError, OSError):
+            pass
+        self.conn.close()
+
+    def kill(self):
+        try:
+            if os.name == 'posix':
+                os.killpg(self.process.pid, signal.SIGKILL)
+            else:
+                os.kill(self.process.pid, signal.SIGKILL)
+        except OSError, e:
+            if e.errno != errno.ESRCH:
+                raise
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerTask(object):
+    """
+    A job queued in a ``WorkerPoolExecutor``.
+    """
+
+    def __init__(self, executor, job, queue_wait=None):
+        self.executor = executor
+        self.job = job
+        self.queue_wait = queue_wait
+        self.returncode = None
+        self.started = None
+        self.deadline = None
+
+    def poll(self):
+        if self.returncode is None:
+            self.executor.pump(0)
+        return self.returncode
+
+    def wait(self):
+        while self.returncode is None:
+            self.executor.pump(None)
+        return self.returncode
+
+
+class WorkerPoolExecutor(object):
+    """
+    Runs jobs in a pool of long-lived worker processes, forked once Django,
+    the kitsune models and every check module have been imported. Jobs stay
+    isolated in their own process like with ``kitsune_run_job``, without
+    paying for a new interpreter and the Django start up on every run.
+    """
+
+    def __init__(self, size=None, max_jobs=WORKER_MAX_JOBS,
+                 max_rss=WORKER_MAX_RSS):
+        self.size = size or get_worker_pool_size()
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self._idle = []
+        self._busy = []
+        self._pending = deque()
+        # Load every check before forking so that workers inherit them.
+        get_kitsune_checks()
+
+    def submit(self, job, queue_wait=None):
+        task = WorkerTask(self, job, queue_wait)
+        self._pending.append(task)
+        self._dispatch()
+        return task
+
+    def _dispatch(self):
+        while self._pending:
+            if self._idle:
+                worker = self._idle.pop()
+            elif len(self._idle) + len(self._busy) < self.size:
+                worker = Worker(self.max_jobs, self.max_rss)
+            else:
+                break
+            task = self._pending.popleft()
+            try:
+                worker.conn.send((get_job_pks(task.job), task.queue_wait))
+            except (IOError, OSError):
+                # The worker died while idle, retry with a new one.
+                self._pending.appendleft(task)
+                worker.conn.close()
+                continue
+            task.started = monotonic()
+            task.deadline = get_deadline(task.job, task.started)
+            worker.task = task
+            self._busy.append(worker)
+
+    def pump(self, timeout):
+        """
+        Collects the results of finished jobs, waiting at most ``timeout``
+        seconds (forever if None) for one, kills the jobs that timed out and
+        hands pending jobs to the workers that became available.
+        """
+        if self._busy:
+            deadlines = [
+                w.task.deadline for w in self._busy if w.task.deadline is not None
+            ]
+            if deadlines:
+                left = max(min(deadlines) - monotonic(), 0)
+                if timeout is None or left < timeout:
+                    timeout = left
+            ready = select.select(self._busy, [], [], timeout)[0]
+            for worker in ready:
+                self._busy.remove(worker)
+                task, worker.task = worker.task, None
+                try:
+                    task.returncode, recycle = worker.conn.recv()
+                except (EOFError, IOError):
+                    # The worker crashed in the middle of the job.
+                    task.returncode, recycle = 1, True
+                release_claims(task.job)
+                if recycle:
+                    worker.stop()
+                    worker.process.join()
+                else:
+                    self._idle.append(worker)
+            now = monotonic()
+            for worker in list(self._busy):
+                task = worker.task
+                if task.deadline is not None and now >= task.deadline:
+                    self._busy.remove(worker)
+                    worker.kill()
+                    task.returncode = -signal.SIGKILL
+                    task.job.handle_timeout(now - task.started, task.queue_wait)
+        self._dispatch()
+
+    def shutdown(self, wait=True):
+        if wait:
+            while self._busy or self._pending:
+                self.pump(None)
+        for worker in self._idle + self._busy:
+            worker.stop()
+            if wait:
+                worker.process.join()
+        self._idle = []
+        self._busy = []
+
+
+class QueuedTask(object):
+    """
+    A job waiting in a ``LimitedExecutor`` for a free slot.
+    """
+
+    def __init__(self, executor, job):
+        self.executor = executor
+        self.job = job
+        self.queued_at = monotonic()
+        self.queue_wait = None
+        self.task = None
+
+    def poll(self):
+        if self.task is None:
+            # Every queued job is polled in turn, the queue is pumped for
+            # all of them at most once per poll interval.
+            self.executor.pump(throttle=True)
+            if self.task is None:
+                return None
+        return self.task.poll()
+
+    def wait(self):
+        # Keep pumping so that queued jobs start as slots free up.
+        while self.poll() is None:
+            sleep(POLL_INTERVAL)
+        return self.task.returncode
+
+
+class LimitedExecutor(object):
+    """
+    Wraps an executor so that at most ``limit`` jobs run at the same time on
+    the node ``hostname``, the local host by default, counting the jobs
+    started by every dispatcher of the node (see ``JobManager.take_slots``).
+    Jobs beyond the limit wait in a FIFO queue and start as running jobs
+    finish, the time each one waited is recorded in its ``Log``.
+    """
+
+    def __init__(self, executor, limit, hostname=None):
+        self.executor = executor
+        self.limit = limit
+        self.hostname = hostname or gethostname()
+        self._queue = deque()
+        self._running = []
+        self._full_at = None
+        self._pumped_at = None
+
+    def submit(self, job, queue_wait=None):
+        task = QueuedTask(self, job)
+        self._queue.append(task)
+        self.pump()
+        return task
+
+    def pump(self, throttle=False):
+        """
+        Starts the queued jobs that fit in the free slots. With ``throttle``
+        nothing is done if the queue was pumped less than a poll interval
+        ago.
+        """
+        from kitsune.models import Job
+
+        now = monotonic()
+        if throttle and self._pumped_at is not None and now - self._pumped_at < POLL_INTERVAL:
+            return
+        self._pumped_at = now
+        self._running = [t for t in self._running if t.task.poll() is None]
+        if not self._queue or len(self._running) >= self.limit:
+            return
+        # Once the node is full, slots freed by other dispatchers are looked
+        # for at most once per poll interval.
+        if self._full_at is not None and monotonic() - self._full_at < POLL_INTERVAL:
+            return
+        queued = list(self._queue)[:self.limit - len(self._running)]
+        taken = Job.objects.take_slots(
+            self.hostname, [get_job_pks(q.job) for q in queued], self.limit
+        )
+        self._full_at = taken < len(queued) and monotonic() or None
+        for i in range(taken):
+            queued = self._queue.popleft()
+            queued.queue_wait = monotonic() - queued.queued_at
+            queued.task = self.executor.submit(queued.job, queued.queue_wait)
+            self._running.append(queued)
+
+    def shutdown(self, wait=True):
+        if wait:
+            for queued in list(self._queue) + self._running:
+                queued.wait()
+        self.executor.shutdown(wait)
+
+
+def get_host_setting(field, default, hostname=None):
+    """
+    Returns the value of ``field`` for ``hostname``, the local host by
+    default, or ``default`` if it is not set.
+    """
+    from kitsune.models import Host
+
+    values = Host.objects.filter(
+        name=hostname or gethostname(), **{field + '__isnull': False}
+    ).values_list(field, flat=True)
+    for value in values:
+        if value:
+            return value
+    return default
+
+
+def get_worker_pool_size(hostname=None):
+    """
+    Returns the size of the worker pool for ``hostname``, the local host by
+    default.
+    """
+    return get_host_setting('worker_pool_size', WORKER_POOL_SIZE, hostname)
+
+
+def get_max_concurrent_checks(hostname=None):
+    """
+    Returns the maximum number of checks run at the same time on
+    ``hostname``, the local host by default.
+    """
+    return get_host_setting(
+        'max_concurrent_checks', MAX_CONCURRENT_CHECKS, hostname
+    )
+
+
+def get_executor(name=None):
+    """
+    Returns a new executor of the kind configured by ``KITSUNE_EXECUTOR``,
+    limited to the maximum number of concurrent checks of the local host.
+    """
+    name = name or EXECUTOR
+    if name == EXECUTOR_THREAD:
+        executor = ThreadPoolExecutor()
+    elif name == EXECUTOR_WORKER:
+        executor = WorkerPoolExecutor()
+    else:
+        executor = SubprocessExecutor()
+    limit = get_max_concurrent_checks()
+    if limit:
+        executor = LimitedExecutor(executor, limit)
+    return executor
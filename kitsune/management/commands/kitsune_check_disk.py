@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -
+'''
+Created on Oct 18, 2026
+
+Native version of the Nagios check_disk plugin.
+Checks the free space of the filesystem of a path with os.statvfs.
+eg:
+p=/var w=20% c=10%
+
+'''
+
+import os
+from optparse import make_option
+
+from kitsune.base import BaseKitsuneCheck, CheckResult
+from kitsune.native import (
+    STATUS_NAMES, UNITS, get_options, parse_free_threshold, get_free_status,
+    get_free_limit, format_perfdata
+)
+
+
+class Command(BaseKitsuneCheck):
+    help = 'Checks the free space of a filesystem, like the check_disk Nagios plugin.'
+    option_list = BaseKitsuneCheck.option_list + (
+        make_option('-p', '--path', dest='p', default='/',
+            help='A path of the filesystem to check (default: /).'),
+        make_option('-w', '--warning', dest='w', default=None,
+            help='Warn when less than this percentage (eg: 20%) or amount of units is free.'),
+        make_option('-c', '--critical', dest='c', default=None,
+            help='Critical when less than this percentage (eg: 10%) or amount of units is free.'),
+        make_option('-u', '--units', dest='u', default='MB',
+            help='Units of the amounts: kB, MB, GB or TB (default: MB).'),
+    )
+
+    def check(self, *args, **options):
+        options = get_options(options)
+        path, unit = options['p'], options['u']
+        warning = parse_free_threshold(options['w'], unit)
+        critical = parse_free_threshold(options['c'], unit)
+
+        st = os.statvfs(path)
+        total = st.f_blocks * st.f_frsize
+        # Like df, the blocks reserved to root are neither free nor used.
+        free = st.f_bavail * st.f_frsize
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        available = used + free
+        free_percent = available and free * 100.0 / available or 0
+        inode_percent = st.f_files and st.f_favail * 100.0 / st.f_files or 100
+
+        status = get_free_status(free, available, warning, critical)
+        size = UNITS[unit]
+        message = 'DISK %s - free space: %s %d %s (%d%% inode=%d%%);' % (
+            STATUS_NAMES[status], path, free / size, unit, free_percent, inode_percent
+        )
+        perfdata = format_perfdata(
+            path, used / size, unit,
+            self.get_used_limit(warning, available, size),
+            self.get_used_limit(critical, available, size),
+            0, total / size
+        )
+        return CheckResult(status, message, perfdata)
+
+    def get_used_limit(self, threshold, available, size):
+        # The performance data of check_disk is about used space.
+        if threshold is None:
+            return None
+        return max(int(available - get_free_limit(threshold, available)), 0) / size
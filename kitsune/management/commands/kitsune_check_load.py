@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -
+'''
+Created on Oct 18, 2026
+
+Native version of the Nagios check_load plugin.
+Checks the 1, 5 and 15 minutes load averages read from /proc/loadavg.
+eg:
+w=15,10,5 c=30,25,20
+
+'''
+
+import os
+from optparse import make_option
+
+from kitsune.base import (
+    BaseKitsuneCheck, CheckResult, STATUS_OK, STATUS_WARNING, STATUS_CRITICAL
+)
+from kitsune.native import STATUS_NAMES, get_options, format_perfdata
+
+
+def get_loadavg():
+    try:
+        return [float(value) for value in open('/proc/loadavg').read().split()[:3]]
+    except IOError:
+        return list(os.getloadavg())
+
+
+def get_cpu_count():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
+
+
+def parse_loads(spec):
+    """
+    Returns the three limits of ``spec``, eg: ``'15,10,5'``, a single value
+    being used for the three load averages.
+    """
+    if spec is None or spec == '':
+        return [None, None, None]
+    values = [float(value) for value in str(spec).split(',')]
+    if len(values) == 1:
+        values = values * 3
+    return values
+
+
+class Command(BaseKitsuneCheck):
+    help = 'Checks the load averages, like the check_load Nagios plugin.'
+    option_list = BaseKitsuneCheck.option_list + (
+        make_option('-w', '--warning', dest='w', default=None,
+            help='Warn when a load average is above these values, eg: 15,10,5.'),
+        make_option('-c', '--critical', dest='c', default=None,
+            help='Critical when a load average is above these values, eg: 30,25,20.'),
+        make_option('-r', '--percpu', dest='r', default=None,
+            help='Divide the load averages by the number of CPUs if set.'),
+    )
+
+    def check(self, *args, **options):
+        options = get_options(options)
+        warning = parse_loads(options['w'])
+        critical = parse_loads(options['c'])
+        loads = get_loadavg()
+        if options['r']:
+            cpus = get_cpu_count()
+            loads = [load / cpus for load in loads]
+
+        status = STATUS_OK
+        for load, warn, crit in zip(loads, warning, critical):
+            if crit is not None and load > crit:
+                status = STATUS_CRITICAL
+            elif warn is not None and load > warn and status == STATUS_OK:
+                status = STATUS_WARNING
+
+        message = '%s - load average: %s' % (
+            STATUS_NAMES[status], ', '.join(['%.2f' % load for load in loads])
+        )
+        perfdata = ' '.join([
+            format_perfdata(label, load, '', warn, crit, 0)
+            for label, load, warn, crit
+            in zip(('load1', 'load5', 'load15'), loads, warning, critical)
+        ])
+        return CheckResult(status, message, perfdata)
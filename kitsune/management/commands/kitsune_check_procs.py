@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -
+'''
+Created on Oct 18, 2026
+
+Native version of the Nagios check_procs plugin.
+Counts the processes matching some filters, reading /proc/[pid]/stat.
+eg:
+C=nginx w=1:10 c=1:20
+
+'''
+
+import os
+import pwd
+from optparse import make_option
+
+from kitsune.base import BaseKitsuneCheck, CheckResult
+from kitsune.native import (
+    STATUS_NAMES, get_options, get_threshold, get_status, format_perfdata
+)
+
+
+def get_processes():
+    """
+    Yields a tuple of the pid, command name, state and owner uid of every
+    process.
+    """
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            stat = open('/proc/%s/stat' % name).read()
+            uid = os.stat('/proc/%s' % name).st_uid
+        except (IOError, OSError):
+            # The process is gone.
+            continue
+        # The command name is in parentheses and may contain any character.
+        start, end = stat.index('('), stat.rindex(')')
+        yield int(name), stat[start + 1:end], stat[end + 2:end + 3], uid
+
+
+def get_cmdline(pid):
+    try:
+        return open('/proc/%d/cmdline' % pid).read().replace('\0', ' ').strip()
+    except (IOError, OSError):
+        return ''
+
+
+class Command(BaseKitsuneCheck):
+    help = 'Counts the processes matching some filters, like the check_procs Nagios plugin.'
+    option_list = BaseKitsuneCheck.option_list + (
+        make_option('-w', '--warning', dest='w', default=None,
+            help='Warn when the number of processes is outside of this range, eg: 1:10.'),
+        make_option('-c', '--critical', dest='c', default=None,
+            help='Critical when the number of processes is outside of this range, eg: 1:20.'),
+        make_option('-C', '--command', dest='C', default=None,
+            help='Only count the processes with this command name.'),
+        make_option('-a', '--argument-array', dest='a', default=None,
+            help='Only count the processes whose command line contains this string.'),
+        make_option('-s', '--state', dest='s', default=None,
+            help='Only count the processes in any of these states, eg: Z or RSD.'),
+        make_option('-u', '--user', dest='u', default=None,
+            help='Only count the processes of this user name or id.'),
+    )
+
+    def check(self, *args, **options):
+        options = get_options(options)
+        warning = get_threshold(options['w'])
+        critical = get_threshold(options['c'])
+        uid = options['u']
+        if uid is not None and not str(uid).isdigit():
+            uid = pwd.getpwnam(uid).pw_uid
+
+        count = 0
+        me = os.getpid()
+        for pid, command, state, owner in get_processes():
+            if pid == me:
+                continue
+            if options['C'] is not None and command != options['C']:
+                continue
+            if options['s'] is not None and state not in options['s']:
+                continue
+            if uid is not None and owner != int(uid):
+                continue
+            if options['a'] is not None and options['a'] not in get_cmdline(pid):
+                continue
+            count += 1
+
+        status = get_status(count, warning, critical)
+        filters = []
+        if options['s'] is not None:
+            filters.append("with STATE = %s" % options['s'])
+        if options['u'] is not None:
+            filters.append("with UID = %s" % options['u'])
+        if options['C'] is not None:
+            filters.append("with command name '%s'" % options['C'])
+        if options['a'] is not None:
+            filters.append("with args '%s'" % options['a'])
+        message = 'PROCS %s: %d process%s %s' % (
+            STATUS_NAMES[status], count, count != 1 and 'es' or '', ', '.join(filters)
+        )
+        perfdata = format_perfdata(
+            'procs', count, '', warning and warning.end, critical and critical.end, 0
+        )
+        return CheckResult(status, message.strip(), perfdata)
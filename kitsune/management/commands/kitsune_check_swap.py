@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -
+'''
+Created on Oct 18, 2026
+
+Native version of the Nagios check_swap plugin.
+Checks the free swap space read from /proc/meminfo.
+eg:
+w=50% c=20%
+
+'''
+
+from optparse import make_option
+
+from kitsune.base import (
+    BaseKitsuneCheck, CheckResult, STATUS_OK, STATUS_WARNING, STATUS_CRITICAL,
+    STATUS_UNKNOWN
+)
+from kitsune.native import (
+    STATUS_NAMES, UNITS, get_options, parse_free_threshold, get_free_status,
+    get_free_limit, read_meminfo, format_perfdata
+)
+
+
+NO_SWAP_STATUS = {
+    'ok': STATUS_OK,
+    'warning': STATUS_WARNING,
+    'critical': STATUS_CRITICAL,
+    'unknown': STATUS_UNKNOWN,
+}
+
+
+class Command(BaseKitsuneCheck):
+    help = 'Checks the free swap space, like the check_swap Nagios plugin.'
+    option_list = BaseKitsuneCheck.option_list + (
+        make_option('-w', '--warning', dest='w', default=None,
+            help='Warn when less than this percentage (eg: 50%) or amount of units is free.'),
+        make_option('-c', '--critical', dest='c', default=None,
+            help='Critical when less than this percentage (eg: 20%) or amount of units is free.'),
+        make_option('-n', '--no-swap', dest='n', default='critical',
+            help='Status when there is no swap: ok, warning, critical or unknown (default: critical).'),
+        make_option('-u', '--units', dest='u', default='MB',
+            help='Units of the amounts: kB, MB, GB or TB (default: MB).'),
+    )
+
+    def check(self, *args, **options):
+        options = get_options(options)
+        unit = options['u']
+        warning = parse_free_threshold(options['w'], unit)
+        critical = parse_free_threshold(options['c'], unit)
+
+        meminfo = read_meminfo()
+        total, free = meminfo.get('SwapTotal', 0), meminfo.get('SwapFree', 0)
+        if total:
+            status = get_free_status(free, total, warning, critical)
+            percent = free * 100.0 / total
+        else:
+            status = NO_SWAP_STATUS[options['n'].lower()]
+            percent = 0
+
+        size = UNITS[unit]
+        message = 'SWAP %s - %d%% free (%d %s out of %d %s)' % (
+            STATUS_NAMES[status], percent, free / size, unit, total / size, unit
+        )
+        perfdata = format_perfdata(
+            'swap', free / size, unit,
+            warning is not None and int(get_free_limit(warning, total)) / size or None,
+            critical is not None and int(get_free_limit(critical, total)) / size or None,
+            0, total / size
+        )
+        return CheckResult(status, message, perfdata)
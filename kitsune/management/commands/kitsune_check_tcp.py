@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -
+'''
+Created on Oct 18, 2026
+
+Native version of the Nagios check_tcp plugin.
+Connects to a TCP port with a non-blocking socket and times the connection.
+eg:
+H=db.example.com p=5432 w=0.5 c=1
+
+'''
+
+import os
+import errno
+import select
+import socket
+import threading
+from optparse import make_option
+
+from kitsune.base import (
+    BaseKitsuneCheck, CheckResult, STATUS_CRITICAL, STATUS_UNKNOWN
+)
+from kitsune.native import (
+    STATUS_NAMES, get_options, get_threshold, get_status, format_perfdata
+)
+from kitsune.utils import get_run_time_left, monotonic
+
+
+def resolve(host, port, timeout):
+    """
+    Returns the first address of ``host`` to connect to ``port`` over TCP,
+    raises ``socket.timeout`` if the name isn't resolved within ``timeout``
+    seconds. ``getaddrinfo`` can't be interrupted, so a slow lookup is left
+    to end in a thread of its own.
+    """
+    result = []
+
+    def lookup():
+        try:
+            result.append(socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0])
+        except Exception, e:
+            result.append(e)
+
+    thread = threading.Thread(target=lookup)
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    if not result:
+        raise socket.timeout()
+    if isinstance(result[0], Exception):
+        raise result[0]
+    return result[0]
+
+
+def connect(host, port, timeout):
+    """
+    Connects to ``port`` of ``host`` within ``timeout`` seconds, name
+    resolution included. Returns the seconds it took, raises
+    ``socket.error`` or ``socket.timeout``.
+    """
+    start = monotonic()
+    family, socktype, proto, name, address = resolve(host, port, timeout)
+    sock = socket.socket(family, socktype, proto)
+    try:
+        sock.setblocking(0)
+        code = sock.connect_ex(address)
+        if code not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            raise socket.error(code, os.strerror(code))
+        left = max(timeout - (monotonic() - start), 0)
+        if not select.select([], [sock], [], left)[1]:
+            raise socket.timeout()
+        code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if code:
+            raise socket.error(code, os.strerror(code))
+        return monotonic() - start
+    finally:
+        sock.close()
+
+
+def format_seconds(seconds):
+    return ('%.1f' % seconds).rstrip('0').rstrip('.')
+
+
+class Command(BaseKitsuneCheck):
+    help = 'Checks that a TCP port accepts connections, like the check_tcp Nagios plugin.'
+    option_list = BaseKitsuneCheck.option_list + (
+        make_option('-H', '--hostname', dest='H', default='localhost',
+            help='The host to connect to (default: localhost).'),
+        make_option('-p', '--port', dest='p', default=None,
+            help='The port to connect to.'),
+        make_option('-w', '--warning', dest='w', default=None,
+            help='Warn when the connection takes more than this many seconds.'),
+        make_option('-c', '--critical', dest='c', default=None,
+            help='Critical when the connection takes more than this many seconds.'),
+        make_option('-t', '--timeout', dest='t', default=10,
+            help='Seconds before the connection times out (default: 10).'),
+    )
+
+    def check(self, *args, **options):
+        options = get_options(options)
+        if not str(options['p'] or '').isdigit():
+            return CheckResult(STATUS_UNKNOWN, 'TCP UNKNOWN - Port must be a positive integer')
+        host, port = options['H'], int(options['p'])
+        warning = get_threshold(options['w'])
+        critical = get_threshold(options['c'])
+        timeout = float(options['t'])
+        left = get_run_time_left()
+        if left is not None:
+            timeout = min(timeout, left)
+
+        try:
+            elapsed = connect(host, port, timeout)
+        except socket.timeout:
+            return CheckResult(STATUS_CRITICAL,
+                'CRITICAL - Socket timeout after %s seconds' % format_seconds(timeout))
+        except socket.error, e:
+            return CheckResult(STATUS_CRITICAL,
+                'TCP CRITICAL - Connection to %s port %d failed: %s' % (host, port, e.args[-1]))
+
+        status = get_status(elapsed, warning, critical)
+        message = 'TCP %s - %.3f second response time on %s port %d' % (
+            STATUS_NAMES[status], elapsed, host, port
+        )
+        perfdata = format_perfdata(
+            'time', elapsed, 's', warning and warning.end, critical and critical.end,
+            0, timeout
+        )
+        return CheckResult(status, message, perfdata)
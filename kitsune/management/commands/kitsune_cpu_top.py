@@ -0,0 +1,53 @@
+import sys
+from datetime import datetime, timedelta
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum, Max, Min, Count
+
+from kitsune.models import Job, Log
+from kitsune.utils import total_seconds
+
+
+class Command(BaseCommand):
+    help = 'Ranks the jobs by the CPU time their runs use per day.'
+    option_list = BaseCommand.option_list + (
+        make_option('--days', type='int', dest='days', default=1,
+            help='Number of days of logs to look at (default: 1).'),
+        make_option('--limit', type='int', dest='limit', default=20,
+            help='Number of jobs to show (default: 20).'),
+    )
+
+    def handle(self, *args, **options):
+        now = datetime.now()
+        since = now - timedelta(days=options['days'])
+        # Without the default ordering of logs, which would group them by
+        # run date too.
+        rows = Log.objects.filter(
+            run_date__gte=since, user_time__isnull=False
+        ).values('job').order_by().annotate(
+            runs=Count('id'), user=Sum('user_time'), system=Sum('system_time'),
+            wall=Sum('duration'), max_rss=Max('max_rss'), first=Min('run_date')
+        )
+        ranking = []
+        for row in rows:
+            # Old logs are pruned, so the CPU per day is estimated from the
+            # time covered by the logs kept.
+            covered = max(total_seconds(now - row['first']), 60)
+            per_day = (row['user'] + row['system']) * 86400 / covered
+            ranking.append((per_day, row))
+        ranking.sort(key=lambda item: item[0], reverse=True)
+        ranking = ranking[:options['limit']]
+
+        names = dict(Job.objects.filter(
+            pk__in=[row['job'] for score, row in ranking]
+        ).values_list('pk', 'name'))
+        sys.stdout.write('%4s  %-30s %6s %11s %9s %9s %9s %9s\n' % (
+            '#', 'job', 'runs', 'cpu s/day', 'user s', 'system s', 'avg wall', 'rss KB'
+        ))
+        for rank, (per_day, row) in enumerate(ranking):
+            sys.stdout.write('%4d  %-30s %6d %11.2f %9.2f %9.2f %9.3f %9s\n' % (
+                rank + 1, unicode(names.get(row['job'], row['job']))[:30], row['runs'], per_day,
+                row['user'], row['system'], (row['wall'] or 0) / row['runs'],
+                row['max_rss'] or ''
+            ))
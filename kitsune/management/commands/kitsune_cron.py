@@ -14,17 +14,33 @@ Based on django-chronograph.
 __author__      = "Raul Garreta (raul@tryolabs.com)"
 
 
+from socket import gethostname
+from time import sleep
+
 from django.core.management.base import BaseCommand
 
 class Command(BaseCommand):
     help = 'Runs all jobs that are due.'
     
     def handle(self, *args, **options):
-        from kitsune.models import Job
+        from kitsune.models import (
+            Job, Node, Lease, run_maintenance, group_batches, MAINTENANCE_LEASE
+        )
+        from kitsune.executors import get_executor, POLL_INTERVAL
+        executor = get_executor()
+        hostname = gethostname()
+        Node.objects.heartbeat(hostname)
+        Job.objects.release_stale(hostname)
+        run_maintenance()
         procs = []
-        for job in Job.objects.all():
-            p = job.run(False)
-            if p is not None:
-                procs.append(p)
-        for p in procs:
-            p.wait()
\ No newline at end of file
+        for job in group_batches(Job.objects.claim(hostname)):
+            procs.append(executor.submit(job))
+        # Poll every run on each pass, so that each one is killed at its
+        # own deadline even if it was started after a longer job.
+        while procs:
+            procs = [p for p in procs if p.poll() is None]
+            if procs:
+                sleep(POLL_INTERVAL)
+        executor.shutdown()
+        # The next run is another process, let it lead right away.
+        Lease.objects.release(MAINTENANCE_LEASE)
\ No newline at end of file
@@ -1,11 +1,17 @@
 from django.core.management.base import BaseCommand
 import sys
 
+from optparse import make_option
+
 class Command( BaseCommand ):
     help = 'Deletes old job logs.'
+    option_list = BaseCommand.option_list + (
+        make_option('--leader', action='store_true', dest='leader', default=False,
+            help='Only delete the logs on the host of the leader, so that every host can run this command.'),
+    )
     
     def handle( self, *args, **options ):
-        from kitsune.models import Log
+        from kitsune.models import Log, Lease, MAINTENANCE_LEASE
         from datetime import datetime, timedelta
                 
         if len( args ) != 2:
@@ -21,6 +27,16 @@ class Command( BaseCommand ):
             except ValueError:
                 sys.stderr.write('Interval must be an integer.\n')
                 return
-        kwargs = { unit: amount }
-        time_ago = datetime.now() - timedelta( **kwargs )
-        Log.objects.filter( run_date__lte = time_ago ).delete()
\ No newline at end of file
+        acquired = False
+        if options['leader'] and not Lease.objects.is_held_on(MAINTENANCE_LEASE):
+            # Lead for this run only if no other host does.
+            acquired = Lease.objects.acquire(MAINTENANCE_LEASE)
+            if not acquired:
+                return
+        try:
+            kwargs = { unit: amount }
+            time_ago = datetime.now() - timedelta( **kwargs )
+            Log.objects.prune( time_ago )
+        finally:
+            if acquired:
+                Lease.objects.release(MAINTENANCE_LEASE)
@@ -1,36 +1,77 @@
 from django.core.management.base import BaseCommand
-from kitsune.models import Job
+from kitsune.models import (
+    Job, Node, Lease, run_maintenance, group_batches, MAINTENANCE_LEASE
+)
+from kitsune.executors import get_executor, POLL_INTERVAL
+from kitsune.utils import monotonic
 
 import sys
 
+from optparse import make_option
+from socket import gethostname
 from time import sleep
 
 help_text = '''
 Emulates a reoccurring cron call to run jobs at a specified interval.
 This is meant primarily for development use.
+With --daemon jobs are kept in memory and run as soon as they are due.
 '''
 
 class Command(BaseCommand):
     help = help_text
     args = "time"
-    
+    option_list = BaseCommand.option_list + (
+        make_option('--daemon', action='store_true', dest='daemon', default=False,
+            help='Keep the jobs of this host in memory and run each one when it is due.'),
+        make_option('--resync', type='float', dest='resync', default=None,
+            help='Seconds between checks for modified jobs in daemon mode.'),
+    )
+
     def handle( self, *args, **options ):
-        from django.core.management import call_command
         try:
             t_wait = int(args[0])
         except:
             t_wait = 60
         try:
+            if options['daemon']:
+                self.run_daemon(options['resync'])
+            executor = get_executor()
             print "Starting cronserver.  Jobs will run every %d seconds." % t_wait
             print "Quit the server with CONTROL-C."
-            
+
             # Run server untill killed
+            procs = []
+            next_claim = monotonic()
             while True:
-                for job in Job.objects.all():
-                    p = job.run(False)
-                    if p is not None:
+                # Polling kills the jobs that timed out
+                procs = [p for p in procs if p.poll() is None]
+                if monotonic() >= next_claim:
+                    next_claim = monotonic() + t_wait
+                    Node.objects.heartbeat()
+                    Job.objects.release_stale(gethostname())
+                    run_maintenance()
+                    for job in group_batches(Job.objects.claim(gethostname())):
+                        procs.append(executor.submit(job))
                         print "Running: %s" % job
-                sleep(t_wait)
+                wait = max(next_claim - monotonic(), 0)
+                if procs:
+                    # Don't let running jobs outlive their timeout by t_wait.
+                    wait = min(wait, POLL_INTERVAL)
+                sleep(wait)
         except KeyboardInterrupt:
             print "Exiting..."
-            sys.exit()
\ No newline at end of file
+            Lease.objects.release(MAINTENANCE_LEASE)
+            sys.exit()
+
+    def run_daemon(self, resync=None):
+        from kitsune.scheduler import JobScheduler
+
+        scheduler = JobScheduler()
+        if resync is not None:
+            scheduler.resync_interval = resync
+        print "Starting cronserver daemon for host %s." % scheduler.hostname
+        print "Quit the server with CONTROL-C."
+
+        def started(job):
+            print "Running: %s" % job
+        scheduler.run_forever(started)
@@ -15,9 +15,10 @@ check=check_disk -u=GB -w=5 -c=2 -p=/
 __author__      = "Raul Garreta (raul@tryolabs.com)"
 
 
-from kitsune.base import BaseKitsuneCheck
+from kitsune.base import BaseKitsuneCheck, CheckResult
 from kitsune.nagios import NagiosPoller
 from kitsune.monitor import ArgSet
+from kitsune.utils import get_run_time_left, get_run_output_limit
 
 
 class Command(BaseKitsuneCheck):
@@ -26,6 +27,10 @@ class Command(BaseKitsuneCheck):
     
     def check(self, *args, **options):
         poller = NagiosPoller()
+        # Kill the plugin if it outlives the timeout of the job
+        poller.timeout = get_run_time_left()
+        # Keep the head and tail of the output of a verbose plugin
+        poller.output_limit = get_run_output_limit()
         nagios_args = ArgSet()
         check = options['check']
         del options['check']
@@ -42,9 +47,13 @@ class Command(BaseKitsuneCheck):
         for option in options:
             nagios_args.add_argument_pair(str(option), str(options[option]))
         res = poller.run_plugin(check, nagios_args)
-        
-        self.status_code = res.returncode
-        self.status_message = " NAGIOS_OUT:  " + res.output + "<br>NAGIOS_ERR:  " + res.error
+
+        # Each output stream of the plugin is already bounded.
+        return CheckResult(
+            res.returncode,
+            " NAGIOS_OUT:  " + res.output + "<br>NAGIOS_ERR:  " + res.error,
+            truncated=res.truncated
+        )
             
         
         
@@ -0,0 +1,56 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from kitsune.models import Job
+from kitsune.planner import plan, stagger_jobs
+
+
+# Characters of the heatmap, from no run to the peak minute.
+HEAT_CHARS = ' .:-=+*#%@'
+
+
+class Command(BaseCommand):
+    help = 'Shows how many checks each host runs per second and per minute over the next hours.'
+    option_list = BaseCommand.option_list + (
+        make_option('--hours', type='int', dest='hours', default=24,
+            help='Number of hours to plan (default: 24).'),
+        make_option('--host', dest='host', default=None,
+            help='Only plan the jobs of this host.'),
+        make_option('--stagger', action='store_true', dest='stagger', default=False,
+            help='Plan as if every job that can be staggered was.'),
+        make_option('--apply', action='store_true', dest='apply', default=False,
+            help='Turn on staggering for every job that can be staggered.'),
+    )
+
+    def handle(self, *args, **options):
+        jobs = Job.objects.select_related('host', 'pool')
+        if options['host']:
+            jobs = jobs.filter(host__name=options['host'])
+
+        if options['apply']:
+            changed = stagger_jobs(jobs.filter(stagger=False, disabled=False))
+            sys.stdout.write('Staggered %d jobs.\n' % len(changed))
+
+        plans = plan(jobs, hours=options['hours'], stagger=options['stagger'])
+        for host in sorted(plans):
+            self.print_plan(plans[host])
+
+    def print_plan(self, host_plan):
+        second, second_runs = host_plan.get_peak_second()
+        minute, minute_runs = host_plan.get_peak_minute()
+        sys.stdout.write('%s\n' % host_plan.host)
+        if not minute_runs:
+            sys.stdout.write('  no runs\n\n')
+            return
+        sys.stdout.write('  peak second: %d runs at %s\n' % (second_runs, second))
+        sys.stdout.write('  peak minute: %d runs at %s\n' % (minute_runs, minute))
+        sys.stdout.write('  runs per minute (peak = %s):\n' % HEAT_CHARS[-1])
+        for hour, counts in host_plan.get_heatmap():
+            heat = ''.join([
+                HEAT_CHARS[max(1, (len(HEAT_CHARS) - 1) * c // minute_runs)] if c else ' '
+                for c in counts
+            ])
+            sys.stdout.write('  %s |%s|\n' % (hour.strftime('%H:%M'), heat))
+        sys.stdout.write('\n')
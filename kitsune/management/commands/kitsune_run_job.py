@@ -1,27 +1,26 @@
 import sys
+from optparse import make_option
 
-from django.core.management import call_command
 from django.core.management.base import BaseCommand
 
-from kitsune.models import Job, Log
+from kitsune.models import Job, run_jobs
 
 class Command(BaseCommand):
-    help = 'Runs a specific job. The job will only run if it is not currently running.'
-    args = "job.id"
+    help = 'Runs specific jobs. The jobs of a batch check are run by a single invocation of the check.'
+    args = "job.id [job.id ...]"
+    option_list = BaseCommand.option_list + (
+        make_option('--queue-wait', type='float', dest='queue_wait', default=None,
+            help='Seconds the job waited for a free slot, stored in its log.'),
+    )
     
     def handle(self, *args, **options):
-        try:
-            job_id = args[0]
-        except IndexError:
-            sys.stderr.write("This command requires a single argument: a job id to run.\n")
+        if not args:
+            sys.stderr.write("This command requires at least one argument: a job id to run.\n")
             return
 
-        try:
-            job = Job.objects.get(pk=job_id)
-        except Job.DoesNotExist:
+        if not Job.objects.filter(pk__in=args).exists():
             sys.stderr.write("The requested Job does not exist.\n")
             return
         
-        # Run the job and wait for it to finish
-        job.handle_run()
-        
\ No newline at end of file
+        # Run the jobs and wait for them to finish
+        run_jobs(args, options.get('queue_wait'))
@@ -13,20 +13,21 @@ __author__ = "Raul Garreta (raul@tryolabs.com)"
 
 
 import os
-import re
-import subprocess
+import math
+import uuid
+import operator
 import sys
 import traceback
 import inspect
 from socket import gethostname
 from dateutil import rrule
-from StringIO import StringIO
 from datetime import datetime, timedelta
 
 from django.contrib.auth.models import User, Group
 from django.conf import settings
 from django.core.management import call_command
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction, IntegrityError
 from django.template import loader, Context
 from django.utils.timesince import timeuntil
 from django.utils.translation import ungettext, ugettext, ugettext_lazy as _
@@ -34,10 +35,21 @@ from django.utils.encoding import smart_str
 from django.core import urlresolvers
 from django.template.loader import render_to_string
 
-from kitsune.utils import get_manage_py
+from kitsune.executors import (
+    SubprocessExecutor, get_kitsune_check, is_kitsune_batch_check
+)
+from kitsune.utils import (
+    get_process_start_time, is_kitsune_process, set_run_timeout,
+    set_run_output_limit, total_seconds, get_usage, get_usage_since
+)
+from kitsune.output import BoundedBuffer, truncate_output, get_status_line
+from kitsune.profiling import start_profile, stop_profile, encode_stats, decode_stats
+from kitsune.schedule import IntervalSchedule, compile_schedule
+from kitsune.ring import HashRing
+from kitsune.cache import get_result_key, get_or_run
 from kitsune.renderers import KitsuneJobRenderer
 from kitsune.base import (
-    STATUS_OK, STATUS_WARNING, STATUS_CRITICAL, STATUS_UNKNOWN
+    STATUS_OK, STATUS_WARNING, STATUS_CRITICAL, STATUS_UNKNOWN, CheckResult
 )
 from kitsune.mail import send_multi_mail
 from kitsune.html2text import html2text
@@ -47,6 +59,19 @@ RRULE_WEEKDAY_DICT = {
     "MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6
 }
 
+# Seconds between runs of the frequencies that can be staggered.
+STAGGER_PERIODS = {
+    "SECONDLY": 1, "MINUTELY": 60, "HOURLY": 3600
+}
+
+# Staggered jobs are spread over at most this many seconds.
+STAGGER_WINDOW = getattr(settings, 'KITSUNE_STAGGER_WINDOW', 300)
+
+# Multiples of the golden ratio spread consecutive pks evenly.
+GOLDEN_RATIO = (math.sqrt(5) - 1) / 2
+
+EPOCH = datetime(1970, 1, 1)
+
 THRESHOLD_CHOICES = (
 
     (STATUS_OK, 'Status OK'),
@@ -69,16 +94,299 @@ REPETITION_CHOICES = (
 )
 
 
+# Columns needed to dispatch a job (see ``Job.run``).
+DISPATCH_FIELDS = (
+    'id', 'name', 'command', 'args', 'frequency', 'params', 'disabled',
+    'next_run', 'is_running', 'pid', 'pid_start_time', 'force_run',
+    'claimed_by', 'timeout', 'pool', 'unreachable', 'host__name',
+)
+
+# Seconds after which a run is killed, for jobs without a timeout. None
+# means no limit.
+DEFAULT_TIMEOUT = getattr(settings, 'KITSUNE_DEFAULT_TIMEOUT', None)
+
+# Adaptive jobs stretch their interval by this factor after this many
+# consecutive results under their threshold...
+ADAPTIVE_BACKOFF = getattr(settings, 'KITSUNE_ADAPTIVE_BACKOFF', 2)
+ADAPTIVE_OK_RUNS = getattr(settings, 'KITSUNE_ADAPTIVE_OK_RUNS', 3)
+
+# ... up to this many seconds, unless they set a maximum interval.
+ADAPTIVE_MAX_INTERVAL = getattr(settings, 'KITSUNE_ADAPTIVE_MAX_INTERVAL', 3600)
+
+# Jobs overdue by more than this many seconds missed runs while their
+# dispatcher was down...
+CATCH_UP_AFTER = getattr(settings, 'KITSUNE_CATCH_UP_AFTER', 120)
+
+# ... they are started over this many seconds instead of all at once, and
+# so are the missed runs they make up for.
+CATCH_UP_WINDOW = getattr(settings, 'KITSUNE_CATCH_UP_WINDOW', 300)
+
+# Default maximum number of missed runs a job makes up for, see
+# ``Job.missed_runs``.
+MISSED_RUNS = getattr(settings, 'KITSUNE_MISSED_RUNS', 0)
+
+# Names of the pools whose jobs the local node shares with the other nodes
+# of the pool.
+POOLS = getattr(settings, 'KITSUNE_POOLS', [])
+
+# A node is considered gone when it hasn't sent a heartbeat for this many
+# seconds, its jobs are then run by the other nodes of its pools.
+NODE_TIMEOUT = getattr(settings, 'KITSUNE_NODE_TIMEOUT', 180)
+
+# Jobs of a pool reassigned by a single UPDATE when its nodes change.
+ASSIGN_CHUNK_SIZE = 500
+
+# Seconds a node stays the leader, which runs the cluster-wide maintenance,
+# without renewing its lease. Another node takes over once it expires.
+LEASE_TTL = getattr(settings, 'KITSUNE_LEASE_TTL', 180)
+
+# Logs older than this many days are deleted by the leader, None keeps them.
+LOG_RETENTION = getattr(settings, 'KITSUNE_LOG_RETENTION', None)
+
+# Name of the lease held by the leader.
+MAINTENANCE_LEASE = 'maintenance'
+
+# Seconds a dispatcher may hold the lease of the concurrency slots of its
+# node, only reached if it dies while counting them.
+SLOTS_LEASE_TTL = 10
+
+# Maximum number of jobs run by a single invocation of a batch check.
+BATCH_SIZE = getattr(settings, 'KITSUNE_BATCH_SIZE', 100)
+
+# Bytes of each output stream of a run kept in its log, for jobs without a
+# limit of their own: the first and last halves. None keeps everything.
+OUTPUT_LIMIT = getattr(settings, 'KITSUNE_OUTPUT_LIMIT', 65536)
+
+# Number of runs profiled when profiling is turned on from the admin.
+PROFILE_RUNS = getattr(settings, 'KITSUNE_PROFILE_RUNS', 5)
+
+
 class JobManager(models.Manager):
-    def due(self):
+    def due(self, hostname=None):
+        """
+        Returns a ``QuerySet`` of all jobs waiting to be run, either because
+        they are scheduled or forced. If ``hostname`` is given only the jobs
+        of that host are returned, along with their host, and only the
+        columns needed to dispatch them are fetched.
+
+        Backed by the (host, disabled, is_running, next_run) and
+        (host, force_run) indexes.
         """
-        Returns a ``QuerySet`` of all jobs waiting to be run.
+        qs = self.filter(
+            models.Q(next_run__lte=datetime.now(), disabled=False, is_running=False,
+                     unreachable=False)
+            | models.Q(force_run=True)
+        )
+        if hostname is not None:
+            qs = self.for_node(hostname, qs).select_related('host')
+            qs = qs.only(*DISPATCH_FIELDS)
+        return qs.order_by('next_run')
+
+    def for_node(self, hostname, queryset=None):
+        """
+        Filters ``queryset``, every job by default, down to the jobs run by
+        the node ``hostname``: the jobs of its host and the jobs of its pools
+        assigned to it (see ``NodeManager.assign_jobs``).
+        """
+        if queryset is None:
+            queryset = self.all()
+        q = models.Q(host__name=hostname)
+        pools = Node.objects.get_pools(hostname)
+        if pools:
+            q |= models.Q(pool__in=pools, node=hostname)
+        return queryset.filter(q)
+
+    def claim(self, hostname, limit=None):
+        """
+        Atomically marks up to ``limit`` due jobs of ``hostname`` as running
+        and returns them. The jobs are claimed with a single conditional
+        UPDATE, recording the claiming process in ``claimed_by``, so jobs
+        claimed at the same time by another dispatcher are skipped. The jobs
+        that missed runs while ``hostname`` was down are spread first.
+        """
+        self.spread_missed(hostname)
+        now = datetime.now()
+        pks = self.due(hostname).filter(disabled=False).values_list('pk', flat=True)
+        if limit is not None:
+            pks = pks[:limit]
+        pks = list(pks)
+        if not pks:
+            return []
+        owner = get_claim_owner()
+        # The jobs run and finished by another dispatcher since they were
+        # selected are no longer due.
+        self.filter(get_due_q(now), pk__in=pks, is_running=False).update(
+            is_running=True, pid=os.getpid(),
+            pid_start_time=get_process_start_time(os.getpid()),
+            claimed_by=owner, run_slot='', modified=datetime.now()
+        )
+        return list(
+            self.filter(claimed_by=owner).select_related('host').only(*DISPATCH_FIELDS)
+        )
+
+    def count_slots(self, hostname):
+        """
+        Returns the number of runs on the node ``hostname`` holding one of its
+        concurrency slots, whichever process dispatched them. The jobs of a
+        batch share their slot.
         """
         return self.filter(
-            next_run__lte=datetime.now(),
-            disabled=False,
-            is_running=False
+            models.Q(host__name=hostname)
+            | models.Q(pool__isnull=False, claimed_by__startswith='%s:' % hostname),
+            is_running=True
+        ).exclude(run_slot='').values('run_slot').distinct().count()
+
+    def take_slots(self, hostname, runs, limit):
+        """
+        Gives a concurrency slot of the node ``hostname`` to as many of
+        ``runs``, lists of the pks of the jobs run together, as there are
+        free slots out of ``limit``. Returns the number of runs given one.
+
+        The slots are counted and taken under a lease of the node, so that
+        its dispatchers don't hand out the same free slots.
+        """
+        lease = 'slots:%s' % hostname
+        owner = get_claim_owner()
+        if not Lease.objects.acquire(lease, owner, SLOTS_LEASE_TTL):
+            return 0
+        try:
+            free = max(limit - self.count_slots(hostname), 0)
+            for pks in runs[:free]:
+                self.filter(pk__in=pks, is_running=True).update(
+                    run_slot=uuid.uuid4().hex
+                )
+            return min(free, len(runs))
+        finally:
+            Lease.objects.release(lease, owner)
+
+    def release(self, runs):
+        """
+        Clears the running flag of the jobs in ``runs``, a list of
+        ``(pk, pid)`` tuples, in a single UPDATE. A job is only released if
+        it is still run by that pid.
+        """
+        if not runs:
+            return 0
+        q = reduce(operator.or_, [models.Q(pk=pk, pid=pid) for pk, pid in runs])
+        return self.filter(q, is_running=True).update(
+            is_running=False, pid=None, pid_start_time=None, claimed_by='',
+            modified=datetime.now()
+        )
+
+    def release_claims(self, jobs):
+        """
+        Clears the running flag of ``jobs`` whose run ended while they were
+        still claimed, e.g. because the process that was to run them died
+        before storing a result. A job is only released if it still holds
+        the same claim, so that a later claim is left alone.
+        """
+        claims = [(job.pk, job.claimed_by) for job in jobs if job.claimed_by]
+        if not claims:
+            return 0
+        q = reduce(operator.or_, [
+            models.Q(pk=pk, claimed_by=claimed_by) for pk, claimed_by in claims
+        ])
+        return self.filter(q, is_running=True).update(
+            is_running=False, pid=None, pid_start_time=None, claimed_by='',
+            modified=datetime.now()
+        )
+
+    def release_stale(self, hostname):
+        """
+        Clears the running flag of the jobs of ``hostname`` whose process is
+        gone, checking all of them in one pass.
+        Returns the number of jobs released.
+        """
+        if os.name != 'posix':
+            return 0
+        running = self.filter(
+            models.Q(host__name=hostname)
+            | models.Q(pool__isnull=False, claimed_by__startswith='%s:' % hostname),
+            is_running=True, pid__isnull=False
         )
+        stale = [
+            (pk, pid) for pk, pid, start_time
+            in running.values_list('pk', 'pid', 'pid_start_time')
+            if not is_kitsune_process(pid, start_time)
+        ]
+        return self.release(stale)
+
+    def get_orphaned_runs(self):
+        """
+        Returns the ``(pk, pid)`` tuples of the pool jobs marked as running
+        by a node that is gone.
+        """
+        since = datetime.now() - timedelta(seconds=NODE_TIMEOUT)
+        live = set(Node.objects.filter(
+            last_heartbeat__gte=since
+        ).values_list('pool', 'name'))
+        running = self.filter(pool__isnull=False, is_running=True, pid__isnull=False)
+        return [
+            (pk, pid) for pk, pid, pool_id, claimed_by
+            in running.values_list('pk', 'pid', 'pool', 'claimed_by')
+            if (pool_id, claimed_by.rsplit(':', 2)[0]) not in live
+        ]
+
+    def spread_missed(self, hostname, now=None):
+        """
+        Reschedules the jobs of ``hostname`` that missed runs, i.e. are
+        overdue by more than ``CATCH_UP_AFTER`` seconds, evenly over the next
+        ``CATCH_UP_WINDOW`` seconds so that a dispatcher coming back from
+        downtime doesn't start all of them at once. Jobs already spread are
+        claimed as they become due, so they are never overdue again while
+        the dispatcher is up. Returns the number of jobs rescheduled.
+        """
+        now = (now or datetime.now()).replace(microsecond=0)
+        overdue = self.for_node(hostname, self.filter(
+            disabled=False, is_running=False, force_run=False,
+            next_run__lt=now - timedelta(seconds=CATCH_UP_AFTER)
+        ))
+        pks = list(overdue.order_by('next_run').values_list('pk', flat=True))
+        if len(pks) < 2:
+            return 0
+        # One UPDATE per second of the window.
+        step = float(CATCH_UP_WINDOW) / len(pks)
+        seconds = {}
+        for i, pk in enumerate(pks):
+            seconds.setdefault(int(i * step), []).append(pk)
+        for second, second_pks in seconds.items():
+            self.filter(pk__in=second_pks).update(
+                next_run=now + timedelta(seconds=second), modified=now
+            )
+        return len(pks)
+
+
+def get_due_q(now=None):
+    """
+    Returns a ``Q`` matching the jobs due at ``now``, either because they
+    are scheduled or forced, whether they are running or not.
+    """
+    return models.Q(
+        next_run__lte=now or datetime.now(), disabled=False, unreachable=False
+    ) | models.Q(force_run=True)
+
+
+def get_claim_owner():
+    """
+    Returns a token identifying a claim made by this process.
+    """
+    return '%s:%d:%s' % (gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+
+_lease_owner = (None, None)
+
+def get_lease_owner():
+    """
+    Returns a token identifying this process as the owner of leases, the
+    same for the lifetime of the process so that it renews its own leases.
+    Dispatchers sharing a host are different owners.
+    """
+    global _lease_owner
+    pid, owner = _lease_owner
+    if pid != os.getpid():
+        # A forked process must not share the leases of its parent.
+        _lease_owner = os.getpid(), get_claim_owner()
+    return _lease_owner[1]
 
 # A lot of rrule stuff is from django-schedule
 freqs = (
@@ -137,34 +445,147 @@ class Job(models.Model):
     last_run_successful = models.BooleanField(default=True, blank=False, null=False, editable=False)
 
     pid = models.IntegerField(blank=True, null=True, editable=False)
+    pid_start_time = models.BigIntegerField(blank=True, null=True, editable=False)
+    claimed_by = models.CharField(max_length=100, blank=True, editable=False)
+    # Token of the concurrency slot of the host taken by the current run, see
+    # ``kitsune.executors.LimitedExecutor``. Empty while the run is queued.
+    run_slot = models.CharField(max_length=32, blank=True, editable=False)
     force_run = models.BooleanField(default=False)
-    host = models.ForeignKey('Host')
+    host = models.ForeignKey('Host', null=True, blank=True,
+        help_text=_("The host that runs this job. Leave blank to share it among the nodes of a pool."))
+    pool = models.ForeignKey('Pool', null=True, blank=True,
+        help_text=_("The pool of nodes this job is shared among, each job is run by one of its live nodes."))
+    # Node of the pool this job is hashed to, see ``NodeManager.assign_jobs``.
+    node = models.CharField(max_length=150, blank=True, db_index=True, editable=False)
     last_result = models.ForeignKey('Log', related_name='running_job', null=True, blank=True)
     renderer = models.CharField(choices=get_render_choices(), max_length=100, default="kitsune.models.KitsuneJobRenderer")
+    stagger = models.BooleanField(default=False,
+        help_text=_("Shift the runs of this job by a fixed offset to spread the load of jobs with the same frequency. Only applies to secondly, minutely and hourly jobs with at most an interval parameter."))
     last_logs_to_keep = models.PositiveIntegerField(default=20)
+    timeout = models.PositiveIntegerField(_("timeout"), null=True, blank=True,
+        help_text=_("Seconds after which a run is killed and recorded with an unknown status. Leave blank to use the default."))
+    adaptive = models.BooleanField(_("adaptive"), default=False,
+        help_text=_("Run this job less often while its results stay under the threshold, and back at the minimum interval as soon as one reaches it."))
+    adaptive_min_interval = models.PositiveIntegerField(_("minimum interval"), null=True, blank=True,
+        help_text=_("Seconds between runs of an adaptive job that reached its threshold. Leave blank to use the interval of its frequency."))
+    adaptive_max_interval = models.PositiveIntegerField(_("maximum interval"), null=True, blank=True,
+        help_text=_("Maximum seconds between runs of an adaptive job. Leave blank to use the default."))
+    adaptive_threshold = models.IntegerField(_("threshold"), choices=THRESHOLD_CHOICES, default=STATUS_WARNING,
+        help_text=_("Status from which an adaptive job goes back to its minimum interval."))
+    adaptive_interval = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    adaptive_ok_runs = models.PositiveIntegerField(default=0, editable=False)
+    depends_on = models.ForeignKey('self', verbose_name=_("depends on"), related_name='dependents',
+        null=True, blank=True, on_delete=models.SET_NULL,
+        help_text=_("While the last result of this job is critical, this job is not run and marked as unreachable."))
+    unreachable = models.BooleanField(default=False, editable=False)
+    last_status_code = models.IntegerField(null=True, blank=True, editable=False)
+    missed_runs = models.PositiveIntegerField(_("missed runs"), null=True, blank=True,
+        help_text=_("Maximum number of runs missed while the dispatcher was down to make up for, spread over a few minutes. 0 runs the job once and skips them. Leave blank to use the default."))
+    missed_runs_left = models.PositiveIntegerField(default=0, editable=False)
+    output_limit = models.PositiveIntegerField(_("output limit"), null=True, blank=True,
+        help_text=_("Bytes of output of a run kept in its log, the first and last halves. Leave blank to use the default."))
+    result_cache_ttl = models.PositiveIntegerField(_("result cache TTL"), null=True, blank=True,
+        help_text=_("Seconds a result of the same check, with the same args on the same host, can be reused instead of running the check again. Leave blank to always run the check."))
+    profile_runs = models.PositiveIntegerField(_("profile next runs"), default=0,
+        help_text=_("Number of the next runs of this job run under cProfile, whose stats are stored with their logs."))
+    modified = models.DateTimeField(auto_now=True, db_index=True, null=True, editable=False)
 
     objects = JobManager()
 
     class Meta:
         ordering = ('disabled', 'next_run',)
+        # Composite indexes used by ``JobManager.due`` are created in
+        # migration 0015.
 
     def __unicode__(self):
         if self.disabled:
             return _(u"%(name)s - disabled") % {'name': self.name}
         return u"%s - %s" % (self.name, self.timeuntil)
 
+    # Fields whose changes reschedule the job.
+    SCHEDULE_FIELDS = (
+        'frequency', 'params', 'disabled', 'stagger', 'adaptive',
+        'adaptive_min_interval', 'adaptive_max_interval',
+    )
+
+    def __init__(self, *args, **kwargs):
+        super(Job, self).__init__(*args, **kwargs)
+        self._loaded_schedule = self.get_schedule_state()
+
+    def get_schedule_state(self):
+        """
+        Returns a dict with the current values of the ``SCHEDULE_FIELDS``
+        that are loaded; deferred fields are left out so that reading them
+        doesn't hit the database.
+        """
+        return dict([
+            (name, self.__dict__[name])
+            for name in self.SCHEDULE_FIELDS if name in self.__dict__
+        ])
+
+    def schedule_changed(self):
+        """
+        Returns True if the schedule of this job changed since it was loaded
+        or last saved.
+        """
+        if not self.pk:
+            return True
+        loaded = self._loaded_schedule
+        if len(loaded) < len(self.SCHEDULE_FIELDS):
+            # Some field was deferred, compare with the stored row.
+            loaded = Job.objects.filter(pk=self.pk).values(*self.SCHEDULE_FIELDS)[0]
+        for name in self.SCHEDULE_FIELDS:
+            if getattr(self, name) != loaded[name]:
+                return True
+        return False
+
+    def clean(self):
+        if (self.host_id is None) == (self.pool_id is None):
+            raise ValidationError(_("A job must be run either by a host or by a pool."))
+        parent, seen = self.depends_on, set([self.pk])
+        while parent is not None:
+            if parent.pk in seen:
+                raise ValidationError(_("A job can't depend on itself, directly or not."))
+            seen.add(parent.pk)
+            parent = parent.depends_on
+
     def save(self, force_insert=False, force_update=False):
-        if not self.disabled:
-            if self.pk:
-                j = Job.objects.get(pk=self.pk)
-            else:
-                j = self
-            if not self.next_run or j.params != self.params:
-                self.next_run = self.rrule.after(datetime.now())
+        if self.depends_on_id or self.unreachable:
+            self.unreachable = self.is_parent_down()
+        if not self.disabled and not self.unreachable:
+            if self.schedule_changed():
+                # Start adapting again from the regular schedule.
+                self.adaptive_interval = None
+                self.adaptive_ok_runs = 0
+                self.missed_runs_left = 0
+                self.next_run = self.get_next_run(datetime.now())
+            elif not self.next_run:
+                self.next_run = self.get_next_run(datetime.now())
         else:
             self.next_run = None
+        if self.pool_id is None:
+            self.node = ''
+        elif self.pk is not None:
+            self.node = self.pool.get_node(self.pk)
 
         super(Job, self).save(force_insert, force_update)
+        self._loaded_schedule = self.get_schedule_state()
+        if self.pool_id is not None and not self.node:
+            # New jobs are hashed on their pk.
+            self.node = self.pool.get_node(self.pk)
+            if self.node:
+                Job.objects.filter(pk=self.pk).update(node=self.node)
+
+    def update(self, **fields):
+        """
+        Sets ``fields`` on this job and writes only them, and ``modified``,
+        to the database with a single UPDATE. Meant for internal transitions
+        such as marking the job as running, which never change its schedule.
+        """
+        fields.setdefault('modified', datetime.now())
+        for name, value in fields.items():
+            setattr(self, name, value)
+        Job.objects.filter(pk=self.pk).update(**fields)
 
     def get_timeuntil(self):
         """
@@ -173,6 +594,8 @@ class Job(models.Model):
         """
         if self.disabled:
             return _('never (disabled)')
+        if self.unreachable:
+            return _('unreachable')
 
         delta = self.next_run - datetime.now(self.next_run.tzinfo)
         if delta.days < 0:
@@ -187,16 +610,150 @@ class Job(models.Model):
     get_timeuntil.short_description = _('time until next run')
     timeuntil = property(get_timeuntil)
 
-    def get_rrule(self):
+    def get_rrule(self, dtstart=None):
         """
-        Returns the rrule objects for this Job.
+        Returns the rrule objects for this Job, starting at ``dtstart`` or
+        else at the last run.
         """
         frequency = eval('rrule.%s' % self.frequency)
         return rrule.rrule(
-            frequency, dtstart=self.last_run, **self.get_params()
+            frequency, dtstart=dtstart or self.last_run, **self.get_params()
         )
     rrule = property(get_rrule)
 
+    def get_schedule(self, dtstart=None):
+        """
+        Returns the compiled schedule of this Job (see ``kitsune.schedule``),
+        starting at ``dtstart`` or else at the last run. Staggered jobs run
+        every period at their offset, counted from the epoch, adaptive jobs
+        every current interval once they have run.
+        """
+        if self.adaptive and self.adaptive_interval:
+            return IntervalSchedule(
+                (dtstart or self.last_run or datetime.now()).replace(microsecond=0),
+                self.adaptive_interval
+            )
+        stagger = self.get_stagger_offset()
+        if stagger is not None:
+            offset, period = stagger
+            return IntervalSchedule(EPOCH + timedelta(seconds=offset), period)
+        return compile_schedule(
+            self.frequency, self.get_params(), dtstart or self.last_run
+        )
+
+    def get_stagger_offset(self):
+        """
+        Returns a tuple of the offset of the runs of this job, derived from
+        its pk, and the period between them, in seconds. Returns None if the
+        job is not staggered.
+        """
+        if not self.stagger or not self.pk:
+            return None
+        params = self.get_params()
+        interval = params.pop('interval', 1)
+        if self.frequency not in STAGGER_PERIODS or params or not isinstance(interval, int):
+            return None
+        period = STAGGER_PERIODS[self.frequency] * interval
+        window = min(period, STAGGER_WINDOW)
+        return int(window * ((self.pk * GOLDEN_RATIO) % 1)), period
+
+    def get_next_run(self, after, dtstart=None):
+        """
+        Returns the first run of this job after ``after``, with its schedule
+        starting at ``dtstart`` or else at the last run.
+        """
+        return self.get_schedule(dtstart).after(after)
+
+    def get_adaptive_interval(self, status_code, run_date):
+        """
+        Returns a tuple of the interval, in seconds, until the next run of
+        this adaptive job after a run at ``run_date`` with ``status_code``,
+        and the number of runs under its threshold since the interval was
+        last stretched.
+        """
+        max_interval = self.adaptive_max_interval or ADAPTIVE_MAX_INTERVAL
+        min_interval = self.adaptive_min_interval
+        if not min_interval:
+            start = run_date.replace(microsecond=0)
+            regular = compile_schedule(
+                self.frequency, self.get_params(), start
+            ).after(start)
+            if regular is None:
+                min_interval = max_interval
+            else:
+                min_interval = int(total_seconds(regular - start))
+        max_interval = max(max_interval, min_interval)
+        if status_code is None or status_code >= self.adaptive_threshold:
+            return min_interval, 0
+
+        interval = max(self.adaptive_interval or min_interval, min_interval)
+        ok_runs = self.adaptive_ok_runs + 1
+        if ok_runs >= ADAPTIVE_OK_RUNS:
+            interval = min(int(interval * ADAPTIVE_BACKOFF), max_interval)
+            ok_runs = 0
+        return interval, ok_runs
+
+    def get_missed_runs(self):
+        """
+        Returns the maximum number of missed runs this job makes up for.
+        """
+        if self.missed_runs is None:
+            return MISSED_RUNS
+        return self.missed_runs
+
+    def get_missed_runs_left(self, run_date):
+        """
+        Returns the number of missed runs this job still has to make up for
+        after a run at ``run_date``: the runs it missed between its last run
+        and ``run_date``, up to ``get_missed_runs``, or one less than before
+        if it was already making up for missed runs. Runs due less than
+        ``CATCH_UP_AFTER`` seconds before ``run_date`` are only late, e.g.
+        the runs of a secondly job between two runs of ``kitsune_cron``.
+        """
+        if self.missed_runs_left:
+            return self.missed_runs_left - 1
+        limit = self.get_missed_runs()
+        if not limit or self.last_run is None:
+            return 0
+        # Only count up to the limit, a secondly job may have missed
+        # millions of runs.
+        schedule = self.get_schedule(self.last_run)
+        missed_before = run_date - timedelta(seconds=CATCH_UP_AFTER)
+        occurrence, missed = self.last_run, -1
+        while missed < limit:
+            occurrence = schedule.after(occurrence)
+            if occurrence is None or occurrence > missed_before:
+                break
+            missed += 1
+        return max(missed, 0)
+
+    def get_timeout(self):
+        """
+        Returns the number of seconds after which a run of this job is
+        killed, or None if it is never killed.
+        """
+        return self.timeout or DEFAULT_TIMEOUT
+
+    def get_output_limit(self):
+        """
+        Returns the number of bytes of output of a run kept in its log, or
+        None to keep everything.
+        """
+        if self.output_limit is not None:
+            return self.output_limit
+        return OUTPUT_LIMIT
+
+    def claim_profile_run(self):
+        """
+        Takes one of the runs of this job left to profile. Returns True if
+        the current run must be profiled.
+        """
+        if not self.profile_runs:
+            return False
+        return bool(Job.objects.filter(pk=self.pk, profile_runs__gt=0).update(
+            profile_runs=models.F('profile_runs') - 1
+        ))
+
     def param_to_int(self, param_value):
         """
         Converts a valid rrule parameter to an integer if it is not already
@@ -255,44 +812,121 @@ class Job(models.Model):
 
     def is_due(self):
         reqs = (
-            self.next_run <= datetime.now() and self.disabled is False
+            self.next_run is not None and self.next_run <= datetime.now()
+            and self.disabled is False
             and self.is_running is False
+            and self.unreachable is False
         )
         return (reqs or self.force_run)
 
-    def run(self, wait=True):
+    def run(self, wait=True, executor=None):
         """
         Runs this ``Job``.  If ``wait`` is ``True`` any call to this function
-        will not return untill the ``Job`` is complete (or fails).  This
-        actually calls the management command ``kitsune_run_job`` via a
-        subprocess. If you call this and want to wait for the process to
+        will not return untill the ``Job`` is complete (or fails).  By
+        default this actually calls the management command ``kitsune_run_job``
+        via a subprocess, pass an ``executor`` from ``kitsune.executors`` to
+        run it otherwise. If you call this and want to wait for the process to
         complete, pass ``wait=True``.
 
         A ``Log`` will be created if there is any output from either
         stdout or stderr.
 
-        Returns the process, a ``subprocess.Popen`` instance, or None.
+        Returns the process, a ``subprocess.Popen`` instance (or an object
+        with the same ``poll`` and ``wait`` methods), or None.
         """
-        if not self.disabled and self.host.name == gethostname():
-            if not self.check_is_running() and self.is_due():
-                p = subprocess.Popen([
-                    'python', get_manage_py(), 'kitsune_run_job', str(self.pk)
-                ])
-                if wait:
-                    p.wait()
-                return p
+        if self.claim_due():
+            if executor is None:
+                executor = SubprocessExecutor()
+            p = executor.submit(self)
+            if wait:
+                p.wait()
+            return p
         return None
 
-    def handle_run(self):
+    def claim_due(self, hostname=None):
+        """
+        Claims this job if it is enabled, run by ``hostname``, the local host
+        by default, due and not running yet. Returns True if it was claimed.
+        """
+        return not self.disabled and self.runs_on(hostname or gethostname()) and \
+            not self.check_is_running() and self.is_due() and self.claim()
+
+    def runs_on(self, hostname):
+        """
+        Returns True if this job is run by the node ``hostname``.
+        """
+        if self.pool_id is None:
+            return self.host.name == hostname
+        return self.node == hostname and \
+            self.pool_id in Node.objects.get_pools(hostname)
+
+    def claim(self):
+        """
+        Atomically marks this job as running on behalf of this process.
+        Returns False if the job is already running or no longer due, e.g.
+        because another dispatcher claimed it first.
+        """
+        owner = get_claim_owner()
+        pid_start_time = get_process_start_time(os.getpid())
+        claimed = Job.objects.filter(
+            get_due_q(), pk=self.pk, is_running=False
+        ).update(
+            is_running=True, pid=os.getpid(), pid_start_time=pid_start_time,
+            claimed_by=owner, run_slot='', modified=datetime.now()
+        )
+        if claimed:
+            self.is_running = True
+            self.pid = os.getpid()
+            self.pid_start_time = pid_start_time
+            self.claimed_by = owner
+        return bool(claimed)
+
+    def handle_run(self, queue_wait=None):
         """
         This method implements the code to actually run a job. This is meant to
         be run, primarily, by the `kitsune_run_job` management command as a
         subprocess, which can be invoked by calling this job's ``run_job``
         method.
+
+        ``BaseKitsuneCheck`` commands are run in process and return a
+        ``CheckResult``. The output of other commands is captured by
+        replacing ``sys.stdout`` and ``sys.stderr``.
+
+        ``queue_wait`` is the number of seconds the job waited for a free
+        slot before running, it is stored in the ``Log``. The check or
+        command is run under cProfile while the job has runs left to profile.
         """
         args, options = self.get_args()
-        stdout = StringIO()
-        stderr = StringIO()
+        run_date = datetime.now()
+        pid = os.getpid()
+        self.update(
+            is_running=True, pid=pid, pid_start_time=get_process_start_time(pid)
+        )
+        profile = self.claim_profile_run()
+
+        check = get_kitsune_check(self.command)
+        if check is not None:
+            # Checks hand their result over, there is no output to capture.
+            set_run_timeout(self.get_timeout())
+            set_run_output_limit(self.get_output_limit())
+            start = get_usage()
+            profiler = profile and start_profile() or None
+            try:
+                result = self.get_result(check, args, options)
+            except SystemExit, e:
+                result = CheckResult(STATUS_UNKNOWN, unicode(e))
+            stats = stop_profile(profiler)
+            usage = get_usage_since(start)
+            set_run_timeout(None)
+            set_run_output_limit(None)
+            self.last_run_successful = True
+            self.finish_run(run_date, queue_wait=queue_wait, result=result,
+                            usage=usage, stats=stats)
+            return
+
+        # Only the head and tail of a huge output are kept in memory.
+        stdout = BoundedBuffer(self.get_output_limit())
+        stderr = BoundedBuffer(self.get_output_limit())
 
         # Redirect output so that we can log it if there is any
         ostdout = sys.stdout
@@ -301,15 +935,13 @@ class Job(models.Model):
         sys.stderr = stderr
         stdout_str, stderr_str = "", ""
 
-        run_date = datetime.now()
-        self.is_running = True
-        self.pid = os.getpid()
-        self.save()
-
+        set_run_timeout(self.get_timeout())
+        start = get_usage()
+        profiler = profile and start_profile() or None
         try:
             call_command(self.command, *args, **options)
             self.last_run_successful = True
-        except Exception, e:
+        except (Exception, SystemExit), e:
             # The command failed to run; log the exception
             t = loader.get_template('kitsune/error_message.txt')
             trace = ['\n'.join(traceback.format_exception(*sys.exc_info()))]
@@ -319,119 +951,295 @@ class Job(models.Model):
             })
             stderr_str += t.render(c)
             self.last_run_successful = False
-
-        self.is_running = False
-        self.pid = None
-        self.last_run = run_date
-
-        # If this was a forced run, then don't update the
-        # next_run date
-        if self.force_run:
-            self.force_run = False
-        else:
-            self.next_run = self.rrule.after(run_date)
+        stats = stop_profile(profiler)
+        usage = get_usage_since(start)
+        set_run_timeout(None)
 
         # If we got any output, save it to the log
         stdout_str += stdout.getvalue()
         stderr_str += stderr.getvalue()
 
-        if stderr_str:
-            # If anything was printed to stderr, consider the run
-            # unsuccessful
-            self.last_run_successful = False
-
-        if stdout_str or stderr_str:
-            log = Log.objects.create(
-                job=self,
-                run_date=run_date,
-                stdout=stdout_str,
-                stderr=stderr_str
-            )
-            self.last_result = log
-
-        self.save()
-        self.delete_old_logs()
-        self.email_subscribers()
-
         # Redirect output back to default
         sys.stdout = ostdout
         sys.stderr = ostderr
 
-    def email_subscribers(self):
-        from_email = settings.DEFAULT_FROM_EMAIL
-        subject = 'Kitsune monitoring notification'
+        truncated = getattr(stdout, 'truncated', 0) + getattr(stderr, 'truncated', 0)
+        self.finish_run(run_date, stdout_str, stderr_str, queue_wait,
+                        truncated=truncated, usage=usage, stats=stats)
+
+    def get_result(self, check, args, options):
+        """
+        Runs ``check`` and returns its ``CheckResult``, or reuses the result
+        of the same check run for any job within the last
+        ``result_cache_ttl`` seconds.
+        """
+        if not self.result_cache_ttl:
+            return check.run_check(*args, **options)
+        if self.pool_id is None:
+            target = ('host', self.host_id)
+        else:
+            target = ('pool', self.pool_id)
+        return get_or_run(
+            get_result_key(self.command, args, options, target),
+            self.result_cache_ttl, lambda: check.run_check(*args, **options)
+        )
+
+    def handle_timeout(self, elapsed, queue_wait=None, usage=None):
+        """
+        Records a run of this job that was killed after ``elapsed`` seconds
+        because it timed out, with an unknown status. ``usage`` holds the
+        resources used by the killed process, if known.
+        """
+        self.last_run_successful = False
+        self.finish_run(
+            datetime.now() - timedelta(seconds=elapsed),
+            'Timed out after %.1f seconds.' % elapsed,
+            str(STATUS_UNKNOWN), queue_wait, usage=usage
+        )
 
-        user_ids = set([])
-        for sub in self.subscriber_users.all():
-            #notify subscribed users
-            if sub.must_notify():
-                sub.last_notification = datetime.now()
-                sub.save()
-                html_message = render_to_string(
-                    'kitsune/mail_notification.html', {'log': self.last_result}
+    def finish_run(self, run_date, stdout_str='', stderr_str='', queue_wait=None,
+                   result=None, truncated=0, usage=None, stats=None):
+        """
+        Stores the result of the run of this job started at ``run_date``
+        and notifies the subscribers. The result is either the ``CheckResult``
+        ``result`` or the output of the command, whose stderr holds the
+        status code. The output of a command was already bounded while it
+        was captured and ``truncated`` is the number of bytes it dropped.
+        ``usage`` is a dict of the ``user_time``, ``system_time`` and
+        ``max_rss`` of the run and ``stats`` its serialized profile, if it
+        was profiled.
+        """
+        if result is not None:
+            # The log keeps the output the check would have printed.
+            status_line = get_status_line(result.message)[:255]
+            if result.truncated is None:
+                stdout_str, truncated = truncate_output(result.message, self.get_output_limit())
+            else:
+                stdout_str, truncated = result.message, result.truncated
+            stderr_str = str(result.status_code)
+            status_code = result.status_code
+            self.last_run_successful = status_code == STATUS_OK
+            duration = result.duration
+        else:
+            if stderr_str:
+                # If anything was printed to stderr, consider the run
+                # unsuccessful
+                self.last_run_successful = False
+                status_code = parse_status_code(stderr_str)
+                if status_code is None:
+                    # Anything but a status code, eg: a warning.
+                    status_code = STATUS_UNKNOWN
+            elif self.last_run_successful:
+                status_code = STATUS_OK
+            else:
+                status_code = STATUS_UNKNOWN
+            duration = total_seconds(datetime.now() - run_date)
+            status_line = get_status_line(stdout_str)[:255]
+
+        finished = dict(
+            is_running=False, pid=None, pid_start_time=None, claimed_by='',
+            last_run=run_date, force_run=False,
+            last_run_successful=self.last_run_successful
+        )
+        previous_status_code = self.last_status_code
+        finished['last_status_code'] = status_code
+
+        if self.adaptive:
+            interval, ok_runs = self.get_adaptive_interval(status_code, run_date)
+            finished['adaptive_interval'] = interval
+            finished['adaptive_ok_runs'] = ok_runs
+            if not self.force_run:
+                finished['next_run'] = run_date.replace(microsecond=0) + \
+                    timedelta(seconds=interval)
+        elif not self.force_run:
+            # If this was a forced run, then don't update the
+            # next_run date
+            # The schedule starts over at this run, as ``last_run`` does.
+            finished['next_run'] = self.get_next_run(run_date, run_date)
+            missed_runs_left = self.get_missed_runs_left(run_date)
+            finished['missed_runs_left'] = missed_runs_left
+            if missed_runs_left and finished['next_run'] is not None:
+                # Make up for missed runs before the next regular one.
+                window = min(
+                    total_seconds(finished['next_run'] - run_date),
+                    CATCH_UP_WINDOW
                 )
-                text_message = html2text(html_message)
-                user_ids.add(sub.user.id)
-                send_multi_mail(
-                    subject, text_message, html_message, from_email,
-                    [sub.user.email], fail_silently=False
+                finished['next_run'] = run_date + timedelta(
+                    seconds=window / (missed_runs_left + 1)
                 )
 
-        for sub in self.subscriber_groups.all():
-            if sub.must_notify():
-                #notify subscribed groups
-                sub.last_notification = datetime.now()
-                sub.save()
-                for user in sub.group.user_set.all():
-                    if not (user.id in user_ids):
-                        #notify users that have not already being notified
-                        html_message = render_to_string(
-                            'kitsune/mail_notification.html',
-                            {'log': self.last_result}
-                        )
-                        text_message = html2text(html_message)
-                        send_multi_mail(
-                            subject, text_message, html_message, from_email,
-                            [user.email], fail_silently=False
-                        )
+        # Commit the result of the run as a whole. The subscribers are only
+        # notified once it is stored, so that a failure while notifying them
+        # can't roll it back.
+        with transaction.commit_on_success():
+            if stdout_str or stderr_str:
+                finished['last_result'] = Log.objects.create(
+                    job=self,
+                    run_date=run_date,
+                    stdout=stdout_str,
+                    stderr=stderr_str,
+                    status_line=status_line,
+                    truncated=truncated,
+                    status_code=status_code,
+                    perfdata=result is not None and result.perfdata or '',
+                    duration=duration,
+                    queue_wait=queue_wait,
+                    **(usage or {})
+                )
+                if stats is not None:
+                    Profile.objects.create(
+                        log=finished['last_result'], stats=encode_stats(stats)
+                    )
+            if 'next_run' in finished:
+                # A dependent marked as unreachable while it ran stays
+                # unscheduled until its parent recovers.
+                next_run = finished.pop('next_run')
+                if Job.objects.filter(pk=self.pk, unreachable=False).update(next_run=next_run):
+                    self.next_run = next_run
+            self.update(**finished)
+            if status_code == STATUS_CRITICAL:
+                self.mark_dependents_unreachable()
+            elif previous_status_code == STATUS_CRITICAL:
+                self.release_dependents()
+            self.delete_old_logs()
+        self.email_subscribers()
+
+    def is_parent_down(self):
+        """
+        Returns True if the last result of the job this job depends on is
+        critical.
+        """
+        if not self.depends_on_id:
+            return False
+        return Job.objects.filter(
+            pk=self.depends_on_id, last_status_code=STATUS_CRITICAL
+        ).exists()
+
+    def mark_dependents_unreachable(self):
+        """
+        Marks the jobs that depend on this one, directly or not, as
+        unreachable and unschedules them until it recovers.
+        """
+        now = datetime.now()
+        pks = [self.pk]
+        while pks:
+            pks = list(Job.objects.filter(
+                depends_on__in=pks, unreachable=False
+            ).exclude(pk=self.pk).values_list('pk', flat=True))
+            if pks:
+                Job.objects.filter(pk__in=pks).update(
+                    unreachable=True, next_run=None, modified=now
+                )
+
+    def release_dependents(self):
+        """
+        Schedules to run now the jobs that depend on this one, directly or
+        not, and were marked as unreachable. The ones that depend on a job
+        that is still critical are marked again when it runs.
+        """
+        now = datetime.now()
+        pks = [self.pk]
+        while pks:
+            pks = list(Job.objects.filter(
+                depends_on__in=pks, unreachable=True
+            ).values_list('pk', flat=True))
+            if pks:
+                Job.objects.filter(pk__in=pks).update(
+                    unreachable=False, next_run=now, modified=now
+                )
+
+    def notify_subscribers(self):
+        """
+        Marks the subscriptions to this job that must notify of its last
+        result as notified and returns the email addresses to notify.
+        """
+        users = list(self.subscriber_users.select_related('user'))
+        groups = list(self.subscriber_groups.all())
+        if not users and not groups:
+            return []
+
+        # Fetch the logs needed by every rule at once.
+        logs = list(self.logs.order_by('-run_date')[
+            :max([sub.rule_N for sub in users + groups] + [1])
+        ])
+        users = [sub for sub in users if sub.must_notify(logs)]
+        groups = [sub for sub in groups if sub.must_notify(logs)]
+
+        now = datetime.now()
+        if users:
+            NotificationUser.objects.filter(
+                pk__in=[sub.pk for sub in users]
+            ).update(last_notification=now)
+        if groups:
+            NotificationGroup.objects.filter(
+                pk__in=[sub.pk for sub in groups]
+            ).update(last_notification=now)
+
+        #notify users that have not already being notified by their groups
+        recipients = [sub.user.email for sub in users]
+        if groups:
+            recipients.extend(User.objects.filter(
+                groups__in=[sub.group_id for sub in groups]
+            ).exclude(
+                id__in=[sub.user_id for sub in users]
+            ).distinct().values_list('email', flat=True))
+        return recipients
+
+    def email_subscribers(self, recipients=None):
+        """
+        Emails the last result of this job to ``recipients``, by default
+        to the subscribers that must be notified of it.
+        """
+        if recipients is None:
+            recipients = self.notify_subscribers()
+        if not recipients:
+            return
+
+        from_email = settings.DEFAULT_FROM_EMAIL
+        subject = 'Kitsune monitoring notification'
+        html_message = render_to_string(
+            'kitsune/mail_notification.html', {'log': self.last_result}
+        )
+        text_message = html2text(html_message)
+        for email in recipients:
+            send_multi_mail(
+                subject, text_message, html_message, from_email,
+                [email], fail_silently=False
+            )
 
     def delete_old_logs(self):
-        log = Log.objects.filter(job=self).order_by('-run_date')[self.last_logs_to_keep]
-        Log.objects.filter(job=self, run_date__lte=log.run_date).delete()
+        """
+        Deletes the logs of this job but the ``last_logs_to_keep`` latest
+        ones. The last result is always kept.
+        """
+        cutoff = Log.objects.filter(job=self).order_by('-run_date').values_list(
+            'run_date', flat=True
+        )[self.last_logs_to_keep:self.last_logs_to_keep + 1]
+        if cutoff:
+            Log.objects.filter(job=self, run_date__lte=cutoff[0]).exclude(
+                pk=self.last_result_id
+            ).delete()
 
     def check_is_running(self):
         """
-        This function actually checks to ensure that a job is running.
+        This function actually checks to ensure that a job is running, by
+        probing its process directly (see ``kitsune.utils.is_kitsune_process``).
         Currently, it only supports `posix` systems.  On non-posix systems
         it returns the value of this job's ``is_running`` field.
         """
-        status = False
         if self.is_running and self.pid is not None:
             # The Job thinks that it is running, so
             # lets actually check
             if os.name == 'posix':
-                # Try to use the 'ps' command to see if the process
-                # is still running
-                pid_re = re.compile(r'%d ([^\r\n]*)\n' % self.pid)
-                p = subprocess.Popen(
-                    ["ps", "-eo", "pid args"], stdout=subprocess.PIPE
-                )
-                p.wait()
-                # If ``pid_re.findall`` returns a match it means that we have a
-                # running process with this ``self.pid``. Now we must check for
-                # the ``run_command`` process with the given ``self.pk``
-                try:
-                    pname = pid_re.findall(p.stdout.read())[0]
-                except IndexError:
-                    pname = ''
-                if pname.find('kitsune_run_job %d' % self.pk) > -1:
+                if is_kitsune_process(self.pid, self.pid_start_time):
                     # This Job is still running
                     return True
-                else:
-                    # This job thinks it is running, but really isn't.
-                    self.is_running = False
-                    self.pid = None
-                    self.save()
+                # This job thinks it is running, but really isn't.
+                Job.objects.release([(self.pk, self.pid)])
+                self.is_running = False
+                self.pid = None
+                self.pid_start_time = None
+                self.claimed_by = ''
             else:
                 # TODO: add support for other OSes
                 return self.is_running
@@ -455,7 +1263,14 @@ class NotificationRule(models.Model):
     def __unicode__(self):
         return u'Notification to:'
 
-    def must_notify(self):
+    def must_notify(self, logs=None):
+        """
+        Returns True if the job must be notified of its last result.
+        ``logs`` are the latest logs of the job, newest first; they are
+        fetched if not given.
+        """
+        if logs is None:
+            logs = self.job.logs.order_by('-run_date')[:self.rule_N]
         if self.enabled:
 
             if self.last_notification is not None:
@@ -472,12 +1287,11 @@ class NotificationRule(models.Model):
                     return False
 
             if self.rule_type == RULE_LAST:
-                return self.job.last_result.get_status_code() >= self.threshold
+                return bool(logs) and logs[0].get_status_code() >= self.threshold
 
             elif self.rule_type == RULE_LAST_N:
                 n = 0
-                logs = self.job.logs.order_by('-run_date')[:self.rule_N]
-                for log in logs:
+                for log in logs[:self.rule_N]:
                     if log.get_status_code() < self.threshold:
                         break
                     else:
@@ -486,8 +1300,7 @@ class NotificationRule(models.Model):
 
             elif self.rule_type == RULE_LAST_N_M:
                 n = 0
-                logs = self.job.logs.order_by('-run_date')[:self.rule_N]
-                for log in logs:
+                for log in logs[:self.rule_N]:
                     if log.get_status_code() >= self.threshold:
                         n += 1
                 return n >= self.rule_M
@@ -507,6 +1320,116 @@ class NotificationGroup(NotificationRule):
     group = models.ForeignKey(Group)
 
 
+class JobBatch(object):
+    """
+    Jobs of the same ``BaseKitsuneBatchCheck`` command and schedule, run by
+    a single invocation of the check. Executors run a batch like a job.
+    """
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.command = jobs[0].command
+        self.pks = [job.pk for job in jobs]
+
+    def __unicode__(self):
+        return u"%s (%d jobs)" % (self.command, len(self.jobs))
+
+    def __str__(self):
+        return smart_str(self.__unicode__())
+
+    def get_timeout(self):
+        timeouts = [job.get_timeout() for job in self.jobs]
+        if None in timeouts:
+            return None
+        return max(timeouts)
+
+    def handle_run(self, queue_wait=None):
+        """
+        Runs the check once for all the jobs and stores the result of every
+        job as if it had run alone.
+        """
+        check = get_kitsune_check(self.command)
+        run_date = datetime.now()
+        pid = os.getpid()
+        Job.objects.filter(pk__in=self.pks).update(
+            is_running=True, pid=pid, pid_start_time=get_process_start_time(pid),
+            modified=run_date
+        )
+        # The single run is profiled for the jobs with runs left to profile.
+        profiled = [job.claim_profile_run() for job in self.jobs]
+        set_run_timeout(self.get_timeout())
+        start = get_usage()
+        profiler = any(profiled) and start_profile() or None
+        try:
+            results = check.run_batch([job.get_args() for job in self.jobs])
+        except SystemExit, e:
+            results = [CheckResult(STATUS_UNKNOWN, unicode(e)) for job in self.jobs]
+        stats = stop_profile(profiler)
+        usage = self.share_usage(get_usage_since(start))
+        set_run_timeout(None)
+        for job, result, profile in zip(self.jobs, results, profiled):
+            job.last_run_successful = True
+            job.finish_run(run_date, queue_wait=queue_wait, result=result,
+                           usage=usage, stats=profile and stats or None)
+
+    def handle_timeout(self, elapsed, queue_wait=None, usage=None):
+        if usage is not None:
+            usage = self.share_usage(usage)
+        for job in self.jobs:
+            job.handle_timeout(elapsed, queue_wait, usage)
+
+    def share_usage(self, usage):
+        """
+        Returns the share of every job of the CPU time in ``usage``.
+        """
+        usage = dict(usage)
+        usage['user_time'] /= len(self.jobs)
+        usage['system_time'] /= len(self.jobs)
+        return usage
+
+
+def group_batches(jobs, size=BATCH_SIZE):
+    """
+    Returns ``jobs`` with the ones of a ``BaseKitsuneBatchCheck`` command
+    that share their schedule grouped in ``JobBatch``es of at most ``size``
+    jobs.
+    """
+    grouped = []
+    batches = {}
+    for job in jobs:
+        if not is_kitsune_batch_check(job.command):
+            grouped.append([job])
+            continue
+        key = (job.command, job.frequency, job.params)
+        if key not in batches or len(batches[key]) >= size:
+            batches[key] = []
+            grouped.append(batches[key])
+        batches[key].append(job)
+    return [len(group) == 1 and group[0] or JobBatch(group) for group in grouped]
+
+
+def run_jobs(pks, queue_wait=None):
+    """
+    Runs the jobs ``pks`` in this process, one after the other but for the
+    jobs of a batch check with the same schedule, which are run by a single
+    invocation of their check (see ``group_batches``).
+    """
+    for job in group_batches(Job.objects.filter(pk__in=pks)):
+        job.handle_run(queue_wait=queue_wait)
+
+
+class LogManager(models.Manager):
+    def prune(self, before):
+        """
+        Deletes the logs run before ``before``, but the last result of every
+        job, which would take the job with it.
+        """
+        last_results = Job.objects.filter(
+            last_result__isnull=False
+        ).values('last_result')
+        self.filter(run_date__lte=before).exclude(pk__in=last_results).delete()
+
+
 class Log(models.Model):
     """
     A record of stdout and stderr of a ``Job``.
@@ -516,6 +1439,23 @@ class Log(models.Model):
     stdout = models.TextField(blank=True)
     stderr = models.TextField(blank=True)
     success = models.BooleanField(default=True)  # , editable=False)
+    queue_wait = models.FloatField(null=True, blank=True, editable=False,
+        help_text=_("Seconds the job waited for a free slot before running."))
+    status_line = models.CharField(max_length=255, blank=True)
+    truncated = models.PositiveIntegerField(default=0, editable=False,
+        help_text=_("Bytes of output dropped from the middle of the output."))
+    status_code = models.IntegerField(null=True, blank=True, editable=False)
+    perfdata = models.TextField(blank=True)
+    duration = models.FloatField(null=True, blank=True, editable=False,
+        help_text=_("Seconds the run took."))
+    user_time = models.FloatField(null=True, blank=True, editable=False,
+        help_text=_("Seconds of user CPU time used by the run."))
+    system_time = models.FloatField(null=True, blank=True, editable=False,
+        help_text=_("Seconds of system CPU time used by the run."))
+    max_rss = models.PositiveIntegerField(null=True, blank=True, editable=False,
+        help_text=_("Maximum resident set size, in kilobytes, of the process that ran the job."))
+
+    objects = LogManager()
 
     class Meta:
         ordering = ('-run_date',)
@@ -530,7 +1470,52 @@ class Log(models.Model):
         )
 
     def get_status_code(self):
-        return int(self.stderr)
+        if self.status_code is not None:
+            return self.status_code
+        # Logs written before the status code had a column of its own.
+        status_code = parse_status_code(self.stderr)
+        if status_code is None:
+            return STATUS_UNKNOWN
+        return status_code
+
+    def get_profile(self):
+        """
+        Returns the ``Profile`` of the run of this log, or None if it wasn't
+        profiled.
+        """
+        try:
+            return self.profile
+        except Profile.DoesNotExist:
+            return None
+
+
+class Profile(models.Model):
+    """
+    The cProfile stats of a profiled run, in the format of
+    ``pstats.Stats.dump_stats`` encoded in base64.
+    """
+    log = models.OneToOneField('Log', related_name='profile')
+    stats = models.TextField()
+
+    def __unicode__(self):
+        return unicode(self.log)
+
+    def get_data(self):
+        """
+        Returns the stats as dumped by ``pstats.Stats.dump_stats``.
+        """
+        return decode_stats(self.stats)
+
+
+def parse_status_code(stderr):
+    """
+    Returns the status code a check printed to ``stderr``, or None if the
+    command printed anything else.
+    """
+    try:
+        return int(stderr)
+    except ValueError:
+        return None
 
 
 class Host(models.Model):
@@ -540,6 +1525,228 @@ class Host(models.Model):
     name = models.CharField(blank=False, max_length=150)
     ip = models.CharField(blank=True, max_length=15)
     description = models.TextField(blank=True)
+    worker_pool_size = models.PositiveIntegerField(null=True, blank=True,
+        help_text=_("Number of worker processes used to run checks on this host. Leave blank to use the default."))
+    max_concurrent_checks = models.PositiveIntegerField(null=True, blank=True,
+        help_text=_("Maximum number of checks run at the same time on this host, further due checks wait in a queue. Leave blank to use the default."))
 
     def __unicode__(self):
         return self.name
+
+
+class Pool(models.Model):
+    """
+    A group of nodes sharing the jobs assigned to it.
+    """
+    name = models.CharField(max_length=150, unique=True)
+    description = models.TextField(blank=True)
+    # Live nodes, comma separated, the jobs were last assigned to.
+    ring = models.TextField(blank=True, editable=False)
+
+    def __unicode__(self):
+        return self.name
+
+    def get_ring(self):
+        return HashRing(self.ring and self.ring.split(',') or [])
+
+    def get_node(self, key):
+        """
+        Returns the node ``key`` is hashed to among the nodes the jobs were
+        last assigned to, or an empty string if there were none.
+        """
+        return self.get_ring().get_node(key) or ''
+
+
+class NodeManager(models.Manager):
+    def heartbeat(self, name=None, pools=None):
+        """
+        Records that the node ``name``, the local host by default, is alive
+        and runs the jobs of ``pools``, the ``KITSUNE_POOLS`` by default.
+        """
+        name = name or gethostname()
+        if pools is None:
+            pools = POOLS
+        now = datetime.now()
+        for pool_name in pools:
+            pool, created = Pool.objects.get_or_create(name=pool_name)
+            if not self.filter(pool=pool, name=name).update(last_heartbeat=now):
+                self.create(pool=pool, name=name, last_heartbeat=now)
+            self.assign_jobs(pool)
+
+    def assign_jobs(self, pool):
+        """
+        Hashes the jobs of ``pool`` to its live nodes and stores the node of
+        every job in ``Job.node``, if the live nodes changed since the jobs
+        were last assigned. Dispatchers then filter on that column instead of
+        hashing every job of their pools. Returns True if the jobs were
+        reassigned.
+        """
+        since = datetime.now() - timedelta(seconds=NODE_TIMEOUT)
+        with transaction.commit_on_success():
+            # Nodes noticing the change at the same time wait for each other.
+            pool = Pool.objects.select_for_update().get(pk=pool.pk)
+            pool_ring = pool.ring
+            pool.ring = ','.join(sorted(self.filter(
+                pool=pool, last_heartbeat__gte=since
+            ).values_list('name', flat=True)))
+            if pool.ring == pool_ring:
+                return False
+            ring = pool.get_ring()
+            moved = {}
+            for pk, node in Job.objects.filter(pool=pool).values_list('pk', 'node'):
+                new_node = ring.get_node(pk) or ''
+                if new_node != node:
+                    moved.setdefault(new_node, []).append(pk)
+            now = datetime.now()
+            for node, pks in moved.items():
+                for i in range(0, len(pks), ASSIGN_CHUNK_SIZE):
+                    Job.objects.filter(pk__in=pks[i:i + ASSIGN_CHUNK_SIZE]).update(
+                        node=node, modified=now
+                    )
+            Pool.objects.filter(pk=pool.pk).update(ring=pool.ring)
+        return True
+
+    def get_pools(self, name=None, pools=None):
+        """
+        Returns the ids of the ``pools``, the ``KITSUNE_POOLS`` by default,
+        that the node ``name``, the local host by default, is a live node of.
+        """
+        name = name or gethostname()
+        if pools is None:
+            pools = POOLS
+        if not pools:
+            return []
+        since = datetime.now() - timedelta(seconds=NODE_TIMEOUT)
+        return list(self.filter(
+            pool__name__in=pools, name=name, last_heartbeat__gte=since
+        ).values_list('pool', flat=True))
+
+    def get_rings(self, name=None, pools=None):
+        """
+        Returns a dict, by pool id, of the ``HashRing``s of the live nodes of
+        the ``pools`` (the ``KITSUNE_POOLS`` by default) that the node
+        ``name``, the local host by default, is a live node of.
+        """
+        name = name or gethostname()
+        if pools is None:
+            pools = POOLS
+        if not pools:
+            return {}
+        since = datetime.now() - timedelta(seconds=NODE_TIMEOUT)
+        nodes = {}
+        for pool_id, node in self.filter(
+            pool__name__in=pools, last_heartbeat__gte=since
+        ).values_list('pool', 'name'):
+            nodes.setdefault(pool_id, []).append(node)
+        return dict([
+            (pool_id, HashRing(names))
+            for pool_id, names in nodes.items() if name in names
+        ])
+
+
+class Node(models.Model):
+    """
+    A dispatcher running the jobs of a pool, live as long as it keeps
+    sending heartbeats.
+    """
+    pool = models.ForeignKey('Pool', related_name='nodes')
+    name = models.CharField(max_length=150)
+    last_heartbeat = models.DateTimeField(null=True, blank=True)
+
+    objects = NodeManager()
+
+    class Meta:
+        unique_together = (('pool', 'name'),)
+
+    def __unicode__(self):
+        return u"%s - %s" % (self.pool, self.name)
+
+    def is_alive(self):
+        return self.last_heartbeat is not None and \
+            self.last_heartbeat >= datetime.now() - timedelta(seconds=NODE_TIMEOUT)
+    is_alive.boolean = True
+
+
+class LeaseManager(models.Manager):
+    def acquire(self, name, owner=None, ttl=LEASE_TTL):
+        """
+        Takes or renews the lease ``name`` for ``owner``, this process by
+        default (see ``get_lease_owner``), for ``ttl`` seconds. Returns False if another owner holds
+        the lease and it hasn't expired.
+        """
+        owner = owner or get_lease_owner()
+        now = datetime.now()
+        expires = now + timedelta(seconds=ttl)
+        # A single conditional update, so that two nodes can't both take
+        # over an expired lease.
+        if self.filter(
+            models.Q(owner=owner) | models.Q(expires__lt=now), name=name
+        ).update(owner=owner, expires=expires):
+            return True
+        try:
+            with transaction.commit_on_success():
+                self.create(name=name, owner=owner, expires=expires)
+        except IntegrityError:
+            return False
+        return True
+
+    def release(self, name, owner=None):
+        """
+        Gives up the lease ``name`` if ``owner``, this process by default,
+        holds it, so that another node can take it right away.
+        """
+        owner = owner or get_lease_owner()
+        self.filter(name=name, owner=owner).update(expires=datetime.now())
+
+    def is_held_on(self, name, hostname=None):
+        """
+        Returns True if a process of ``hostname``, the local host by default,
+        holds the lease ``name``.
+        """
+        return self.filter(
+            name=name, owner__startswith='%s:' % (hostname or gethostname()),
+            expires__gte=datetime.now()
+        ).exists()
+
+
+class Lease(models.Model):
+    """
+    A lock shared by the nodes through the database, held by ``owner`` until
+    ``expires`` unless renewed.
+    """
+    name = models.CharField(max_length=150, unique=True)
+    owner = models.CharField(max_length=150)
+    expires = models.DateTimeField()
+
+    objects = LeaseManager()
+
+    def __unicode__(self):
+        return self.name
+
+    def is_expired(self):
+        return self.expires < datetime.now()
+    is_expired.boolean = True
+
+
+def run_maintenance(owner=None):
+    """
+    Runs the cluster-wide maintenance if ``owner``, this process by default,
+    is the leader, i.e. holds the maintenance lease: releases the
+    pool jobs left running by nodes that are gone and deletes the logs older
+    than ``LOG_RETENTION`` days.
+    Notifications are not part of it: they are emailed by the run that
+    triggers them, there are no digests to send.
+    Returns True if ``owner`` is the leader.
+    """
+    if not Lease.objects.acquire(MAINTENANCE_LEASE, owner):
+        return False
+    Job.objects.release(Job.objects.get_orphaned_runs())
+    if LOG_RETENTION is not None:
+        Log.objects.prune(datetime.now() - timedelta(days=LOG_RETENTION))
+    return True
+
+
+def release_dependents(sender, instance, **kwargs):
+    # Jobs that depended on a deleted job must not stay unreachable.
+    instance.release_dependents()
+models.signals.pre_delete.connect(release_dependents, sender=Job)
@@ -109,6 +109,8 @@ class MonitorResult:
         self.output = ""
         self.error = ""
         self.returncode = 0
+        # bytes dropped from the middle of the output and error, see NagiosPoller.output_limit
+        self.truncated = 0
         self.timestamp = datetime.datetime.now()
         decoded_dict = {'human': ''}
         empty_label = '_'
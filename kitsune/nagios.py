@@ -11,11 +11,27 @@ Created by Joseph Heck on 2009-10-24.
 import os
 import sys
 import re
+import errno
+import signal
+import select
 import subprocess
 import datetime
+from collections import deque
 from monitor import ArgSet
 from monitor import MonitorResult
 from monitor import MonitoringPoller
+from output import BoundedBuffer
+from time import sleep
+from utils import wait_usage, add_child_usage, monotonic
+
+# default number of plugins run at the same time by NagiosPoller.run_plugins
+DEFAULT_CONCURRENCY = 20
+# bytes read from a plugin output at a time
+READ_SIZE = 4096
+# return code of a plugin killed because it timed out, as nagios does
+TIMEOUT_RETURNCODE = 3
+# seconds between two polls of a plugin that closed its output but is still running
+POLL_INTERVAL = 0.1
 
 
 class NagiosPoller(MonitoringPoller):
@@ -32,6 +48,10 @@ class NagiosPoller(MonitoringPoller):
         self._load_plugin_list()
         self.uom_parsecode = re.compile('([\d\.]+)([a-zA-Z%]*)')
         self.poller_kind = "eyeswebapp.util.nagios.NagiosPoller"
+        # seconds after which a plugin is killed, None waits forever
+        self.timeout = None
+        # bytes of each output stream of a plugin kept, its head and tail, None keeps everything
+        self.output_limit = None
 
     def _load_plugin_list(self):
         """ load in the plugins from the directory 'plugin_dir' set on the poller..."""
@@ -51,22 +71,17 @@ class NagiosPoller(MonitoringPoller):
         argset.add_argument('--help')
         return self.run_plugin(plugin_name, argset)
 
-    def _invoke(self, plugin_name, list_of_args=None):
-        """parse and invoke the plugin. method accepts the plugin name and then a list of arguments to be invoked.
-        The return value is either None or a dictionary with the following keys:
-        * command - the command invoked on the command line from the poller
-        * output - the standard output from the command, strip()'d
-        * error - the standard error from the command, strip()'d
+    def _start(self, plugin_name, list_of_args=None):
+        """build the command line of the plugin and start it. returns a tuple of the MonitorResult
+        to fill and the subprocess.Popen object, which is None if the plugin does not exist.
         """
-        if plugin_name is None:
-            return None
         monresult = MonitorResult()
         cmd = os.path.join(self.plugin_dir, plugin_name)
         if not os.path.exists(cmd):
             monresult.error = "No plugin named %s found." % plugin_name
             monresult.timestamp = datetime.datetime.now()
             monresult.returncode = 3
-            return monresult
+            return monresult, None
         if not(list_of_args is None):
             for arg in list_of_args:
                 cmd += " %s" % arg
@@ -75,11 +90,21 @@ class NagiosPoller(MonitoringPoller):
             close_fds = False
         else:
             close_fds = True
-        #
-        process = subprocess.Popen(cmd, shell=True, close_fds=close_fds, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        (stdoutput, stderror) = process.communicate()
+        if os.name == 'posix':
+            # run the plugin in its own process group so that it can be killed along with its children
+            preexec_fn = os.setsid
+        else:
+            preexec_fn = None
+        process = subprocess.Popen(cmd, shell=True, close_fds=close_fds, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   preexec_fn=preexec_fn)
+        return monresult, process
+
+    def _finish(self, monresult, returncode, stdoutput, stderror, truncated=0):
+        """fill the MonitorResult with the outcome of a finished plugin, truncated being the number
+        of bytes dropped from its output"""
         monresult.timestamp = datetime.datetime.now()
-        monresult.returncode = process.returncode
+        monresult.returncode = returncode
+        monresult.truncated = truncated
         if (stdoutput):
             cleaned_out = stdoutput.strip()
             monresult.output = cleaned_out
@@ -89,6 +114,26 @@ class NagiosPoller(MonitoringPoller):
             monresult.error = cleaned_err
         return monresult
 
+    def _invoke(self, plugin_name, list_of_args=None):
+        """parse and invoke the plugin. method accepts the plugin name and then a list of arguments to be invoked.
+        The return value is either None or a dictionary with the following keys:
+        * command - the command invoked on the command line from the poller
+        * output - the standard output from the command, strip()'d
+        * error - the standard error from the command, strip()'d
+        """
+        if plugin_name is None:
+            return None
+        if self.timeout is not None or self.output_limit is not None:
+            # read the output as it comes instead of buffering all of it
+            for index, monresult in self._run_many([(plugin_name, list_of_args)], 1, self.timeout,
+                                                   self.output_limit):
+                return monresult
+        monresult, process = self._start(plugin_name, list_of_args)
+        if process is None:
+            return monresult
+        (stdoutput, stderror) = process.communicate()
+        return self._finish(monresult, process.returncode, stdoutput, stderror)
+
     def run_plugin(self, plugin_name, argset=None):
         """run_plugin is the primary means of invoking a Nagios plugin. It takes a plugin_name, such
         as 'check_ping' and an optional ArgSet object, which contains the arguments to run the plugin
@@ -133,6 +178,142 @@ class NagiosPoller(MonitoringPoller):
             monitor_result = self._invoke(plugin_name, argset.list_of_arguments())  # returns a MonitorResult object
         return monitor_result
 
+    def run_plugins(self, plugins, concurrency=DEFAULT_CONCURRENCY, timeout=None):
+        """run many plugins at once from a single process. plugins is a list of (plugin_name, argset)
+        tuples, argset may be None. at most 'concurrency' plugins run at the same time, the output of
+        all of them is read as it comes with select() so that no plugin blocks the others. a plugin
+        running for more than 'timeout' seconds (the poller timeout by default) is killed. only the
+        head and tail of the output of a plugin are kept past the poller output_limit.
+
+        this is a generator of (index, MonitorResult) tuples, index being the position of the plugin
+        in the list, yielded as the plugins finish.
+
+        >>> xyz = NagiosPoller()
+        >>> disk_argset = ArgSet()
+        >>> disk_argset.add_argument_pair("-w", "10%")
+        >>> disk_argset.add_argument_pair("-c", "5%")
+        >>> for index, monitor_result in xyz.run_plugins([('check_load', None), ('check_disk', disk_argset)]):
+        ...     print index, monitor_result.returncode
+        1 0
+        0 0
+        """
+        if timeout is None:
+            timeout = self.timeout
+        return self._run_many([
+            (plugin_name, argset is not None and argset.list_of_arguments() or None)
+            for plugin_name, argset in plugins
+        ], concurrency, timeout, self.output_limit)
+
+    def _run_many(self, plugins, concurrency, timeout, output_limit=None):
+        """generator behind run_plugins, plugins is a list of (plugin_name, list_of_args) tuples."""
+        pending = deque(enumerate(plugins))
+        runs = []
+        streams = {}  # file descriptor -> (_PluginRun, stream name)
+        while pending or runs:
+            while pending and len(runs) < concurrency:
+                index, (plugin_name, list_of_args) = pending.popleft()
+                monresult, process = self._start(plugin_name, list_of_args)
+                if process is None:
+                    yield index, monresult
+                    continue
+                run = _PluginRun(index, monresult, process, timeout, output_limit)
+                streams[process.stdout.fileno()] = (run, 'stdout')
+                streams[process.stderr.fileno()] = (run, 'stderr')
+                runs.append(run)
+            if not runs:
+                continue
+            wait = None
+            if timeout is not None:
+                wait = max(min([r.deadline for r in runs]) - monotonic(), 0)
+            if len(streams) < 2 * len(runs):
+                # some plugin closed its output, poll it until it exits
+                wait = min(wait is None and POLL_INTERVAL or wait, POLL_INTERVAL)
+            if streams:
+                ready = select.select(list(streams), [], [], wait)[0]
+            else:
+                sleep(wait)
+                ready = []
+            for fd in ready:
+                run, name = streams[fd]
+                data = os.read(fd, READ_SIZE)
+                if data:
+                    run.output[name].write(data)
+                    continue
+                del streams[fd]
+                run.open_streams -= 1
+            for run in [r for r in runs if r.open_streams == 0]:
+                returncode = run.poll()
+                if returncode is not None:
+                    runs.remove(run)
+                    yield run.index, self._finish(run.monresult, returncode,
+                        run.output['stdout'].getvalue(), run.output['stderr'].getvalue(), run.truncated())
+            if timeout is None:
+                continue
+            now = monotonic()
+            for run in [r for r in runs if r.deadline <= now]:
+                runs.remove(run)
+                for fd in run.fds:
+                    streams.pop(fd, None)
+                run.kill()
+                monresult = self._finish(run.monresult, TIMEOUT_RETURNCODE,
+                    run.output['stdout'].getvalue(), run.output['stderr'].getvalue(), run.truncated())
+                monresult.error = ("%s Plugin timed out after %.1f seconds." % (
+                    monresult.error or '', now - run.started)).strip()
+                yield run.index, monresult
+
+
+class _PluginRun(object):
+    """state of a plugin started by NagiosPoller.run_plugins"""
+    def __init__(self, index, monresult, process, timeout=None, output_limit=None):
+        self.index = index
+        self.monresult = monresult
+        self.process = process
+        self.output = {'stdout': BoundedBuffer(output_limit), 'stderr': BoundedBuffer(output_limit)}
+        self.fds = [process.stdout.fileno(), process.stderr.fileno()]
+        self.open_streams = 2
+        self.started = monotonic()
+        if timeout is not None:
+            self.deadline = self.started + timeout
+
+    def truncated(self):
+        """bytes dropped from both output streams"""
+        return self.output['stdout'].truncated + self.output['stderr'].truncated
+
+    def poll(self):
+        """return the return code of the plugin if it exited, else None"""
+        if os.name == 'posix':
+            usage = wait_usage(self.process, nohang=True)
+            if usage is None:
+                return None
+            # Account the plugin to the job of this thread only.
+            add_child_usage(usage)
+        elif self.process.poll() is None:
+            return None
+        self.process.stdout.close()
+        self.process.stderr.close()
+        return self.process.returncode
+
+    def wait(self):
+        self.process.stdout.close()
+        self.process.stderr.close()
+        if os.name == 'posix':
+            # Account the plugin to the job of this thread only.
+            add_child_usage(wait_usage(self.process))
+            return self.process.returncode
+        return self.process.wait()
+
+    def kill(self):
+        """kill the plugin along with every process it started"""
+        try:
+            if os.name == 'posix':
+                os.killpg(self.process.pid, signal.SIGKILL)
+            else:
+                self.process.kill()
+        except OSError, e:
+            if e.errno != errno.ESRCH:
+                raise
+        return self.wait()
+
 # if __name__ == '__main__':
 #     import pprint
 #     xyz = NagiosPoller()
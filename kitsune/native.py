@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -
+'''
+Created on Oct 18, 2026
+
+Helpers of the native checks, pure Python versions of the most common
+Nagios plugins (``kitsune_check_disk``, ``kitsune_check_load``,
+``kitsune_check_procs``, ``kitsune_check_swap`` and ``kitsune_check_tcp``)
+that read the state of the local host instead of starting a plugin.
+
+'''
+
+from kitsune.base import STATUS_OK, STATUS_WARNING, STATUS_CRITICAL, STATUS_UNKNOWN
+
+
+STATUS_NAMES = {
+    STATUS_OK: 'OK',
+    STATUS_WARNING: 'WARNING',
+    STATUS_CRITICAL: 'CRITICAL',
+    STATUS_UNKNOWN: 'UNKNOWN',
+}
+
+# Bytes in each unit accepted by the disk and swap checks.
+UNITS = {
+    'kB': 1024,
+    'MB': 1024 ** 2,
+    'GB': 1024 ** 3,
+    'TB': 1024 ** 4,
+}
+
+
+class Threshold(object):
+    """
+    A Nagios threshold range: ``'10'`` alerts outside of 0 to 10, ``'10:'``
+    below 10, ``'~:10'`` above 10, ``'10:20'`` outside of 10 to 20 and
+    ``'@10:20'`` within 10 to 20.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.inside = spec.startswith('@')
+        if self.inside:
+            spec = spec[1:]
+        if ':' in spec:
+            start, end = spec.split(':', 1)
+        else:
+            start, end = '0', spec
+        if start == '~':
+            self.start = None
+        else:
+            self.start = float(start or 0)
+        if end == '':
+            self.end = None
+        else:
+            self.end = float(end)
+
+    def __str__(self):
+        return self.spec
+
+    def alert(self, value):
+        """
+        Returns True if ``value`` raises an alert.
+        """
+        outside = (self.start is not None and value < self.start) or \
+            (self.end is not None and value > self.end)
+        return outside != self.inside
+
+
+def get_threshold(spec):
+    """
+    Returns the ``Threshold`` of ``spec``, or None if it is empty.
+    """
+    if spec is None or spec == '':
+        return None
+    return Threshold(str(spec))
+
+
+def get_status(value, warning=None, critical=None):
+    """
+    Returns the status of ``value`` against the ``Threshold``s ``warning``
+    and ``critical``, any of them may be None.
+    """
+    if critical is not None and critical.alert(value):
+        return STATUS_CRITICAL
+    if warning is not None and warning.alert(value):
+        return STATUS_WARNING
+    return STATUS_OK
+
+
+def format_number(value):
+    if isinstance(value, float):
+        return ('%.6f' % value).rstrip('0').rstrip('.')
+    return str(value)
+
+
+def format_perfdata(label, value, uom='', warning=None, critical=None,
+                    minimum=None, maximum=None):
+    """
+    Returns the performance data of ``label`` in the Nagios format:
+    ``label=value[uom];[warning];[critical];[minimum];[maximum]``.
+    """
+    fields = [format_number(value) + uom]
+    for field in (warning, critical, minimum, maximum):
+        fields.append(field is not None and format_number(field) or '')
+    if ' ' in label or '=' in label:
+        label = "'%s'" % label
+    return ('%s=%s' % (label, ';'.join(fields))).rstrip(';')
+
+
+def get_options(options):
+    """
+    Returns ``options`` with the names of the options given the Nagios way,
+    eg: ``-w=80%``, stripped of their dashes.
+    """
+    result = dict(options)
+    for name, value in options.items():
+        if name.startswith('-'):
+            result[name.lstrip('-')] = value
+    return result
+
+
+def parse_free_threshold(spec, unit):
+    """
+    Parses the threshold of free space ``spec`` of the disk and swap checks,
+    a percentage (eg: ``'20%'``) or an amount of ``unit``s. Returns a tuple
+    of the minimum value and True if it is a percentage, or None.
+    """
+    if spec is None or spec == '':
+        return None
+    spec = str(spec)
+    if spec.endswith('%'):
+        return float(spec[:-1]), True
+    return float(spec) * UNITS[unit], False
+
+
+def get_free_status(free, total, warning=None, critical=None):
+    """
+    Returns the status of ``free`` bytes out of ``total`` against the
+    thresholds returned by ``parse_free_threshold``.
+    """
+    for threshold, status in ((critical, STATUS_CRITICAL), (warning, STATUS_WARNING)):
+        if threshold is None:
+            continue
+        minimum, percent = threshold
+        if percent:
+            if total and free * 100.0 / total < minimum:
+                return status
+        elif free < minimum:
+            return status
+    return STATUS_OK
+
+
+def get_free_limit(threshold, total):
+    """
+    Returns the bytes of free space at which ``threshold`` raises an alert,
+    for the performance data.
+    """
+    if threshold is None:
+        return None
+    minimum, percent = threshold
+    if percent:
+        return total * minimum / 100.0
+    return minimum
+
+
+def read_meminfo(path='/proc/meminfo'):
+    """
+    Returns the values of ``/proc/meminfo``, in bytes, by name.
+    """
+    values = {}
+    for line in open(path):
+        name, rest = line.split(':', 1)
+        fields = rest.split()
+        value = int(fields[0])
+        if len(fields) > 1 and fields[1] == 'kB':
+            value *= 1024
+        values[name] = value
+    return values
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -
+'''
+Created on Oct 18, 2026
+
+Bounded capture of the output of checks.
+A check or plugin that prints megabytes must not make the process running
+it, nor its log, grow without limit, so only the beginning and the end of
+its output are kept.
+
+'''
+
+from collections import deque
+
+
+class BoundedBuffer(object):
+    """
+    A file-like object keeping the first and the last ``limit / 2`` bytes
+    written to it, and the number of bytes dropped in between in
+    ``truncated``. A ``limit`` of None keeps everything.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.truncated = 0
+        self.softspace = 0
+        self._head = []
+        self._head_size = 0
+        self._tail = deque()
+        self._tail_size = 0
+        if limit is not None:
+            self._max_head = limit // 2
+            self._max_tail = limit - self._max_head
+
+    def write(self, data):
+        if self.limit is None:
+            self._head.append(data)
+            return
+        room = self._max_head - self._head_size
+        if room > 0:
+            self._head.append(data[:room])
+            self._head_size += len(data[:room])
+            data = data[room:]
+        if not data:
+            return
+        self._tail.append(data)
+        self._tail_size += len(data)
+        # Drop whole chunks first, then cut the oldest one left.
+        while self._tail and self._tail_size - len(self._tail[0]) >= self._max_tail:
+            chunk = self._tail.popleft()
+            self._tail_size -= len(chunk)
+            self.truncated += len(chunk)
+        excess = self._tail_size - self._max_tail
+        if excess > 0:
+            self._tail[0] = self._tail[0][excess:]
+            self._tail_size -= excess
+            self.truncated += excess
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        head = ''.join(self._head)
+        tail = ''.join(self._tail)
+        if not self.truncated:
+            return head + tail
+        return '%s\n... [%d bytes truncated] ...\n%s' % (head, self.truncated, tail)
+
+
+def truncate_output(output, limit):
+    """
+    Returns ``output`` cut down to its first and last ``limit / 2`` bytes,
+    and the number of bytes dropped.
+    """
+    if limit is None or len(output) <= limit:
+        return output, 0
+    buf = BoundedBuffer(limit)
+    buf.write(output)
+    return buf.getvalue(), buf.truncated
+
+
+def get_status_line(output):
+    """
+    Returns the first line of ``output``, which holds the status of Nagios
+    plugins and most checks.
+    """
+    return output.lstrip().split('\n', 1)[0].strip()
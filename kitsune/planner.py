@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -
+'''
+Created on Oct 18, 2026
+
+Schedule load planner.
+Projects the runs of the jobs over the next hours and counts them per host,
+second and minute, to spot jobs that all fire at the same time.
+
+'''
+
+from datetime import datetime, timedelta
+
+from kitsune.models import Job
+
+
+class HostPlan(object):
+    """
+    The projected runs of the jobs of a host.
+    """
+
+    def __init__(self, host, start, hours):
+        self.host = host
+        self.start = start
+        self.hours = hours
+        self.per_second = {}
+        self.per_minute = {}
+
+    def add(self, run):
+        second = run.replace(microsecond=0)
+        minute = second.replace(second=0)
+        self.per_second[second] = self.per_second.get(second, 0) + 1
+        self.per_minute[minute] = self.per_minute.get(minute, 0) + 1
+
+    def get_peak(self, counts):
+        if not counts:
+            return None, 0
+        return max(counts.items(), key=lambda item: (item[1], -ord_time(item[0])))
+
+    def get_peak_second(self):
+        """
+        Returns a tuple of the second with the most runs and their number.
+        """
+        return self.get_peak(self.per_second)
+
+    def get_peak_minute(self):
+        """
+        Returns a tuple of the minute with the most runs and their number.
+        """
+        return self.get_peak(self.per_minute)
+
+    def get_heatmap(self):
+        """
+        Returns a list of ``(hour, counts)`` tuples, ``counts`` being the
+        number of runs in each minute of the hour.
+        """
+        rows = []
+        hour = self.start.replace(minute=0, second=0, microsecond=0)
+        for i in range(self.hours + 1):
+            counts = [
+                self.per_minute.get(hour + timedelta(minutes=m), 0)
+                for m in range(60)
+            ]
+            rows.append((hour, counts))
+            hour += timedelta(hours=1)
+        return rows
+
+
+def ord_time(dt):
+    return dt.toordinal() * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second
+
+
+def get_runs(job, start, end):
+    """
+    Returns the runs of ``job`` between ``start`` and ``end``. An overdue
+    job runs at ``start``.
+    """
+    if job.disabled or job.next_run is None:
+        return []
+    schedule = job.get_schedule(max(job.next_run, start))
+    return schedule.between(start, end, inc=True)
+
+
+def plan(jobs=None, start=None, hours=24, stagger=False):
+    """
+    Returns a dict of ``HostPlan``s, by host name, with the runs of ``jobs``
+    (every job by default) in the ``hours`` after ``start``. The jobs of a
+    pool are planned together.
+
+    With ``stagger`` the runs are projected as if every job that can be
+    staggered was.
+    """
+    if jobs is None:
+        jobs = Job.objects.select_related('host', 'pool')
+    start = (start or datetime.now()).replace(microsecond=0)
+    end = start + timedelta(hours=hours)
+    plans = {}
+    for job in jobs:
+        if stagger:
+            job.stagger = True
+        if job.pool_id is None:
+            host = job.host.name
+        else:
+            host = u'%s (pool)' % job.pool.name
+        if host not in plans:
+            plans[host] = HostPlan(host, start, hours)
+        for run in get_runs(job, start, end):
+            plans[host].add(run)
+    return plans
+
+
+def stagger_jobs(jobs=None):
+    """
+    Turns on staggering for every job in ``jobs`` (every job by default)
+    that can be staggered and reschedules it. Returns the jobs changed.
+    """
+    if jobs is None:
+        jobs = Job.objects.filter(stagger=False, disabled=False)
+    now = datetime.now()
+    changed = []
+    for job in jobs:
+        job.stagger = True
+        if job.get_stagger_offset() is None:
+            continue
+        job.next_run = job.get_next_run(now)
+        job.save()
+        changed.append(job)
+    return changed
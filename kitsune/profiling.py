@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -
+'''
+Created on Oct 18, 2026
+
+Profiling of runs of jobs.
+The stats of a profiled run are serialized the way ``pstats`` dumps them to
+a file, so that a download can be read back with ``python -m pstats`` or any
+viewer of cProfile output.
+
+'''
+
+import base64
+import marshal
+import cProfile
+import pstats
+
+
+# Orders of the top functions, by name of the ``pstats`` sort key.
+SORT_CHOICES = (
+    ('cumulative', 'Cumulative time'),
+    ('time', 'Internal time'),
+    ('calls', 'Calls'),
+)
+
+
+class SerializedStats(object):
+    """
+    Loads serialized stats into ``pstats.Stats``, which only reads them
+    from a file or from an object with a ``create_stats`` method.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def create_stats(self):
+        self.stats = marshal.loads(self.data)
+
+
+def start_profile():
+    """
+    Returns a ``cProfile.Profile`` that profiles the current thread.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop_profile(profiler):
+    """
+    Stops ``profiler`` and returns its serialized stats, or None if
+    ``profiler`` is None.
+    """
+    if profiler is None:
+        return None
+    profiler.disable()
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)
+
+
+def encode_stats(data):
+    return base64.b64encode(data)
+
+
+def decode_stats(text):
+    return base64.b64decode(text)
+
+
+def load_stats(data):
+    """
+    Returns the ``pstats.Stats`` of the serialized stats ``data``.
+    """
+    return pstats.Stats(SerializedStats(data))
+
+
+def get_top_functions(data, sort='cumulative', limit=50):
+    """
+    Returns the total seconds of the serialized stats ``data`` and a list of
+    dicts with the stats of its first ``limit`` functions ordered by
+    ``sort``.
+    """
+    stats = load_stats(data)
+    stats.sort_stats(sort)
+    functions = []
+    for func in stats.fcn_list[:limit]:
+        primitive_calls, calls, tottime, cumtime, callers = stats.stats[func]
+        functions.append({
+            'function': pstats.func_std_string(func),
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'tottime': tottime,
+            'cumtime': cumtime,
+            'percall': calls and cumtime / calls or 0,
+        })
+    return stats.total_tt, functions
@@ -20,7 +20,7 @@ from kitsune.base import STATUS_OK, STATUS_WARNING, STATUS_CRITICAL, STATUS_UNKN
 class KitsuneJobRenderer():
     
     def get_html_status(self, log):
-        return render_to_string('kitsune/status_code.html', dictionary={'status_code':int(log.stderr)})
+        return render_to_string('kitsune/status_code.html', dictionary={'status_code':log.get_status_code()})
         
     def get_html_message(self, log):
         result = log.stdout
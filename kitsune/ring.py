@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -
+'''
+Created on Oct 18, 2026
+
+Consistent hashing of jobs to the nodes of a pool.
+Every node owns many points of a hash ring and a job belongs to the node
+owning the first point after the hash of its key, so when a node joins or
+leaves only the jobs next to its points move.
+
+'''
+
+from bisect import bisect
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
+
+
+# Points of the ring owned by every node.
+REPLICAS = 100
+
+
+def _hash(key):
+    return int(md5(key).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """
+    A consistent hash ring of the names in ``nodes``.
+    """
+
+    def __init__(self, nodes, replicas=REPLICAS):
+        self.nodes = sorted(set(nodes))
+        points = []
+        for node in self.nodes:
+            for i in range(replicas):
+                points.append((_hash('%s:%d' % (node, i)), node))
+        points.sort()
+        self._keys = [point for point, node in points]
+        self._nodes = [node for point, node in points]
+
+    def get_node(self, key):
+        """
+        Returns the name of the node ``key`` belongs to, or None if the
+        ring is empty.
+        """
+        if not self._keys:
+            return None
+        index = bisect(self._keys, _hash(str(key))) % len(self._keys)
+        return self._nodes[index]
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -
+'''
+Created on Oct 18, 2026
+
+Compiled job schedules.
+Finding the next run with ``rrule.after`` walks every occurrence since the
+start of the rule, which takes millions of steps for a secondly job that
+has not run for weeks. Schedules that are just a fixed interval are computed
+arithmetically instead, other rules use an ``rrule``.
+
+'''
+
+from datetime import datetime, timedelta
+from dateutil import rrule
+
+
+# Seconds between occurrences of the frequencies with a fixed period.
+FIXED_PERIODS = {
+    "WEEKLY": 7 * 86400,
+    "DAILY": 86400,
+    "HOURLY": 3600,
+    "MINUTELY": 60,
+    "SECONDLY": 1,
+}
+
+# Rules with only these parameters can be computed arithmetically.
+INTERVAL_PARAMS = set(['interval', 'count'])
+
+
+def _microseconds(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+class IntervalSchedule(object):
+    """
+    Runs every ``period`` seconds from ``dtstart``, at most ``count`` times.
+    Equivalent to a secondly to weekly ``rrule`` with only an interval and
+    a count, but finds any occurrence in constant time.
+    """
+
+    def __init__(self, dtstart, period, count=None):
+        self.dtstart = dtstart
+        self.period = period
+        self.count = count
+
+    def _index_after(self, dt, inc=False):
+        if dt < self.dtstart:
+            return 0
+        index, rest = divmod(_microseconds(dt - self.dtstart), self.period * 1000000)
+        if inc and rest == 0:
+            return index
+        return index + 1
+
+    def _occurrence(self, index):
+        if self.count is not None and index >= self.count:
+            return None
+        return self.dtstart + timedelta(seconds=index * self.period)
+
+    def after(self, dt, inc=False):
+        """
+        Returns the first occurrence after ``dt``, or None.
+        """
+        return self._occurrence(self._index_after(dt, inc))
+
+    def between(self, after, before, inc=False):
+        """
+        Returns the occurrences between ``after`` and ``before``.
+        """
+        occurrences = []
+        index = self._index_after(after, inc)
+        occurrence = self._occurrence(index)
+        while occurrence is not None and (occurrence < before or inc and occurrence == before):
+            occurrences.append(occurrence)
+            index += 1
+            occurrence = self._occurrence(index)
+        return occurrences
+
+
+def compile_schedule(frequency, params, dtstart=None):
+    """
+    Returns the schedule of an ``rrule`` of ``frequency`` (the name of an
+    rrule frequency) and ``params`` starting at ``dtstart``, now by default.
+    The returned object has the ``after`` and ``between`` methods of rrule.
+    """
+    # rrule ignores microseconds too.
+    dtstart = (dtstart or datetime.now()).replace(microsecond=0)
+    interval = params.get('interval', 1)
+    count = params.get('count')
+    if (frequency in FIXED_PERIODS and set(params) <= INTERVAL_PARAMS
+            and isinstance(interval, int) and interval > 0
+            and (count is None or isinstance(count, int))):
+        return IntervalSchedule(dtstart, FIXED_PERIODS[frequency] * interval, count)
+
+    # Not cached: the occurrences of a rule depend on its start, which is
+    # the last run of the job, so a compiled rule is never asked twice.
+    return rrule.rrule(getattr(rrule, frequency), dtstart=dtstart, **params)
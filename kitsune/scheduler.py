@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -
+'''
+Created on Oct 18, 2026
+
+Long-running job scheduler.
+Keeps the jobs of the local host in a priority queue ordered by next run
+and only goes back to the database for the rows that changed.
+
+'''
+
+import heapq
+from time import sleep
+from socket import gethostname
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+from kitsune.models import (
+    Job, Node, Lease, run_maintenance, group_batches, LEASE_TTL,
+    MAINTENANCE_LEASE
+)
+from kitsune.executors import get_executor, get_job_pks, POLL_INTERVAL
+from kitsune.utils import monotonic, total_seconds
+
+
+# Seconds between two queries for modified jobs.
+RESYNC_INTERVAL = getattr(settings, 'KITSUNE_RESYNC_INTERVAL', 5)
+
+# Rows saved right before a resync may be committed after it, so every
+# resync looks this far back.
+RESYNC_OVERLAP = timedelta(seconds=5)
+
+# Seconds between two runs of the cluster-wide maintenance, which renew the
+# lease of the leader well before it expires.
+MAINTENANCE_INTERVAL = LEASE_TTL / 3.0
+
+
+class JobScheduler(object):
+    """
+    Dispatches the jobs of a host as they become due.
+
+    Jobs are loaded once and kept in a min-heap of ``(next_run, pk)``. Stale
+    heap entries are discarded lazily when popped, ``_next_runs`` holds the
+    current schedule of every queued job.
+    """
+
+    def __init__(self, hostname=None, resync_interval=RESYNC_INTERVAL):
+        self.hostname = hostname or gethostname()
+        self.resync_interval = resync_interval
+        self._heap = []
+        self._next_runs = {}
+        self._procs = []
+        self._executor = get_executor()
+        self._last_sync = None
+        self._next_sync = 0
+        self._nodes = {}
+        self._next_maintenance = 0
+
+    def get_jobs(self):
+        return Job.objects.for_node(self.hostname)
+
+    def get_nodes(self):
+        """
+        Returns the live nodes of the pools of this host, by pool id.
+        """
+        rings = Node.objects.get_rings(self.hostname)
+        return dict([(pool_id, ring.nodes) for pool_id, ring in rings.items()])
+
+    def schedule(self, pk, next_run, disabled=False, force_run=False):
+        """
+        (Re)schedules the job ``pk``. Disabled and unscheduled jobs are
+        removed from the queue.
+        """
+        if force_run:
+            next_run = datetime.min
+        elif disabled or next_run is None:
+            self._next_runs.pop(pk, None)
+            return
+        if self._next_runs.get(pk) != next_run:
+            self._next_runs[pk] = next_run
+            heapq.heappush(self._heap, (next_run, pk))
+
+    def _schedule_rows(self, queryset):
+        rows = queryset.values_list('pk', 'next_run', 'disabled', 'force_run')
+        for pk, next_run, disabled, force_run in rows:
+            self.schedule(pk, next_run, disabled, force_run)
+
+    def _sync(self, queryset):
+        self._schedule_rows(queryset)
+        self._next_sync = monotonic() + self.resync_interval
+
+    def load(self):
+        """
+        Loads every job of this host, spreading the ones that missed runs
+        while the scheduler was down.
+        """
+        Node.objects.heartbeat(self.hostname)
+        self._nodes = self.get_nodes()
+        Job.objects.spread_missed(self.hostname)
+        self._heap = []
+        self._next_runs = {}
+        self._last_sync = datetime.now()
+        self._sync(self.get_jobs())
+
+    def resync(self):
+        """
+        Reloads the jobs modified since the last synchronization, or every
+        job if nodes joined or left the pools of this host.
+        """
+        Node.objects.heartbeat(self.hostname)
+        if self.get_nodes() != self._nodes:
+            self.load()
+            return
+        since = self._last_sync - RESYNC_OVERLAP
+        self._last_sync = datetime.now()
+        Job.objects.release_stale(self.hostname)
+        self.maintain()
+        self._sync(self.get_jobs().filter(modified__gte=since))
+
+    def maintain(self):
+        """
+        Runs the cluster-wide maintenance, if this host is the leader, every
+        ``MAINTENANCE_INTERVAL`` seconds.
+        """
+        if monotonic() >= self._next_maintenance:
+            run_maintenance()
+            self._next_maintenance = monotonic() + MAINTENANCE_INTERVAL
+
+    def pop_due(self, now=None):
+        """
+        Removes and returns the pks of the jobs due at ``now``.
+        """
+        now = now or datetime.now()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            next_run, pk = heapq.heappop(self._heap)
+            if self._next_runs.get(pk) == next_run:
+                del self._next_runs[pk]
+                due.append(pk)
+        return due
+
+    def run_due(self):
+        """
+        Runs the due jobs and returns the list of jobs started, the due jobs
+        of a batch check being started together as a ``JobBatch``.
+        Finished jobs are saved with a new ``next_run`` and are scheduled
+        again as soon as they are reaped.
+        """
+        claimed = []
+        for pk in self.pop_due():
+            try:
+                job = Job.objects.select_related('host').get(pk=pk)
+            except Job.DoesNotExist:
+                continue
+            if job.claim_due(self.hostname):
+                claimed.append(job)
+            elif job.next_run is not None and job.next_run > datetime.now() \
+                    and job.runs_on(self.hostname):
+                # Our copy of the schedule was stale. Jobs moved to another
+                # node are dropped until a resync brings them back.
+                self.schedule(job.pk, job.next_run, job.disabled, job.force_run)
+        started = group_batches(claimed)
+        for job in started:
+            self._procs.append(self._executor.submit(job))
+        return started
+
+    def reap(self):
+        """
+        Forgets the finished runs and schedules their jobs again right away,
+        instead of waiting for the next resync. Polling a finished run
+        releases its jobs if it ended without storing a result.
+        """
+        running = []
+        pks = []
+        for p in self._procs:
+            if p.poll() is None:
+                running.append(p)
+            else:
+                pks.extend(get_job_pks(p.job))
+        self._procs = running
+        if pks:
+            self._schedule_rows(Job.objects.filter(pk__in=pks))
+
+    def get_timeout(self):
+        """
+        Returns the seconds to sleep until the next job is due or the next
+        resync, whichever comes first.
+        """
+        timeout = max(self._next_sync - monotonic(), 0)
+        if self._procs:
+            # Jobs waiting for a free slot start when running ones finish.
+            timeout = min(timeout, POLL_INTERVAL)
+        if self._heap:
+            delta = total_seconds(self._heap[0][0] - datetime.now())
+            timeout = min(timeout, max(delta, 0))
+        return timeout
+
+    def run_forever(self, callback=None):
+        """
+        Dispatches jobs until interrupted. ``callback`` is called with
+        every job started.
+        """
+        self.load()
+        try:
+            while True:
+                if monotonic() >= self._next_sync:
+                    self.resync()
+                for job in self.run_due():
+                    if callback is not None:
+                        callback(job)
+                self.reap()
+                sleep(self.get_timeout())
+        finally:
+            self._executor.shutdown(wait=False)
+            # Let another node take over the maintenance right away.
+            Lease.objects.release(MAINTENANCE_LEASE)
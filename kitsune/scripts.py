@@ -11,8 +11,14 @@ Test scripts.
 __author__      = "Raul Garreta (raul@tryolabs.com)"
 
 
+import timeit
+from datetime import datetime, timedelta
+
+from dateutil import rrule
+
 from nagios import NagiosPoller
 from monitor import ArgSet
+from schedule import compile_schedule
 
 
 def check_http():
@@ -52,4 +58,25 @@ def check_pgsql():
     args.add_argument_pair("-d", "daywatch_db")
     args.add_argument_pair("-p", "postgres")
     res = poller.run_plugin('check_pgsql', args)
-    print "\n",res.command,"\nRET CODE:\t",res.returncode,"\nOUT:\t\t",res.output,"\nERR:\t\t",res.error
\ No newline at end of file
+    print "\n",res.command,"\nRET CODE:\t",res.returncode,"\nOUT:\t\t",res.output,"\nERR:\t\t",res.error
+
+
+def benchmark_schedule(frequency='SECONDLY', params={'interval': 1}, repeat=3):
+    """
+    Compares the time taken to find the next run of a job that last ran
+    longer and longer ago, with ``rrule.after`` and with a compiled schedule.
+    """
+    now = datetime.now()
+    print "\n", frequency, params
+    print "%-12s%16s%16s" % ("last run", "rrule (ms)", "compiled (ms)")
+    for days in (0, 1, 7, 30, 365):
+        dtstart = now - timedelta(days=days, minutes=1)
+        if days <= 7:
+            rule = rrule.rrule(getattr(rrule, frequency), dtstart=dtstart, **params)
+            t_rrule = "%.3f" % (min(timeit.repeat(lambda: rule.after(now), number=1, repeat=repeat)) * 1000)
+        else:
+            t_rrule = "(skipped)"
+        t_compiled = min(timeit.repeat(
+            lambda: compile_schedule(frequency, params, dtstart).after(now), number=1, repeat=repeat
+        )) * 1000
+        print "%-12s%16s%16.3f" % ("%d days ago" % days, t_rrule, t_compiled)
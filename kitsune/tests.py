@@ -0,0 +1,1156 @@
+# -*- coding: utf-8 -
+'''
+Created on Oct 18, 2026
+
+Kitsune tests.
+
+'''
+
+import os
+import sys
+import time
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import warnings
+from StringIO import StringIO
+from socket import gethostname
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from dateutil import rrule
+
+from django.test import TestCase, TransactionTestCase
+from django.utils import unittest
+
+from kitsune.base import (
+    BaseKitsuneCheck, BaseKitsuneBatchCheck, CheckResult, STATUS_OK,
+    STATUS_WARNING, STATUS_CRITICAL, STATUS_UNKNOWN
+)
+from kitsune.cache import get_or_run, get_result_cache
+from kitsune import executors
+from kitsune.executors import (
+    LimitedExecutor, SubprocessTask, ThreadPoolExecutor, WorkerPoolExecutor
+)
+from kitsune.management.commands import kitsune_check_tcp
+from kitsune import models
+from kitsune.models import (
+    Job, Host, Node, Pool, Lease, Log, NotificationUser, RULE_LAST
+)
+from kitsune.monitor import ArgSet
+from kitsune.nagios import NagiosPoller, TIMEOUT_RETURNCODE
+from kitsune.native import (
+    Threshold, get_status, get_options, parse_free_threshold, get_free_status,
+    format_perfdata
+)
+from kitsune.output import BoundedBuffer, truncate_output
+from kitsune.planner import plan
+from kitsune.profiling import (
+    start_profile, stop_profile, encode_stats, decode_stats, get_top_functions
+)
+from kitsune.schedule import IntervalSchedule, FIXED_PERIODS, compile_schedule
+from kitsune.scheduler import JobScheduler
+from kitsune.utils import monotonic, get_process_start_time, is_kitsune_process
+
+
+class AttributeCheck(BaseKitsuneCheck):
+    def check(self, *args, **options):
+        self.status_code = STATUS_WARNING
+        self.status_message = 'low on %s' % args[0]
+        self.perfdata = 'free=1'
+
+
+class FailingCheck(BaseKitsuneCheck):
+    def check(self, *args, **options):
+        raise ValueError('broken')
+
+
+class SleepCheck(BaseKitsuneCheck):
+    def check(self, *args, **options):
+        time.sleep(30)
+
+
+class ArgsCheck(BaseKitsuneCheck):
+    def check(self, *args, **options):
+        time.sleep(0.3)
+        self.status_code = int(args[0])
+        self.status_message = args[1]
+
+
+class InterruptedCheck(BaseKitsuneCheck):
+    def check(self, *args, **options):
+        raise KeyboardInterrupt
+
+
+def shares_database():
+    """
+    Returns True if the test database is seen by other threads and
+    processes, which an in-memory sqlite database is not.
+    """
+    database = settings.DATABASES['default']
+    return not (database['ENGINE'].endswith('sqlite3') and
+                database.get('TEST_NAME') in (None, '', ':memory:'))
+
+
+def is_group_alive(pgid, grace=1):
+    """
+    Returns True if a process of the process group ``pgid``, other than a
+    zombie, is still running after ``grace`` seconds. Killed children of a
+    process are not waited for and take a moment to die.
+    """
+    deadline = monotonic() + grace
+    while True:
+        alive = False
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit():
+                continue
+            try:
+                stat = open('/proc/%s/stat' % pid).read()
+            except (IOError, OSError):
+                continue
+            fields = stat[stat.rindex(')') + 2:].split()
+            if fields[0] != 'Z' and int(fields[2]) == pgid:
+                alive = True
+                break
+        if not alive or monotonic() >= deadline:
+            return alive
+        time.sleep(0.05)
+
+
+class RunCheckTest(unittest.TestCase):
+    def test_result_from_attributes(self):
+        result = AttributeCheck().run_check('disk')
+        self.assertEqual(
+            (result.status_code, result.message, result.perfdata),
+            (STATUS_WARNING, 'low on disk', 'free=1')
+        )
+        self.assertTrue(result.duration >= 0)
+
+    def test_returned_result(self):
+        check = AttributeCheck()
+        check.check = lambda *args, **options: CheckResult(STATUS_CRITICAL, 'down', duration=2)
+        result = check.run_check()
+        self.assertEqual((result.status_code, result.message), (STATUS_CRITICAL, 'down'))
+        self.assertEqual(result.duration, 2)
+
+    def test_failure_is_unknown(self):
+        result = FailingCheck().run_check()
+        self.assertEqual(result.status_code, STATUS_UNKNOWN)
+        self.assertTrue(result.message.startswith('broken Trace: '))
+
+
+class BoundedBufferTest(unittest.TestCase):
+    def test_unbounded(self):
+        buf = BoundedBuffer()
+        buf.write('a' * 1000)
+        buf.write('b')
+        self.assertEqual(buf.getvalue(), 'a' * 1000 + 'b')
+        self.assertEqual(buf.truncated, 0)
+
+    def test_under_limit(self):
+        buf = BoundedBuffer(100)
+        buf.write('a' * 60)
+        buf.write('b' * 40)
+        self.assertEqual(buf.getvalue(), 'a' * 60 + 'b' * 40)
+        self.assertEqual(buf.truncated, 0)
+
+    def test_keeps_head_and_tail(self):
+        buf = BoundedBuffer(100)
+        buf.write('h' * 50)
+        for i in range(90):
+            buf.write('m' * 10)
+        buf.write('t' * 50)
+        self.assertEqual(buf.truncated, 900)
+        self.assertEqual(
+            buf.getvalue(),
+            'h' * 50 + '\n... [900 bytes truncated] ...\n' + 't' * 50
+        )
+
+    def test_cuts_chunk(self):
+        buf = BoundedBuffer(10)
+        buf.write('0123456789abcdef')
+        self.assertEqual(buf.truncated, 6)
+        self.assertEqual(buf.getvalue(), '01234\n... [6 bytes truncated] ...\nbcdef')
+
+    def test_zero_limit(self):
+        buf = BoundedBuffer(0)
+        buf.write('abc')
+        buf.write('def')
+        self.assertEqual(buf.truncated, 6)
+        self.assertEqual(buf.getvalue(), '\n... [6 bytes truncated] ...\n')
+
+
+class TruncateOutputTest(unittest.TestCase):
+    def test_no_limit(self):
+        self.assertEqual(truncate_output('a' * 1000, None), ('a' * 1000, 0))
+
+    def test_under_limit(self):
+        self.assertEqual(truncate_output('abc', 3), ('abc', 0))
+
+    def test_over_limit(self):
+        output, truncated = truncate_output('a' * 50 + 'b' * 900 + 'c' * 50, 100)
+        self.assertEqual(truncated, 900)
+        self.assertEqual(output, 'a' * 50 + '\n... [900 bytes truncated] ...\n' + 'c' * 50)
+
+
+@unittest.skipUnless(os.path.isdir('/proc'), 'Needs /proc')
+class ProcessIdentityTest(unittest.TestCase):
+    def test_current_process(self):
+        start_time = get_process_start_time(os.getpid())
+        self.assertTrue(start_time > 0)
+        self.assertTrue(is_kitsune_process(os.getpid(), start_time))
+
+    def test_dead_process(self):
+        process = subprocess.Popen(['true'])
+        process.wait()
+        self.assertEqual(get_process_start_time(process.pid), None)
+        self.assertFalse(is_kitsune_process(process.pid))
+        self.assertFalse(is_kitsune_process(process.pid, 1))
+
+    def test_recycled_pid(self):
+        start_time = get_process_start_time(os.getpid())
+        # Another process got the pid of a job that started earlier.
+        self.assertFalse(is_kitsune_process(os.getpid(), start_time - 1))
+
+    def test_command_line(self):
+        process = subprocess.Popen(['sh', '-c', 'sleep 30', 'kitsune_run_job'])
+        try:
+            self.assertTrue(is_kitsune_process(process.pid))
+        finally:
+            process.kill()
+            process.wait()
+
+
+class IntervalScheduleTest(unittest.TestCase):
+    def test_matches_rrule(self):
+        dtstart = datetime(2026, 10, 18, 10, 30, 15)
+        for frequency, seconds in FIXED_PERIODS.items():
+            for params in ({}, {'interval': 7}, {'count': 5}, {'interval': 3, 'count': 4}):
+                schedule = compile_schedule(frequency, params, dtstart)
+                self.assertTrue(isinstance(schedule, IntervalSchedule))
+                rule = rrule.rrule(getattr(rrule, frequency), dtstart=dtstart, **params)
+                period = seconds * params.get('interval', 1)
+                dts = [dtstart - timedelta(seconds=1)]
+                for i in range(8):
+                    for offset in (0, period / 2, period - 1):
+                        dts.append(dtstart + timedelta(seconds=i * period + offset))
+                for dt in dts:
+                    for inc in (False, True):
+                        self.assertEqual(
+                            schedule.after(dt, inc), rule.after(dt, inc),
+                            (frequency, params, dt, inc)
+                        )
+                self.assertEqual(
+                    schedule.between(dts[0], dts[-1]), rule.between(dts[0], dts[-1])
+                )
+
+    def test_other_rules_use_rrule(self):
+        schedule = compile_schedule('HOURLY', {'byminute': [0, 30]})
+        self.assertTrue(isinstance(schedule, rrule.rrule))
+        schedule = compile_schedule('MONTHLY', {})
+        self.assertTrue(isinstance(schedule, rrule.rrule))
+
+
+class NativeTest(unittest.TestCase):
+    def assertAlerts(self, spec, alerting, quiet):
+        threshold = Threshold(spec)
+        for value in alerting:
+            self.assertTrue(threshold.alert(value), (spec, value))
+        for value in quiet:
+            self.assertFalse(threshold.alert(value), (spec, value))
+
+    def test_threshold(self):
+        self.assertAlerts('10', [-1, 10.5], [0, 5, 10])
+        self.assertAlerts('10:', [9.9], [10, 1000])
+        self.assertAlerts('~:10', [11], [-1000, 10])
+        self.assertAlerts('10:20', [9, 21], [10, 15, 20])
+        self.assertAlerts('@10:20', [10, 15, 20], [9, 21])
+
+    def test_status(self):
+        warning, critical = Threshold('5'), Threshold('10')
+        self.assertEqual(get_status(1, warning, critical), STATUS_OK)
+        self.assertEqual(get_status(6, warning, critical), STATUS_WARNING)
+        self.assertEqual(get_status(11, warning, critical), STATUS_CRITICAL)
+        self.assertEqual(get_status(11), STATUS_OK)
+
+    def test_free_threshold(self):
+        self.assertEqual(parse_free_threshold('20%', 'MB'), (20.0, True))
+        self.assertEqual(parse_free_threshold('2', 'GB'), (2.0 * 1024 ** 3, False))
+        self.assertEqual(parse_free_threshold('', 'MB'), None)
+        warning = parse_free_threshold('20%', 'MB')
+        critical = parse_free_threshold('100', 'MB')
+        mb = 1024 ** 2
+        self.assertEqual(get_free_status(500 * mb, 1000 * mb, warning, critical), STATUS_OK)
+        self.assertEqual(get_free_status(150 * mb, 1000 * mb, warning, critical), STATUS_WARNING)
+        self.assertEqual(get_free_status(50 * mb, 1000 * mb, warning, critical), STATUS_CRITICAL)
+
+    def test_options(self):
+        options = get_options({'-w': '80%', '--critical': '90%', 'p': '/'})
+        self.assertEqual((options['w'], options['critical'], options['p']), ('80%', '90%', '/'))
+
+    def test_perfdata(self):
+        self.assertEqual(format_perfdata('/', 10.5, 'MB', 80, 90, 0, 100), '/=10.5MB;80;90;0;100')
+        self.assertEqual(format_perfdata('load 1', 0.25), "'load 1'=0.25")
+
+
+class CheckTcpTest(unittest.TestCase):
+    def setUp(self):
+        self.getaddrinfo = socket.getaddrinfo
+
+    def tearDown(self):
+        socket.getaddrinfo = self.getaddrinfo
+
+    def test_connect(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        try:
+            elapsed = kitsune_check_tcp.connect('127.0.0.1', server.getsockname()[1], 1)
+        finally:
+            server.close()
+        self.assertTrue(0 <= elapsed < 1)
+
+    def test_name_resolution_counts_against_timeout(self):
+        def getaddrinfo(*args):
+            time.sleep(1)
+            return self.getaddrinfo(*args)
+        socket.getaddrinfo = getaddrinfo
+        started = monotonic()
+        self.assertRaises(socket.timeout, kitsune_check_tcp.connect, 'localhost', 80, 0.2)
+        self.assertTrue(monotonic() - started < 0.5)
+
+    def test_unknown_host(self):
+        def getaddrinfo(*args):
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        socket.getaddrinfo = getaddrinfo
+        self.assertRaises(socket.error, kitsune_check_tcp.connect, 'nowhere', 80, 1)
+
+
+class PluginPoller(NagiosPoller):
+    def _load_plugin_list(self):
+        pass
+
+
+# Prints 1000 bytes to each of its output streams.
+VERBOSE_PLUGIN = "printf '%01000d' 0\nprintf '%01000d' 1 >&2\nexit 1\n"
+
+
+def write_plugin(plugin_dir, name, script):
+    path = os.path.join(plugin_dir, name)
+    plugin = open(path, 'w')
+    plugin.write('#!/bin/sh\n' + script)
+    plugin.close()
+    os.chmod(path, 0755)
+
+
+class NagiosOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.poller = PluginPoller()
+        self.poller.plugin_dir = tempfile.mkdtemp()
+        write_plugin(self.poller.plugin_dir, 'check_verbose', VERBOSE_PLUGIN)
+
+    def tearDown(self):
+        shutil.rmtree(self.poller.plugin_dir)
+
+    def test_bounded_output(self):
+        self.poller.output_limit = 100
+        result = self.poller.run_plugin('check_verbose')
+        self.assertEqual(result.returncode, 1)
+        self.assertEqual(result.truncated, 1800)
+        self.assertEqual(result.output, '0' * 50 + '\n... [900 bytes truncated] ...\n' + '0' * 50)
+
+    def test_unbounded_output(self):
+        result = self.poller.run_plugin('check_verbose')
+        self.assertEqual(result.truncated, 0)
+        self.assertEqual(len(result.output), 1000)
+
+
+class RunPluginsTest(unittest.TestCase):
+    def setUp(self):
+        self.poller = PluginPoller()
+        self.poller.plugin_dir = tempfile.mkdtemp()
+        write_plugin(self.poller.plugin_dir, 'check_slow', 'sleep $1\necho slept $1\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.poller.plugin_dir)
+
+    def test_plugins_run_concurrently(self):
+        delays = ['0.8', '0.2', '0.6', '0.4']
+        plugins = []
+        for delay in delays:
+            argset = ArgSet()
+            argset.add_argument(delay)
+            plugins.append(('check_slow', argset))
+        started = monotonic()
+        results = list(self.poller.run_plugins(plugins))
+        # The plugins took as long as the slowest one, not the 2 s they add up to.
+        self.assertTrue(monotonic() - started < 1.5)
+        self.assertEqual([index for index, result in results], [1, 3, 2, 0])
+        for index, result in results:
+            self.assertEqual(result.output, 'slept %s' % delays[index])
+
+
+# Starts a child and writes the process group of the plugin to the file $1.
+SLEEPING_PLUGIN = "awk '{print $5}' /proc/$$/stat > $1\nsleep 30 &\nsleep 30\n"
+
+
+@unittest.skipUnless(os.path.isdir('/proc'), 'Needs /proc')
+class NagiosTimeoutTest(unittest.TestCase):
+    def setUp(self):
+        self.poller = PluginPoller()
+        self.poller.plugin_dir = tempfile.mkdtemp()
+        self.poller.timeout = 0.5
+        self.pgid_file = os.path.join(self.poller.plugin_dir, 'pgid')
+        write_plugin(self.poller.plugin_dir, 'check_sleep', SLEEPING_PLUGIN)
+        write_plugin(self.poller.plugin_dir, 'check_silent',
+                     'exec >/dev/null 2>&1\nsleep 30\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.poller.plugin_dir)
+
+    def test_plugin_is_killed(self):
+        argset = ArgSet()
+        argset.add_argument(self.pgid_file)
+        started = monotonic()
+        result = self.poller.run_plugin('check_sleep', argset)
+        self.assertTrue(monotonic() - started < 5)
+        self.assertEqual(result.returncode, TIMEOUT_RETURNCODE)
+        self.assertTrue('timed out' in result.error)
+        self.assertFalse(is_group_alive(int(open(self.pgid_file).read())))
+
+    def test_plugin_without_output_is_killed(self):
+        started = monotonic()
+        result = self.poller.run_plugin('check_silent')
+        self.assertTrue(monotonic() - started < 5)
+        self.assertEqual(result.returncode, TIMEOUT_RETURNCODE)
+
+
+class GetOrRunTest(unittest.TestCase):
+    def setUp(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            self.cache = get_result_cache()
+        self.cache.clear()
+
+    def test_reuses_result(self):
+        runs = []
+        def run():
+            runs.append(1)
+            return CheckResult(0, 'ok')
+        get_or_run('test', 60, run)
+        result = get_or_run('test', 60, run)
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(result.message, 'ok')
+
+    def test_keeps_lock_of_other_run(self):
+        def run():
+            # The lock expired and another run took it.
+            self.cache.set('test:running', 'other')
+            return CheckResult(0, 'ok')
+        get_or_run('test', 60, run)
+        self.assertEqual(self.cache.get('test:running'), 'other')
+
+    def test_releases_own_lock(self):
+        get_or_run('test', 60, lambda: CheckResult(0, 'ok'))
+        self.assertEqual(self.cache.get('test:running'), None)
+
+
+class DueJobsTest(TestCase):
+    def setUp(self):
+        a, b = Host.objects.create(name='a'), Host.objects.create(name='b')
+        past = datetime.now() - timedelta(minutes=1)
+        future = datetime.now() + timedelta(hours=1)
+        self.pks = {}
+        for name, host, fields in (
+            ('due', a, dict(next_run=past)),
+            ('later', a, dict(next_run=future)),
+            ('forced', a, dict(next_run=future, force_run=True)),
+            ('running', a, dict(next_run=past, is_running=True)),
+            ('disabled', a, dict(next_run=past, disabled=True)),
+            ('unreachable', a, dict(next_run=past, unreachable=True)),
+            ('other', b, dict(next_run=past - timedelta(minutes=1))),
+        ):
+            job = Job(name=name, host=host, command='kitsune_base_check',
+                      frequency='HOURLY')
+            job.save()
+            Job.objects.filter(pk=job.pk).update(**fields)
+            self.pks[name] = job.pk
+
+    def get_names(self, queryset):
+        return [job.name for job in queryset]
+
+    def test_due_of_host(self):
+        self.assertEqual(self.get_names(Job.objects.due('a')), ['due', 'forced'])
+
+    def test_due_of_every_host(self):
+        self.assertEqual(
+            self.get_names(Job.objects.due()), ['other', 'due', 'forced']
+        )
+
+    def test_for_node(self):
+        self.assertEqual(Job.objects.for_node('a').count(), 6)
+        self.assertEqual(self.get_names(Job.objects.for_node('b')), ['other'])
+        self.assertEqual(Job.objects.for_node('c').count(), 0)
+
+
+class FinishRunTest(TestCase):
+    def setUp(self):
+        self.job = Job(
+            name='test', host=Host.objects.create(name='test'),
+            command='kitsune_base_check', frequency='HOURLY', output_limit=100
+        )
+        self.job.save()
+
+    def test_captured_output_is_not_truncated_again(self):
+        buf = BoundedBuffer(self.job.get_output_limit())
+        buf.write('x' * 1000)
+        self.job.finish_run(datetime.now(), buf.getvalue(), truncated=buf.truncated)
+        log = Job.objects.get(pk=self.job.pk).last_result
+        self.assertEqual(log.truncated, 900)
+        self.assertEqual(log.stdout, buf.getvalue())
+
+    def test_bounded_result_is_not_truncated_again(self):
+        message = ' NAGIOS_OUT:  %s<br>NAGIOS_ERR:  %s' % ('x' * 100, 'y' * 100)
+        result = CheckResult(STATUS_OK, message, truncated=1800)
+        self.job.finish_run(datetime.now(), result=result)
+        log = Job.objects.get(pk=self.job.pk).last_result
+        self.assertEqual(log.truncated, 1800)
+        self.assertEqual(log.stdout, message)
+
+    def test_cached_result_is_not_truncated_again(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            get_result_cache().clear()
+        self.poller = PluginPoller()
+        self.poller.plugin_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.poller.plugin_dir)
+        write_plugin(self.poller.plugin_dir, 'check_verbose', VERBOSE_PLUGIN)
+        self.poller.output_limit = self.job.get_output_limit()
+
+        class PluginCheck(object):
+            def run_check(check, *args, **options):
+                res = self.poller.run_plugin('check_verbose')
+                return CheckResult(res.returncode, res.output, truncated=res.truncated)
+
+        self.job.result_cache_ttl = 60
+        logs = []
+        for i in range(2):
+            result = self.job.get_result(PluginCheck(), [], {})
+            self.job.finish_run(datetime.now(), result=result)
+            logs.append(Job.objects.get(pk=self.job.pk).last_result)
+        self.assertEqual(logs[0].truncated, 1800)
+        self.assertEqual(
+            (logs[1].stdout, logs[1].truncated), (logs[0].stdout, logs[0].truncated)
+        )
+
+    def test_next_run_starts_at_run(self):
+        # An interval and an rrule with the same occurrences.
+        for params in ('interval:2', 'interval:2;byweekday:0,1,2,3,4,5,6'):
+            self.job.params = params
+            self.job.last_run = datetime(2026, 10, 18, 10, 0)
+            self.job.save()
+            self.job.finish_run(datetime(2026, 10, 18, 12, 30), 'late')
+            self.assertEqual(
+                Job.objects.get(pk=self.job.pk).next_run,
+                datetime(2026, 10, 18, 14, 30)
+            )
+
+    def test_unknown_stderr_is_logged_and_notified(self):
+        user = User.objects.create(username='test', email='test@example.com')
+        NotificationUser.objects.create(
+            job=self.job, user=user, threshold=STATUS_WARNING,
+            rule_type=RULE_LAST, interval_unit='Hours'
+        )
+        self.job.update(is_running=True)
+        self.job.finish_run(datetime.now(), 'done', 'DeprecationWarning: old')
+        job = Job.objects.get(pk=self.job.pk)
+        self.assertFalse(job.is_running)
+        self.assertEqual(job.last_result.status_code, STATUS_UNKNOWN)
+        # The email itself is sent by a thread.
+        self.assertNotEqual(
+            NotificationUser.objects.get(user=user).last_notification, None
+        )
+
+    def test_old_log_without_status_code(self):
+        log = Log(job=self.job, stderr='DeprecationWarning: old')
+        self.assertEqual(log.get_status_code(), STATUS_UNKNOWN)
+        self.assertEqual(Log(job=self.job, stderr='1').get_status_code(), 1)
+
+    def test_unreachable_dependent_stays_unscheduled(self):
+        dependent = Job(
+            name='dependent', host=self.job.host, command='kitsune_base_check',
+            frequency='HOURLY', depends_on=self.job
+        )
+        dependent.save()
+        # The parent goes critical while the dependent is running.
+        self.job.finish_run(datetime.now(), 'down', '2')
+        dependent.finish_run(datetime.now(), 'ok')
+        dependent = Job.objects.get(pk=dependent.pk)
+        self.assertTrue(dependent.unreachable)
+        self.assertEqual(dependent.next_run, None)
+
+    def test_unreachable_job_is_not_due(self):
+        Job.objects.filter(pk=self.job.pk).update(
+            unreachable=True, next_run=datetime(2026, 1, 1)
+        )
+        self.assertFalse(Job.objects.due().filter(pk=self.job.pk).exists())
+        self.assertFalse(Job.objects.get(pk=self.job.pk).is_due())
+
+
+class EchoBatchCheck(BaseKitsuneBatchCheck):
+    def check_batch(self, targets):
+        return [CheckResult(STATUS_OK, ' '.join(args)) for args, options in targets]
+
+
+class BatchTest(TestCase):
+    def setUp(self):
+        executors._command_classes['kitsune_test_batch'] = EchoBatchCheck
+        self.host = Host.objects.create(name='test')
+        self.jobs = [self.create_job('target%d' % i) for i in range(5)]
+
+    def tearDown(self):
+        del executors._command_classes['kitsune_test_batch']
+
+    def create_job(self, args, command='kitsune_test_batch', params=None):
+        job = Job(name=args, host=self.host, command=command, args=args,
+                  frequency='HOURLY', params=params)
+        job.save()
+        return job
+
+    def test_group_batches(self):
+        single = self.create_job('', command='kitsune_test_check')
+        other = self.create_job('other', params='interval:2')
+        grouped = models.group_batches(self.jobs + [single, other], size=2)
+        self.assertEqual(len(grouped), 5)
+        self.assertEqual([batch.pks for batch in grouped[:2]], [
+            [job.pk for job in self.jobs[:2]], [job.pk for job in self.jobs[2:4]]
+        ])
+        # Groups of one job are run as a job.
+        self.assertEqual(grouped[2:], [self.jobs[4], single, other])
+
+    def test_one_log_per_job(self):
+        batch = models.group_batches(self.jobs)[0]
+        batch.handle_run()
+        for job in self.jobs:
+            job = Job.objects.get(pk=job.pk)
+            self.assertFalse(job.is_running)
+            self.assertEqual(job.last_result.stdout, job.args)
+            self.assertEqual(job.last_result.status_code, STATUS_OK)
+        self.assertEqual(Log.objects.count(), 5)
+
+
+class RunJobsTest(TestCase):
+    def test_unrelated_jobs_run_their_own_check(self):
+        host = Host.objects.create(name='test')
+        pks = []
+        for command in ('kitsune_test_check', 'kitsune_check_disk'):
+            job = Job(name=command, host=host, command=command, frequency='HOURLY')
+            job.save()
+            pks.append(job.pk)
+        models.run_jobs(pks)
+        test_check, check_disk = [Job.objects.get(pk=pk).last_result for pk in pks]
+        self.assertEqual(test_check.stdout, 'OK message')
+        self.assertTrue(check_disk.stdout.startswith('DISK '))
+
+
+class FakeTask(object):
+    def __init__(self, job):
+        self.job = job
+        self.returncode = None
+        self.polls = 0
+
+    def poll(self):
+        self.polls += 1
+        return self.returncode
+
+
+class FakeExecutor(object):
+    def __init__(self):
+        self.tasks = []
+
+    def submit(self, job, queue_wait=None):
+        self.tasks.append(FakeTask(job))
+        return self.tasks[-1]
+
+    def finish(self, task):
+        Job.objects.filter(pk=task.job.pk).update(
+            is_running=False, run_slot=''
+        )
+        task.returncode = 0
+
+
+class FakeProcess(object):
+    def __init__(self, returncode):
+        self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+
+class ClaimTest(TestCase):
+    def setUp(self):
+        job = Job(name='test', host=Host.objects.create(name=gethostname()),
+                  command='kitsune_base_check', frequency='HOURLY')
+        job.save()
+        Job.objects.filter(pk=job.pk).update(next_run=datetime(2026, 1, 1))
+        self.job = Job.objects.get(pk=job.pk)
+
+    def test_job_run_meanwhile_is_not_claimed(self):
+        # Another dispatcher ran the job since it was loaded.
+        Job.objects.filter(pk=self.job.pk).update(
+            next_run=datetime.now() + timedelta(hours=1)
+        )
+        self.assertFalse(self.job.claim())
+        self.assertEqual(Job.objects.claim(gethostname()), [])
+
+    def test_run_that_died_is_released(self):
+        self.assertTrue(self.job.claim())
+        # kitsune_run_job died before storing a result.
+        SubprocessTask(self.job, FakeProcess(1)).poll()
+        self.assertFalse(Job.objects.get(pk=self.job.pk).is_running)
+
+    def test_later_claim_is_kept(self):
+        self.assertTrue(self.job.claim())
+        Job.objects.filter(pk=self.job.pk).update(claimed_by='other')
+        SubprocessTask(self.job, FakeProcess(0)).poll()
+        self.assertTrue(Job.objects.get(pk=self.job.pk).is_running)
+
+
+@unittest.skipUnless(os.path.isdir('/proc'), 'Needs /proc')
+class SubprocessTimeoutTest(TestCase):
+    def setUp(self):
+        self.job = Job(name='test', host=Host.objects.create(name='test'),
+                       command='kitsune_base_check', frequency='HOURLY', timeout=1)
+        self.job.save()
+
+    def test_process_group_is_killed(self):
+        process = subprocess.Popen(['sh', '-c', 'sleep 30 & sleep 30'], preexec_fn=os.setsid)
+        task = SubprocessTask(self.job, process)
+        task.deadline = monotonic() + 0.5
+        self.assertEqual(task.wait(), -signal.SIGKILL)
+        self.assertFalse(is_group_alive(process.pid))
+        log = Job.objects.get(pk=self.job.pk).last_result
+        self.assertEqual(log.status_code, STATUS_UNKNOWN)
+        self.assertTrue(log.stdout.startswith('Timed out after '))
+
+
+@unittest.skipUnless(os.path.isdir('/proc'), 'Needs /proc')
+@unittest.skipUnless(shares_database(), 'Workers need a database they can share')
+class WorkerPoolTest(TransactionTestCase):
+    def setUp(self):
+        executors._command_classes['kitsune_test_sleep'] = SleepCheck
+        executors._command_classes['kitsune_test_interrupted'] = InterruptedCheck
+        self.kill_grace, executors.KILL_GRACE = executors.KILL_GRACE, 0
+        self.host = Host.objects.create(name='test')
+        self.job = Job(name='test', host=self.host, command='kitsune_test_sleep',
+                       frequency='HOURLY', timeout=1)
+        self.job.save()
+
+    def tearDown(self):
+        executors.KILL_GRACE = self.kill_grace
+        del executors._command_classes['kitsune_test_sleep']
+        del executors._command_classes['kitsune_test_interrupted']
+
+    def test_worker_is_killed(self):
+        executor = WorkerPoolExecutor(size=1)
+        task = executor.submit(self.job)
+        pid = executor._busy[0].process.pid
+        self.assertEqual(task.wait(), -signal.SIGKILL)
+        executor.shutdown()
+        self.assertFalse(is_group_alive(pid))
+        log = Job.objects.get(pk=self.job.pk).last_result
+        self.assertEqual(log.status_code, STATUS_UNKNOWN)
+
+    def test_worker_is_recycled(self):
+        jobs = []
+        for i in range(3):
+            job = Job(name='test %d' % i, host=self.host,
+                      command='kitsune_test_check', frequency='HOURLY')
+            job.save()
+            jobs.append(job)
+        executor = WorkerPoolExecutor(size=1, max_jobs=2)
+        processes = []
+        for job in jobs:
+            task = executor.submit(job)
+            processes.append(executor._busy[0].process)
+            self.assertEqual(task.wait(), 0)
+        executor.shutdown()
+        self.assertTrue(processes[0] is processes[1])
+        self.assertFalse(processes[2] is processes[0])
+        self.assertFalse(processes[0].is_alive())
+        for job in jobs:
+            log = Job.objects.get(pk=job.pk).last_result
+            self.assertEqual(log.stdout, 'OK message')
+
+    def test_failed_run_is_released(self):
+        Job.objects.filter(pk=self.job.pk).update(command='kitsune_test_interrupted')
+        # Unclaimed, the job can only be released by the worker itself.
+        self.job = Job.objects.get(pk=self.job.pk)
+        executor = WorkerPoolExecutor(size=1)
+        task = executor.submit(self.job)
+        worker = executor._busy[0]
+        self.assertEqual(task.wait(), 1)
+        self.assertEqual(executor._idle, [worker])
+        executor.shutdown()
+        self.assertFalse(Job.objects.get(pk=self.job.pk).is_running)
+
+    def test_claim_of_crashed_worker_is_released(self):
+        Job.objects.filter(pk=self.job.pk).update(
+            next_run=datetime.now() - timedelta(minutes=1)
+        )
+        self.job = Job.objects.get(pk=self.job.pk)
+        self.assertTrue(self.job.claim())
+        executor = WorkerPoolExecutor(size=1)
+        task = executor.submit(self.job)
+        worker = executor._busy[0]
+        # Wait for the worker to take over the run of the job.
+        deadline = monotonic() + 5
+        while Job.objects.get(pk=self.job.pk).pid != worker.process.pid:
+            self.assertTrue(monotonic() < deadline)
+            time.sleep(0.05)
+        os.kill(worker.process.pid, signal.SIGKILL)
+        self.assertEqual(task.wait(), 1)
+        executor.shutdown()
+        job = Job.objects.get(pk=self.job.pk)
+        self.assertFalse(job.is_running)
+        self.assertEqual(job.claimed_by, '')
+
+
+@unittest.skipUnless(shares_database(), 'Threads need a database they can share')
+class ThreadPoolTest(TransactionTestCase):
+    def setUp(self):
+        executors._command_classes['kitsune_test_args'] = ArgsCheck
+
+    def tearDown(self):
+        del executors._command_classes['kitsune_test_args']
+
+    def test_concurrent_checks_keep_their_result(self):
+        host = Host.objects.create(name='test')
+        jobs = []
+        for args in ('0 first', '2 second'):
+            job = Job(name=args, host=host, command='kitsune_test_args',
+                      frequency='HOURLY', args=args)
+            job.save()
+            jobs.append(job)
+        executor = ThreadPoolExecutor(max_workers=2)
+        started = monotonic()
+        tasks = [executor.submit(j) for j in jobs]
+        self.assertEqual([task.wait() for task in tasks], [0, 0])
+        # Both checks ran at the same time.
+        self.assertTrue(monotonic() - started < 0.55)
+        executor.shutdown()
+        first, second = [Job.objects.get(pk=j.pk).last_result for j in jobs]
+        self.assertEqual((first.status_code, first.stdout), (STATUS_OK, 'first'))
+        self.assertEqual((second.status_code, second.stdout), (STATUS_CRITICAL, 'second'))
+
+
+class JobSchedulerTest(TestCase):
+    def setUp(self):
+        self.job = Job(name='test', host=Host.objects.create(name='test'),
+                       command='kitsune_base_check', frequency='HOURLY')
+        self.job.save()
+        self.scheduler = JobScheduler('test')
+
+    def test_reap_schedules_finished_jobs(self):
+        next_run = datetime(2026, 10, 18, 12, 0)
+        task = FakeTask(self.job)
+        self.scheduler._procs.append(task)
+        self.scheduler.reap()
+        self.assertEqual(self.scheduler._procs, [task])
+        Job.objects.filter(pk=self.job.pk).update(next_run=next_run)
+        task.returncode = 0
+        self.scheduler.reap()
+        self.assertEqual(self.scheduler._procs, [])
+        self.assertEqual(self.scheduler._next_runs, {self.job.pk: next_run})
+
+    def test_run_due_claims_for_its_host(self):
+        self.scheduler._executor = FakeExecutor()
+        Job.objects.filter(pk=self.job.pk).update(next_run=datetime(2026, 1, 1))
+        self.scheduler.schedule(self.job.pk, datetime(2026, 1, 1))
+        self.assertEqual(self.scheduler.run_due(), [self.job])
+        self.assertTrue(Job.objects.get(pk=self.job.pk).is_running)
+
+    def test_run_due_drops_jobs_of_other_hosts(self):
+        next_run = datetime.now() + timedelta(hours=1)
+        Job.objects.filter(pk=self.job.pk).update(
+            host=Host.objects.create(name='other'), next_run=next_run
+        )
+        self.scheduler.schedule(self.job.pk, datetime(2026, 1, 1))
+        self.assertEqual(self.scheduler.run_due(), [])
+        self.assertEqual(self.scheduler._next_runs, {})
+
+
+class ConcurrencySlotsTest(TestCase):
+    def setUp(self):
+        host = Host.objects.create(name='test')
+        self.jobs = []
+        for i in range(6):
+            job = Job(name='test%d' % i, host=host, command='kitsune_base_check',
+                      frequency='HOURLY')
+            job.save()
+            self.jobs.append(job)
+        Job.objects.update(is_running=True)
+
+    def test_take_slots(self):
+        pks = [[job.pk] for job in self.jobs]
+        self.assertEqual(Job.objects.take_slots('test', pks[:3], 2), 2)
+        self.assertEqual(Job.objects.count_slots('test'), 2)
+        self.assertEqual(Job.objects.take_slots('test', pks[2:], 2), 0)
+        self.assertEqual(Job.objects.count_slots('other'), 0)
+
+    def test_batch_takes_one_slot(self):
+        pks = [job.pk for job in self.jobs]
+        self.assertEqual(Job.objects.take_slots('test', [pks[:4], pks[4:5]], 2), 2)
+        self.assertEqual(Job.objects.count_slots('test'), 2)
+
+    def test_limit_is_shared_by_dispatchers(self):
+        first = LimitedExecutor(FakeExecutor(), 2, 'test')
+        second = LimitedExecutor(FakeExecutor(), 2, 'test')
+        for job in self.jobs[:3]:
+            first.submit(job)
+        for job in self.jobs[3:]:
+            second.submit(job)
+        self.assertEqual(len(first.executor.tasks), 2)
+        self.assertEqual(len(second.executor.tasks), 0)
+
+        first.executor.finish(first.executor.tasks[0])
+        second._full_at = None
+        second.pump()
+        self.assertEqual(len(second.executor.tasks), 1)
+        first._full_at = None
+        first.pump()
+        self.assertEqual(len(first.executor.tasks), 2)
+
+    def test_polling_queued_jobs_is_throttled(self):
+        executor = LimitedExecutor(FakeExecutor(), 2, 'test')
+        queued = [executor.submit(job) for job in self.jobs]
+        polls = [task.polls for task in executor.executor.tasks]
+        self.assertEqual([q.poll() for q in queued], [None] * 6)
+        # Each running job was polled by its own task, not by every queued one.
+        self.assertEqual(
+            [task.polls for task in executor.executor.tasks], [n + 1 for n in polls]
+        )
+
+
+class AdaptiveIntervalTest(unittest.TestCase):
+    def setUp(self):
+        self.job = Job(name='test', command='kitsune_base_check',
+                       frequency='MINUTELY', adaptive=True, adaptive_max_interval=300)
+        self.run_date = datetime(2026, 10, 18, 10, 0)
+
+    def run_job(self, status_code):
+        interval, ok_runs = self.job.get_adaptive_interval(status_code, self.run_date)
+        self.job.adaptive_interval = interval
+        self.job.adaptive_ok_runs = ok_runs
+        return interval
+
+    def test_backs_off_while_ok(self):
+        intervals = [self.run_job(STATUS_OK) for i in range(12)]
+        self.assertEqual(
+            intervals, [60, 60, 120, 120, 120, 240, 240, 240, 300, 300, 300, 300]
+        )
+
+    def test_resets_to_minimum(self):
+        for i in range(6):
+            self.run_job(STATUS_OK)
+        self.assertEqual(self.run_job(STATUS_WARNING), 60)
+        self.assertEqual(self.job.adaptive_ok_runs, 0)
+        # A failed run resets too, to the minimum interval of the job.
+        self.job.adaptive_min_interval = 30
+        self.assertEqual(self.run_job(None), 30)
+
+
+class MissedRunsTest(TestCase):
+    def setUp(self):
+        self.job = Job(
+            name='test', host=Host.objects.create(name='test'),
+            command='kitsune_base_check', frequency='SECONDLY',
+            params='interval:10', missed_runs=5
+        )
+        self.job.save()
+
+    def test_lag_is_not_missed(self):
+        # A job run every 10 seconds by the minutely kitsune_cron.
+        self.job.last_run = datetime(2026, 10, 18, 10, 0)
+        self.assertEqual(self.job.get_missed_runs_left(datetime(2026, 10, 18, 10, 1)), 0)
+
+    def test_downtime_is_missed(self):
+        self.job.last_run = datetime(2026, 10, 18, 10, 0)
+        self.assertEqual(self.job.get_missed_runs_left(datetime(2026, 10, 18, 11, 0)), 5)
+
+    def test_claim_spreads_missed(self):
+        now = datetime.now()
+        Job(name='test2', host=self.job.host, command='kitsune_base_check',
+            frequency='HOURLY').save()
+        other = Job(name='other', host=Host.objects.create(name='other'),
+                    command='kitsune_base_check', frequency='HOURLY')
+        other.save()
+        Job.objects.update(next_run=now - timedelta(hours=1))
+        self.assertEqual(len(Job.objects.claim('test')), 1)
+        self.assertTrue(Job.objects.filter(
+            host__name='test', next_run__gt=now + timedelta(seconds=100)
+        ).exists())
+        # The jobs of the host that is gone are left alone.
+        self.assertEqual(
+            Job.objects.get(pk=other.pk).next_run, now - timedelta(hours=1)
+        )
+        self.assertEqual(Job.objects.spread_missed('test'), 0)
+
+
+class PoolTest(TestCase):
+    def setUp(self):
+        self.pools = models.POOLS
+        models.POOLS = ['test']
+        Node.objects.heartbeat('a')
+        Node.objects.heartbeat('b')
+        self.pool = Pool.objects.get(name='test')
+        for i in range(20):
+            Job(name='test%d' % i, pool=self.pool, command='kitsune_base_check',
+                frequency='HOURLY').save()
+
+    def tearDown(self):
+        models.POOLS = self.pools
+
+    def get_pks(self, hostname):
+        return set(Job.objects.for_node(hostname).values_list('pk', flat=True))
+
+    def test_jobs_are_shared(self):
+        a, b = self.get_pks('a'), self.get_pks('b')
+        self.assertTrue(a and b)
+        self.assertEqual(a | b, set(Job.objects.values_list('pk', flat=True)))
+        self.assertFalse(a & b)
+        for job in Job.objects.all():
+            self.assertEqual(job.runs_on('a'), job.pk in a)
+
+    def test_jobs_move_when_node_leaves(self):
+        Node.objects.filter(name='b').update(last_heartbeat=datetime(2026, 1, 1))
+        Node.objects.heartbeat('a')
+        self.assertFalse(Node.objects.assign_jobs(self.pool))
+        self.assertEqual(len(self.get_pks('a')), 20)
+        self.assertEqual(self.get_pks('b'), set())
+
+
+class LeaseTest(TestCase):
+    def test_one_owner_per_process(self):
+        self.assertTrue(Lease.objects.acquire('test'))
+        self.assertTrue(Lease.objects.acquire('test'))
+        # Another dispatcher of the same host.
+        other = '%s:1:other' % gethostname()
+        self.assertFalse(Lease.objects.acquire('test', other))
+        self.assertTrue(Lease.objects.is_held_on('test'))
+        Lease.objects.release('test')
+        self.assertFalse(Lease.objects.is_held_on('test'))
+        self.assertTrue(Lease.objects.acquire('test', other))
+
+
+class CpuTopTest(TestCase):
+    def test_aggregates_logs_of_job(self):
+        host = Host.objects.create(name='test')
+        now = datetime.now()
+        for name, runs in (('busy', 3), ('idle', 1)):
+            job = Job(name=name, host=host, command='kitsune_base_check',
+                      frequency='HOURLY')
+            job.save()
+            for i in range(runs):
+                Log.objects.create(
+                    job=job, run_date=now - timedelta(minutes=i), stderr='0',
+                    user_time=1.0, system_time=0.5, duration=2.0, max_rss=1000 + i
+                )
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            call_command('kitsune_cpu_top')
+            lines = sys.stdout.getvalue().splitlines()
+        finally:
+            sys.stdout = stdout
+        # One row per job, with the totals of all its logs.
+        self.assertEqual(len(lines), 3)
+        rank, name, runs, per_day, user, system, wall, rss = lines[1].split()
+        self.assertEqual((rank, name, runs), ('1', 'busy', '3'))
+        self.assertEqual((user, system, wall, rss), ('3.00', '1.50', '2.000', '1002'))
+        self.assertEqual(lines[2].split()[:3], ['2', 'idle', '1'])
+
+
+class PlannerTest(TestCase):
+    def setUp(self):
+        self.host = Host.objects.create(name='test')
+        self.start = datetime(2026, 10, 18, 10, 0)
+        for i in range(3):
+            Job(name='test%d' % i, host=self.host, command='kitsune_base_check',
+                frequency='MINUTELY').save()
+        Job.objects.update(next_run=self.start)
+
+    def get_plan(self, stagger=False):
+        jobs = Job.objects.select_related('host', 'pool')
+        return plan(jobs, self.start, hours=1, stagger=stagger)['test']
+
+    def test_counts_aligned_runs(self):
+        host_plan = self.get_plan()
+        self.assertEqual(host_plan.get_peak_second(), (self.start, 3))
+        self.assertEqual(host_plan.get_peak_minute(), (self.start, 3))
+        # Every minute of the hour and the first one of the next.
+        self.assertEqual(sum(host_plan.per_second.values()), 3 * 61)
+        hour, counts = host_plan.get_heatmap()[0]
+        self.assertEqual(counts, [3] * 60)
+
+    def test_staggered_runs_are_spread(self):
+        host_plan = self.get_plan(stagger=True)
+        self.assertEqual(host_plan.get_peak_second()[1], 1)
+        self.assertEqual(host_plan.get_peak_minute()[1], 3)
+
+    def test_stagger_offsets(self):
+        offsets = []
+        for i in range(20):
+            job = Job(name='hourly%d' % i, host=self.host, command='kitsune_base_check',
+                      frequency='HOURLY', stagger=True)
+            job.save()
+            offset, period = job.get_stagger_offset()
+            self.assertEqual(period, 3600)
+            offsets.append(offset)
+        offsets.sort()
+        self.assertEqual(len(set(offsets)), 20)
+        self.assertTrue(0 <= offsets[0] and offsets[-1] < 300)
+        gaps = [b - a for a, b in zip(offsets, offsets[1:])]
+        self.assertTrue(max(gaps) < 60)
+
+
+def profiled_function():
+    return sum(range(1000))
+
+
+class ProfileTest(TestCase):
+    def setUp(self):
+        self.job = Job(name='test', host=Host.objects.create(name='test'),
+                       command='kitsune_test_check', frequency='HOURLY',
+                       profile_runs=2)
+        self.job.save()
+
+    def test_profile_runs_counter(self):
+        self.assertTrue(self.job.claim_profile_run())
+        self.assertTrue(self.job.claim_profile_run())
+        self.assertFalse(self.job.claim_profile_run())
+        self.assertEqual(Job.objects.get(pk=self.job.pk).profile_runs, 0)
+
+    def test_profiled_run_stores_stats(self):
+        self.job.handle_run()
+        self.job.handle_run()
+        self.job.handle_run()
+        logs = Log.objects.filter(job=self.job).order_by('run_date', 'pk')
+        self.assertEqual(
+            [log.get_profile() is not None for log in logs], [True, True, False]
+        )
+        total, functions = get_top_functions(logs[0].get_profile().get_data())
+        self.assertTrue(functions)
+
+    def test_stats_encoding(self):
+        self.assertEqual(stop_profile(None), None)
+        profiler = start_profile()
+        profiled_function()
+        data = stop_profile(profiler)
+        self.assertEqual(decode_stats(encode_stats(data)), data)
+        total, functions = get_top_functions(data)
+        self.assertTrue([f for f in functions if 'profiled_function' in f['function']])
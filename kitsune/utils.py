@@ -12,11 +12,24 @@ __author__ = "Raul Garreta (raul@tryolabs.com)"
 
 
 import os
+import sys
+import errno
+import inspect
+import pkgutil
+import threading
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where runs record no resource usage.
+    resource = None
 
 import django
 from django.conf import settings
+from django.core.management.base import BaseCommand
 from django.utils.importlib import import_module
 
+from kitsune.base import BaseKitsuneCheck
+
 
 def get_manage_py():
     module = import_module(settings.SETTINGS_MODULE)
@@ -31,3 +44,270 @@ def get_manage_py():
         # We should DEFINITELY do this in an elegant way ...
         settings_path = os.path.dirname(module.__file__)
         return os.path.join(settings_path, '..', 'manage.py')
+
+
+def _get_clock_gettime_monotonic():
+    """
+    Returns a monotonic clock reading ``clock_gettime(CLOCK_MONOTONIC)``
+    through ctypes, or None if it isn't available.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+    except ImportError:
+        return None
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    # Before glibc 2.17 clock_gettime lives in librt.
+    for name in ('rt', 'c'):
+        path = ctypes.util.find_library(name)
+        if path is None:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        break
+    else:
+        return None
+
+    CLOCK_MONOTONIC = 1
+
+    def monotonic():
+        t = timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return t.tv_sec + t.tv_nsec / 1e9
+    return monotonic
+
+
+try:
+    from time import monotonic
+except ImportError:
+    monotonic = _get_clock_gettime_monotonic()
+    if monotonic is None:
+        # No monotonic clock outside Linux on Python < 3.3: fall back to
+        # wall time, so timeouts and intervals are off when the clock is set.
+        from time import time as monotonic
+
+
+def total_seconds(delta):
+    """
+    Returns the number of seconds in a ``timedelta`` (``timedelta.total_seconds``
+    is not available in Python 2.6).
+    """
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+
+
+# State of the job run by the current thread: its deadline and output
+# limit, whether other threads run jobs too and the usage of its children.
+_run_state = threading.local()
+
+
+def set_run_timeout(timeout):
+    """
+    Sets the number of seconds the job run by the current thread may take,
+    None for no limit. Checks bound the plugins they start with
+    ``get_run_time_left``.
+    """
+    if timeout is None:
+        _run_state.deadline = None
+    else:
+        _run_state.deadline = monotonic() + timeout
+
+
+def get_run_time_left():
+    """
+    Returns the number of seconds left to the job run by the current thread,
+    or None if it has no timeout.
+    """
+    deadline = getattr(_run_state, 'deadline', None)
+    if deadline is None:
+        return None
+    return max(deadline - monotonic(), 0)
+
+
+def set_run_output_limit(limit):
+    """
+    Sets the maximum number of bytes of output kept from the job run by the
+    current thread, None for no limit. Checks bound the output they read
+    from the plugins they start with ``get_run_output_limit``.
+    """
+    _run_state.output_limit = limit
+
+
+def get_run_output_limit():
+    """
+    Returns the maximum number of bytes of output kept from the job run by
+    the current thread, or None if there is no limit.
+    """
+    return getattr(_run_state, 'output_limit', None)
+
+
+# Python 2 has no constant for the usage of the calling thread, which
+# Linux reports with RUSAGE_THREAD.
+if resource is None:
+    RUSAGE_THREAD = None
+elif sys.platform.startswith('linux'):
+    RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD', 1)
+else:
+    RUSAGE_THREAD = resource.RUSAGE_SELF
+
+
+def set_run_in_thread(in_thread):
+    """
+    Tells whether the current thread runs jobs while other threads of the
+    process run jobs too, e.g. in a ``kitsune.executors.ThreadPoolExecutor``.
+    """
+    _run_state.in_thread = in_thread
+
+
+def add_child_usage(usage):
+    """
+    Adds the ``wait_usage`` of a child waited for by the current thread to
+    the usage of the job it runs.
+    """
+    user, system, max_rss = getattr(_run_state, 'child_usage', (0.0, 0.0, 0))
+    _run_state.child_usage = (
+        user + usage['user_time'],
+        system + usage['system_time'],
+        max(max_rss, usage['max_rss'])
+    )
+
+
+def get_usage():
+    """
+    Returns a tuple of the user and system CPU seconds used by the current
+    thread (the whole process where threads aren't accounted) and by the
+    children it waited for, and the maximum resident set size in kilobytes,
+    or None if usage isn't available.
+
+    The usage of every child reaped by the process is only counted when
+    the process runs one job at a time. Otherwise the children waited for
+    by other threads would be counted too, so only the ones added with
+    ``add_child_usage``, e.g. the plugins of ``kitsune_nagios_check``, are.
+    """
+    if resource is None:
+        return None
+    own = resource.getrusage(RUSAGE_THREAD)
+    if getattr(_run_state, 'in_thread', False):
+        children = getattr(_run_state, 'child_usage', (0.0, 0.0, 0))
+    else:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        children = (usage.ru_utime, usage.ru_stime, usage.ru_maxrss)
+    return (
+        own.ru_utime + children[0],
+        own.ru_stime + children[1],
+        max(own.ru_maxrss, children[2])
+    )
+
+
+def get_usage_since(start):
+    """
+    Returns a dict of the ``user_time``, ``system_time`` and ``max_rss`` used
+    since ``get_usage`` returned ``start``, as stored in a ``Log``. The dict
+    is empty if usage isn't available.
+    """
+    if start is None:
+        return {}
+    user, system, max_rss = get_usage()
+    return {
+        'user_time': user - start[0],
+        'system_time': system - start[1],
+        'max_rss': max_rss,
+    }
+
+
+def wait_usage(process, nohang=False):
+    """
+    Waits for the ``subprocess.Popen`` ``process`` and returns the ``Log``
+    usage fields of it and of the children it waited for. With ``nohang``
+    returns None right away if the process is still running.
+    """
+    pid, status, usage = os.wait4(process.pid, nohang and os.WNOHANG or 0)
+    if pid == 0:
+        return None
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    return {
+        'user_time': usage.ru_utime,
+        'system_time': usage.ru_stime,
+        'max_rss': usage.ru_maxrss,
+    }
+
+
+def get_process_start_time(pid):
+    """
+    Returns the start time of the process ``pid`` in clock ticks after boot,
+    read from ``/proc/<pid>/stat``, or None if it is not available.
+    """
+    try:
+        stat = open('/proc/%d/stat' % pid).read()
+    except (IOError, OSError):
+        return None
+    # The process name may contain spaces, skip it along with the pid.
+    return int(stat[stat.rindex(')') + 2:].split()[19])
+
+
+def is_kitsune_process(pid, start_time=None):
+    """
+    Returns True if the process ``pid`` exists and is a kitsune process.
+
+    When ``start_time`` is given the process must have started at that time
+    (see ``get_process_start_time``), which guards against pid reuse.
+    Otherwise its command line must mention a kitsune command.
+    """
+    if os.path.isdir('/proc'):
+        if start_time is not None:
+            return get_process_start_time(pid) == start_time
+        try:
+            cmdline = open('/proc/%d/cmdline' % pid).read()
+        except (IOError, OSError):
+            return False
+        return cmdline.find('kitsune_') > -1
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def get_kitsune_checks():
+
+    # Find the installed apps
+    try:
+        from django.conf import settings
+        apps = settings.INSTALLED_APPS
+    except (AttributeError, EnvironmentError, ImportError):
+        apps = []
+
+    paths = []
+    choices = []
+
+    for app in apps:
+        paths.append((app, app + '.management.commands'))
+
+    for app, package in paths:
+        try:
+            __import__(package)
+            m = sys.modules[package]
+            path = os.path.dirname(m.__file__)
+            for _, name, _ in pkgutil.iter_modules([path]):
+                pair = (name, app)
+                __import__(package + '.' + name)
+                m2 = sys.modules[package + '.' + name]
+                for _, obj in inspect.getmembers(m2):
+                    if inspect.isclass(obj) and issubclass(obj, BaseKitsuneCheck) and issubclass(obj, BaseCommand):
+                        if pair not in choices:
+                            choices.append(pair)
+        except:
+            pass
+    return choices